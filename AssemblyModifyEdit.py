@@ -8,7 +8,13 @@ arbitrary structures (e.g., four circles and 6 sinusoids, all with different
 design variables).
 Currently, two load cases are conducted. A shear load and a rotation load
 are applied to a rigid surface which is tied to the top of the assembly.
-From these two analyses, the directional stiffnesses are extracted
+From these two analyses, the directional stiffnesses are extracted.
+With multiLoadCaseJob = 1 (assembly_config.py) both load cases are solved in a
+single job ('LOAD_CASES', linear perturbation step with one load case each); 
+with 0, one static job is run per load case ('X_DISP', then 'ROT').
+With warmModel = 1 the assembly is built once per CAE session (batch and server
+modes) and later evaluations only replace the parts of the cells that changed
+(swapInstances).
 
 Files needed:
     -All the possible substructure model files: For every substructure, the following 
@@ -17,13 +23,28 @@ Files needed:
     -Post_P.py - Post-processing script to extract stiffnesses
     -assembly.cae - .cae file with all of the possible substructures already imported.
         DO NOT CHANGE THIS FILE (A copy is in the /Cross subdirectory)
-    -partsInfo.p - pickle that contains the relevant arrays to describe 
-                   the mapping between design variables and substructures
+    -catalog/ - columnar substructure catalog (catalog.py) that contains the relevant
+                arrays to describe the mapping between design variables and substructures
+                (partsInfo.p, the older pickle of the same arrays, is read when it is missing)
     -input.txt - input file that contains the input vector of design variables
-                   
+                 (one row per individual in batch mode, with the individual numbers
+                 in inputIds.txt)
+    -assembly_config.py, nearest_match.py - model parameters and catalog matching,
+                 shared with kill_code.py
+    -grid_builder.py, grid_connectivity.py - instance names, edge sets and ties of the grid
+    -results_log.py - every evaluation is appended to the results log (results.bin,
+                 or the RESULTS_LOG path set by kill_code.py)
+    -timing.py - wall/CPU time of every stage of an evaluation, recorded with it
+
+Run modes (arguments after '--' on the abaqus command line):
+    -(none)  evaluate the single design vector in input.txt, outputs to output.p
+    -batch   evaluate every row of input.txt in one session, list of results to output.p
+    -cpus=N  number of CPUs given to each analysis job (default 1)
+    -import  rebuild assembly.cae, catalog/ and partsInfo.p from the substructure catalog
+    -server  stay open as an evaluation server (eval_server.py), port=N or unix=PATH
 
 Things to change: 
-    -Model parameters start at line 827. The following lines 
+    -Model parameters are in assembly_config.py. They 
     should contain the only variables that would need to be changed 
     for the current analysis framework. 
     
@@ -49,38 +70,24 @@ import os
 import sys
 import pickle 
 
-from Post_P import odbPostProcess
+import Post_P
+from Post_P import odbPostProcess, odbPostProcessLoadCases
+from nearest_match import nearestMatch, catalogMatcher
+from catalog import load_parts_info, catalog_from_csv, read_data_points
+from feasibility_screen import CERTAIN_PASS, load_screen
+from results_log import record_evaluation
+import timing
+from grid_connectivity import gridTopology
+import grid_builder
+import assembly_config
+import deferred_viz
 
 ###############################
         ### FUNCTION INITIALIZATION###
 ###############################
 
 
-def csvColRange(fpath, fCol, lCol, dtype):
-    '''
-    Makes arrays or arrays of arrays using genfromtxt
-    The function does not support using a range for usecols, thus this was used
-    
-    fpath: STR - filepath
-    fCol: INT - First column
-    lCol: INT - Last column
-    dtype: DTYPE - Data type
-    '''
-    cols = np.empty([lCol-fCol],dtype='object')
-    i = 0
-    # Data starts at row 7 (8 now, need to change after next substructure gen)
-    for n in range(fCol, lCol):
-        print(n)
-        cols[i] = genfromtxt(fpath, delimiter=',', dtype=dtype, skip_header=7, 
-                             usecols=(n))
-        # If only one column, avoid a nested 1x1x1 array
-        if lCol - fCol == 1:
-            cols = cols[i]
-        i += 1
-    return cols
-
-
-def importSubstructure(modelData,geometryName,allSubInfo,nSubs,nVars,nAtt,pathName):#,var1set,var2set,pathName):
+def importSubstructure(modelData,geometryName,allSubInfo,pathName):#,var1set,var2set,pathName):
     '''
     Imports all possible substructures that were generated in the other two scripts.
 
@@ -98,9 +105,6 @@ def importSubstructure(modelData,geometryName,allSubInfo,nSubs,nVars,nAtt,pathNa
     allSubInfo : LISTS
         List of Arrays with substructure info that have been appended from
         previous calls of this function.
-    nSubs : INT - # of substructure info rows in respective file
-    nVars : INT - # of design variable columns
-    nAtt : INT - # of attribute metric columns
     pathName : STR
         Path where the substructure files are located.
 
@@ -111,23 +115,18 @@ def importSubstructure(modelData,geometryName,allSubInfo,nSubs,nVars,nAtt,pathNa
     '''
     #Data Unpackaging
     
-    substructureRef = {0:'CrossAsymmetric', 1:'Cross'}
-    materialRef = {0:'Aluminum 2219',1:'Kovar Steel',2:'Titanium Alpha-Beta'}
-    stressN = 3 # for # of max mises stress, could make this an input
-    
     # File path of DataPoints.csv for generated geometry
     fpath = geometryName+'DataPoints.csv'
     
-    # Header line is 7 in the current CSV, skip footer = # of substructures
-    headers = genfromtxt(fpath, delimiter=',', dtype=str, skip_header=6, skip_footer=nSubs)
-    
-    # Data starts at row 8
-    subType = csvColRange(fpath, 0, 1, str)
-    subId = csvColRange(fpath, 1, 2, int)
-    materials = csvColRange(fpath, 2, 3, str)
-    atts = csvColRange(fpath, 3, 3+nAtt, float)
-    stress = csvColRange(fpath, 3+nAtt, 3+nAtt+stressN, float)
-    dvs = csvColRange(fpath, 3+nAtt+stressN, 3+nAtt+stressN+nVars, float)
+    # Header block and data table in one pass; the number of substructures and the
+    # design variable/attribute/stress column groups come from the file itself
+    data = read_data_points(fpath)
+    subType = np.array(data['substructure'])
+    subId = data['id']
+    materials = np.array(data['material'])
+    atts = data['atts']
+    stress = data['stress']
+    dvs = data['dvs']
     
     # Make array to append to allSubInfo
     
@@ -161,85 +160,7 @@ def importSubstructure(modelData,geometryName,allSubInfo,nSubs,nVars,nAtt,pathNa
     
     return allSubInfo
 
-def nearestMatch(desiredAttributes, partsInfo, desiredComp, partsInfoIndex): #how should mass be handled
-    '''
-    Find nearest substructures based off of sum of square differences of attributes specified to compare
-
-    Parameters
-    ----------
-    desiredAttributes : LIST
-        Being read in from text file outputted by optimizer
-    partsInfo : list of Numpy ARRAYS [[STR],[INT],[STR],[ARRAYS of FLOATS],[ARRAYS of FLOATS],[ARRAYS of FLOATS]]
-        Contains all substructure's names, ID, Materials, array of design variables, array of attribute metrics, array of max mises
-    desiredComp : Numpy ARRAY
-        Desired components to compare; array of columns to compare within design variables or attribute metrics
-    partsInfoIndex : INT
-        Index to use with parts info to access design variables or attribute metrics
-
-    Returns
-    -------
-    Array of substructure names 
-
-    '''
-
-    # Input design variable ranges for accurate mapping (Need to change CSV to be able to read in these values)
-    #thickness = 0.1, 0.8 
-    thickMin = 0.05
-    thickMax = 0.15
-    #fillets = 0.1, 2.0 
-    filletMin = 0.04
-    filletMax = 0.175
-    
-    
-    # Break up desiredAttributes into list of lists, each index having the attributes of a single substructure
-    dAttOrig = np.reshape(desiredAttributes,(int(len(desiredAttributes)/desiredComp.size),desiredComp.size))
-    # map thick13 DV 
-    dAttOrig[:,0] = (thickMax-thickMin)*dAttOrig[:,0] + thickMin 
-    # map thick24 DV 
-    dAttOrig[:,1] = (thickMax-thickMin)*dAttOrig[:,1] + thickMin 
-    #map fillet DV
-    dAttOrig[:,2] = (filletMax-filletMin)*dAttOrig[:,2]+filletMin
-    print(dAttOrig)
-    # Initiate array for assembly modification
-    assemblyMod = np.empty([dAttOrig.size/dAttOrig[0].size],dtype='object')
-    actualDVs = np.empty([dAttOrig.size/dAttOrig[0].size],dtype='object')
-    actualAMs = np.empty([dAttOrig.size/dAttOrig[0].size],dtype='object')
-    
-    # Transpose arrays of floats to where each index corresponds to a substructure's info
-    dvsPartsInfo = np.transpose(partsInfo[3])
-    amsPartsInfo = np.transpose(partsInfo[4])
-    
-    # print("dvsPartsInfo:")
-    # print(dvsPartsInfo)
-    # print(dvsPartsInfo[0].ravel())
-    # print("amsPartsInfo:")
-    # print(amsPartsInfo)
-    # print(','.join(['%.3f' % num for num in amsPartsInfo.ravel()]))
-    
-    # Makes specified subarray for components to be compared and transposes the array
-    pInfoOrig = np.transpose(partsInfo[partsInfoIndex][desiredComp[:, None], np.arange(len(partsInfo[partsInfoIndex][0]))])
-    # print(pInfoOrig)
-    # print(pInfoOrig.size)
-    # print(dAttOrig.size)
-    mass = 0
-    # Loops through all arrays in dAttOrig
-    for n in range(dAttOrig.size/dAttOrig[0].size):
-        # print(n)
-        # Makes array same size as pInfoOrig all filled with the values of a single array in dAttOrig (for one substructure)
-        dAttFull = np.tile(dAttOrig[n], (pInfoOrig.size/dAttOrig[n].size,1))#np.full((pInfoOrig.size,dAttOrig[n].size), dAttOrig[n]) #Works in newer numpy version
-        # Gets index of lowest sum of square differences
-        # print(pInfoOrig.size/dAttOrig[n].size)
-        # print(dAttFull)
-        SubIndex = np.sum(np.square(np.subtract(pInfoOrig,dAttFull)),axis=1).argmin(axis=0)
-        # Assign substructure to corresponding index
-        assemblyMod[n] = partsInfo[0][SubIndex]+'-'+str(partsInfo[1][SubIndex])+'_Z'+str(partsInfo[1][SubIndex])
-        actualDVs[n] = dvsPartsInfo[SubIndex]
-        actualAMs[n] = amsPartsInfo[SubIndex]
-        # Get mass from actuaAMs
-        mass += actualAMs[n][-1]
-    return assemblyMod, actualDVs, actualAMs, mass
-
-def instanceAssembly(modelData,newSubstructures):     
+def instanceAssembly(modelData,newSubstructures,cellNames=None):     
     '''
     Instance RANDOM substructures to fill the predetermined m-by-n rectangle
     of substructure shapes.
@@ -254,6 +175,10 @@ def instanceAssembly(modelData,newSubstructures):
             'dim':dim}
     partList : LIST
         List of all possible substructures to instance.
+    cellNames : LIST
+        Instance name of every cell (see cellInstanceNames). By default the 
+        instances are named after their part, e.g. 'Cross-3_Z3_2' 
+        (grid_builder.instanceNames).
     
     Example assembly order:
      ___________
@@ -264,7 +189,8 @@ def instanceAssembly(modelData,newSubstructures):
 
     Returns
     -------
-    None.
+    instanceNames : LIST
+        Instance name of every cell, in assembly order.
 
     '''
     #Data unpackaging 
@@ -273,91 +199,31 @@ def instanceAssembly(modelData,newSubstructures):
     # Construct Assembly 
     a = mdb.models[modelName].rootAssembly
     a.DatumCsysByDefault(CARTESIAN) 
-    dim = modelData['dim']
-    xLength = dim[3] - dim[0]
-    yLength = dim[4] - dim[1]
-    
-    n = 0
+    parts = mdb.models[modelName].parts
+    nCells = assemblyDim[0]*assemblyDim[1]
+    offsets = grid_builder.cellOffsets(assemblyDim,modelData['dim'])
     
     print(newSubstructures)
     
-    for x in range(0,assemblyDim[0]):
-        for y in range(0,assemblyDim[1]):
-            xMove = xLength*(x)
-            yMove = yLength*(y)
-            # index = randint(0,len(partList)-1)
-            partName = str(newSubstructures[n])
-            
-            print(str(partName))
-            
-            p = mdb.models[modelName].parts[partName]
-            a = mdb.models[modelName].rootAssembly
-            repeatChecker = filter(lambda x:partName in x,instanceNames)
-            repeatCounter = len(repeatChecker)+1
-            instanceName = partName+'_'+str(repeatCounter)
-            instanceNames.append(instanceName)
-            a.Instance(name=instanceName,part = p,dependent = ON)
-            a.translate(instanceList=(instanceName, ), vector=(xMove,yMove,0.0))
-            n += 1
+    if cellNames is None:
+        instanceNames = grid_builder.instanceNames(newSubstructures[:nCells])
+    else:
+        instanceNames = list(cellNames)
+    for n in range(0,nCells):
+        partName = str(newSubstructures[n])
+        print(str(partName))
+        a.Instance(name=instanceNames[n],part = parts[partName],dependent = ON)
+        a.translate(instanceList=(instanceNames[n], ), vector=tuple(offsets[n]))
             
     return instanceNames
     
-def AssemblyConnectivity(assemblyDim):
-    '''
-    Create connectivity matrix between the substructures for tie constraints.
-
-    Parameters
-    ----------
-    assemblyDim : LIST
-        #[Number of substructures to instance in x-direction,
-        # Number of substructure to instance in y-direction]
-
-    Returns
-    -------
-    NOD : DICT
-        Dictionary that describes which substructures are connected to which.
-
-    '''
-    instanceLength = assemblyDim[0]*assemblyDim[1]
-    NOD = {}
-    for i in range(1,instanceLength+1):
-        connectivity=[]
-        remainder = i % assemblyDim[1]
-        #Left Connectivity 
-        if i-assemblyDim[1]>0:
-            connectivity.append(i-assemblyDim[1])
-        else:
-            connectivity.append(0)
-        
-        #Bottom Connectivity 
-        if i-1>0 and (remainder -1)!= 0:
-            connectivity.append(i-1)
-        else:
-            connectivity.append(0)
-        #Right Connectivity 
-        if i+assemblyDim[1]<=instanceLength:
-            connectivity.append(i+assemblyDim[1])
-        else:
-            connectivity.append(0)
-        #Top Connectivity 
-        if i+1<=instanceLength and remainder != 0:
-            connectivity.append(i+1)
-        else:
-            connectivity.append(0)
-
-
-
-        
-        NOD[i]=connectivity
-
-    return NOD
-
-def BoundarySets(modelData,instanceNames):
+def BoundarySets(modelData,instanceNames,cells=None):
     '''
     Create sets for each substructure boundary for ease of boundary condition
-    application later. Boolean operations are applied to the corner nodes, as
-    currently I don't know a way for a substructure retained DOF to be assigned 
-    two conflicting boundary conditions.
+    application later. The corner nodes are left out of the top and bottom sets
+    (grid_builder.edgeBoxes), as currently I don't know a way for a 
+    substructure retained DOF to be assigned two conflicting boundary 
+    conditions.
     
 
     Parameters
@@ -373,6 +239,9 @@ def BoundarySets(modelData,instanceNames):
                 dim = [minX,minY,minZ,maxX,maxY,maxZ]
     instanceNames : LIST
         List of all instances in the assembly.
+    cells : LIST
+        Assembly order indices of the instances whose sets are (re)created, 
+        all instances when None. Existing sets of the same name are replaced.
 
     Returns
     -------
@@ -382,77 +251,22 @@ def BoundarySets(modelData,instanceNames):
     #Data unpackaging 
     modelName = modelData['modelName']
     assemblyDim = modelData['assemblyDim']
-    dim = modelData['dim']
-    xLength = dim[3] - dim[0]
-    yLength = dim[4] - dim[1]
+    boxes = grid_builder.edgeBoxes(assemblyDim,modelData['dim'])
+    if cells is None:
+        cells = range(0,len(instanceNames))
     
-    j=0
-    for x in range(0,assemblyDim[0]):
-        for y in range(0,(assemblyDim[1])):
-            instance = instanceNames[j]
-            center = [xLength*x,yLength*y,0.0]
-            # dim =  [minX,minY,minZ,maxX,maxY,maxZ]
-            xMin = center[0]+dim[0]
-            yMin = center[1]+dim[1]
-            xMax = center[0]+dim[3]
-            yMax = center[1]+dim[4]
-            # tBB = topBoundingBox, for brevity
-            tBB = [xMin,yMax,0.0,xMax,yMax,0.0]
-            bBB = [xMin,yMin,0.0,xMax,yMin,0.0]
-            rBB = [xMin,yMin,0.0,xMin,yMax,0.0]
-            lBB = [xMax,yMin,0.0,xMax,yMax,0.0]
-            tLC=[xMin,yMax,0.0]
-            tRC=[xMax,yMax,0.0]
-            bLC=[xMin,yMin,0.0]
-            bRC=[xMax,yMin,0.0]
-            
-            print(tBB)
-            a = mdb.models[modelName].rootAssembly
-            n1=a.instances[instance].nodes
-            nodesTop=[]
-            nodesBottom=[]
-            nodesRight=[]
-            nodesLeft=[]
-            # Top
-            nodesTop.append(n1.getByBoundingBox(tBB[0],tBB[1],
-                tBB[2],tBB[3],tBB[4],tBB[5]))
-            # Bottom
-            nodesBottom.append(n1.getByBoundingBox(bBB[0],bBB[1],
-                bBB[2],bBB[3],bBB[4],bBB[5]))
-            # Right 
-            nodesRight.append(n1.getByBoundingBox(rBB[0],rBB[1],
-                rBB[2],rBB[3],rBB[4],rBB[5]))
-            # Left
-            nodesLeft.append(n1.getByBoundingBox(lBB[0],lBB[1],
-                lBB[2],lBB[3],lBB[4],lBB[5]))
-
-            
-            topName = instance + '_Top'
-            bottomName = instance + '_Bottom' 
-            rightName = instance + '_Right'
-            leftName = instance + '_Left'
-            region1 = a.Set(nodes=nodesTop,name = topName)
-            region2 = a.Set(nodes=nodesBottom,name=bottomName)
-            region3 = a.Set(nodes=nodesRight,name=leftName)
-            region4 = a.Set(nodes=nodesLeft,name=rightName)
-            j+=1
-            
-            #Apply Boolean to deselect corner nodes 
-            a.SetByBoolean(name=topName, operation=DIFFERENCE, sets=(
-                a.sets[topName], a.sets[leftName], ))
-            a.SetByBoolean(name=topName, operation=DIFFERENCE, sets=(
-                a.sets[topName], a.sets[rightName], ))
-            
-            a.SetByBoolean(name=bottomName, operation=DIFFERENCE, sets=(
-                a.sets[bottomName], a.sets[leftName], ))
-            a.SetByBoolean(name=bottomName, operation=DIFFERENCE, sets=(
-                a.sets[bottomName], a.sets[rightName], ))
-            
-            
+    a = mdb.models[modelName].rootAssembly
+    for j in cells:
+        instance = instanceNames[j]
+        n1=a.instances[instance].nodes
+        for side in grid_builder.sides:
+            box = [float(value) for value in boxes[side][j]]
+            a.Set(nodes=(n1.getByBoundingBox(*box), ),
+                name=grid_builder.setName(instance,side))
             
     return 
 
-def TieInstances(modelData,instanceNames,NOD):
+def TieInstances(modelData,instanceNames,topology,cells=None):
     '''
     Ties instances in the assembly together
 
@@ -466,8 +280,13 @@ def TieInstances(modelData,instanceNames,NOD):
             'dim':dim}
     instanceNames : LIST
         List of all instances in the assembly.
-    NOD : DICT
-        Dictionary that describes which substructures are connected to which.
+    topology : GridTopology
+        Describes which substructures are connected to which (gridTopology).
+    cells : LIST
+        Assembly order indices of instances whose ties are (re)created, all 
+        ties when None. Tie names only depend on the topology 
+        (grid_builder.tiePairs), so a recreated tie replaces the previous one 
+        of the same pair.
 
 
     Returns
@@ -478,45 +297,24 @@ def TieInstances(modelData,instanceNames,NOD):
     #Data unpackaging 
     modelName = modelData['modelName']
     assemblyDim = modelData['assemblyDim']
-    setOrder = ['Left','Bottom','Right','Top']
-    reverseSetOrder = ['Right','Top','Left','Bottom']
-
-    j=1
-    instanceNumber = 0
-    for x in range(0,assemblyDim[0]):
-        for y in range(0,assemblyDim[1]):
-            if (x+y+2)%2==0:
-                i=0
-
-                for side in NOD[instanceNumber+1]:
-                     i+=1
-                     tieInstance1 = instanceNames[instanceNumber]
-                     
-
-                     if side == 0:
-                         #skipping
-                         dummyCount=0
-                     else:
-                         tieSide1=setOrder[i-1]
-                         tieInstance2 = instanceNames[side-1]
-
-                         tieSide2=reverseSetOrder[i-1]
-
-                         a = mdb.models[modelName].rootAssembly
-                         tie1=tieInstance1+'_'+tieSide1 
-                         tie2=tieInstance2+'_'+tieSide2     
-                 
-                         region1=a.sets[tie1]
-                         region2=a.sets[tie2]
-                         tieName='Constraint-'+str(j)
-                         j+=1
-                         mdb.models[modelName].Tie(name=tieName, master=region1, slave=region2, 
-                            positionToleranceMethod=COMPUTED, adjust=ON, tieRotations=ON, 
-                            thickness=OFF)
-            instanceNumber+=1
+    pairs = grid_builder.tiePairs(assemblyDim,topology)
+    if cells is not None:
+        pairs = grid_builder.touchingPairs(pairs,cells)
+
+    a = mdb.models[modelName].rootAssembly
+    constraints = mdb.models[modelName].constraints
+    existing = set(constraints.keys())
+    for tieName,cell1,tieSide1,cell2,tieSide2 in pairs:
+        region1=a.sets[grid_builder.setName(instanceNames[cell1],tieSide1)]
+        region2=a.sets[grid_builder.setName(instanceNames[cell2],tieSide2)]
+        if tieName in existing:
+            del constraints[tieName]
+        mdb.models[modelName].Tie(name=tieName, master=region1, slave=region2, 
+            positionToleranceMethod=COMPUTED, adjust=ON, tieRotations=ON, 
+            thickness=OFF)
     return 
 
-def CreateStep(modelData):
+def CreateStep(modelData,multiLoadCase=False):
     '''
     Create static general analysis step for the entire assembly.
     
@@ -528,6 +326,9 @@ def CreateStep(modelData):
             'stepName':'Step-1',
             'assemblyDim':assemblyDim,
             'dim':dim}
+    multiLoadCase : BOOL
+        Create a static linear perturbation step instead, which can hold 
+        several load cases solved in one analysis (see loadCaseBCs).
     Returns
     -------
     None.
@@ -537,8 +338,12 @@ def CreateStep(modelData):
     modelName = modelData['modelName']
     stepName = modelData['stepName']
     #Create Step 
-    mdb.models[modelName].StaticStep(name=stepName, previous='Initial', 
-        maxNumInc=1000, initialInc=1.0, minInc=1e-15)
+    if multiLoadCase:
+        mdb.models[modelName].StaticLinearPerturbationStep(name=stepName, 
+            previous='Initial')
+    else:
+        mdb.models[modelName].StaticStep(name=stepName, previous='Initial', 
+            maxNumInc=1000, initialInc=1.0, minInc=1e-15)
     return
     
 def CreateBottomBC(assemblyDim,instanceNames):
@@ -558,25 +363,7 @@ def CreateBottomBC(assemblyDim,instanceNames):
     None.
 
     '''
-    i=0
-    setNameArray={}
-    instanceNumber=-1   
-    for x in range(0,assemblyDim[0]):
-        for y in range(0,assemblyDim[1]):
-             instanceNumber+=1
-            
-             if y==0:
-                
-                instance = instanceNames[instanceNumber]
-
-                a = mdb.models['Model-1'].rootAssembly
-                setNameArray[i] = instance+'_'+'Bottom'
-                i+=1
-    #Combine the set
-    a.SetByBoolean(name='BottomBCNodes', sets=(a.sets[setNameArray[0]],  ))
-    for i in range(1,len(setNameArray)):
-         a.SetByBoolean(name='BottomBCNodes', sets=(a.sets[setNameArray[i]],a.sets['BottomBCNodes']  ))
-    
+    bottomBCSet(assemblyDim,instanceNames)
 
     #Create EncastreBC 
     a = mdb.models['Model-1'].rootAssembly
@@ -585,6 +372,25 @@ def CreateBottomBC(assemblyDim,instanceNames):
         region=region, localCsys=None)
     return
 
+def bottomBCSet(assemblyDim,instanceNames):
+    '''
+    (Re)create the 'BottomBCNodes' set: union of the bottom edge sets of the 
+    bottom row of instances.
+    '''
+    boundaryNodeSet(assemblyDim,instanceNames,'Bottom','BottomBCNodes')
+    return
+
+def boundaryNodeSet(assemblyDim,instanceNames,side,name):
+    '''
+    (Re)create the set name as a single union of the side edge sets of the 
+    bottom or top row of instances (side = 'Bottom' or 'Top').
+    '''
+    a = mdb.models['Model-1'].rootAssembly
+    cells = grid_builder.boundaryCells(assemblyDim,side)
+    a.SetByBoolean(name=name, operation=UNION, sets=tuple([
+        a.sets[grid_builder.setName(instanceNames[n],side)] for n in cells]))
+    return
+
 def tieRigidBodyandParts(assemblyDim,instanceNames):
     '''
     Create vertical displacement boundary condition on the 
@@ -603,26 +409,7 @@ def tieRigidBodyandParts(assemblyDim,instanceNames):
     None.
 
     '''
-    i=0
-    setNameArray={}
-    instanceNumber=-1   
-    for x in range(0,assemblyDim[0]):
-        for y in range(0,assemblyDim[1]):
-             instanceNumber+=1
-            
-             if y==assemblyDim[1]-1:
-                
-                instance = instanceNames[instanceNumber]
-                a = mdb.models['Model-1'].rootAssembly
-                setNameArray[i] = instance+'_'+'Top'
-                i+=1
-    #Combine the set
-    a = mdb.models['Model-1'].rootAssembly
-    a.SetByBoolean(name='TopBCNodes', sets=(a.sets[setNameArray[0]],  ))
-    for i in range(1,len(setNameArray)):
-         a.SetByBoolean(name='TopBCNodes', sets=(a.sets[setNameArray[i]],a.sets['TopBCNodes']  ))
-    
-    
+    topBCSet(assemblyDim,instanceNames)
     
     # Apply the BC
     a = mdb.models['Model-1'].rootAssembly
@@ -633,7 +420,15 @@ def tieRigidBodyandParts(assemblyDim,instanceNames):
         thickness=OFF)
     return
 
-def CreateJob(jobName):
+def topBCSet(assemblyDim,instanceNames):
+    '''
+    (Re)create the 'TopBCNodes' set: union of the top edge sets of the top 
+    row of instances.
+    '''
+    boundaryNodeSet(assemblyDim,instanceNames,'Top','TopBCNodes')
+    return
+
+def CreateJob(jobName,numCpus=1):
     '''
     Create job but DO NOT RUN 
     
@@ -641,6 +436,8 @@ def CreateJob(jobName):
     -----------
     jobName : STR
         Identifier for particular job.
+    numCpus : INT
+        Number of CPUs the analysis may use.
     Returns
     -------
     job : Job Object
@@ -648,13 +445,16 @@ def CreateJob(jobName):
 
     '''
 
+    # Jobs of a previous evaluation are kept in a warm model (see swapInstances)
+    if jobName in mdb.jobs.keys():
+        del mdb.jobs[jobName]
     # Create Job 
     job = mdb.Job(name=jobName, model='Model-1', description='', type=ANALYSIS, 
         atTime=None, waitMinutes=0, waitHours=0, queue=None, memory=90, 
         memoryUnits=PERCENTAGE, getMemoryFromAnalysis=True, 
         explicitPrecision=SINGLE, nodalOutputPrecision=SINGLE, echoPrint=OFF, 
         modelPrint=OFF, contactPrint=OFF, historyPrint=OFF, userSubroutine='', 
-        scratch='', resultsFormat=ODB, multiprocessingMode=DEFAULT, numCpus=1, 
+        scratch='', resultsFormat=ODB, multiprocessingMode=DEFAULT, numCpus=numCpus, 
         numGPUs=0)
         
     # delete lock file, which for some reason tends to hang around, if it exists
@@ -747,19 +547,11 @@ def xmlGenerate(modelData,jobName,path):
     #Data Unpackaging 
     assemblyDim = modelData['assemblyDim']
     masterOdb = str(path)+'/' +str(jobName)+'.odb'
-    xmlTemplate = """<?xml version="1.0" ?>"""
-    xmlTemplate += """\n<OdbInput>\n\t<MasterOdb Name="""+'"'+str(masterOdb)+'"/>'
-    
     totalNumber = assemblyDim[0]*assemblyDim[1]
-    
-    for i in range(1,totalNumber+1):
-        odbName = str(path)+'/'+str(jobName)+'_'+str(i)+'.odb'
-        xmlTemplate += """\n\t<Odb Name="""+'"'+str(odbName)+'"/>'
-        
-    xmlTemplate += """\n</OdbInput> """
-
-    return xmlTemplate
+    odbNames = [str(path)+'/'+str(jobName)+'_'+str(i)+'.odb' for i in range(1,totalNumber+1)]
+    return deferred_viz.combine_xml(masterOdb,odbNames)
 
+@timing.timed('combine')
 def odbCombineFunc(CombinedODB,xmlFileName):
     '''
     Runs the abaqus-internal odb combine function. May need to find the 
@@ -785,8 +577,7 @@ def odbCombineFunc(CombinedODB,xmlFileName):
     from os import path
     if path.exists(CombinedODBFile) == True:
         os.remove(CombinedODBFile)
-    sys.path.insert(19, 
-    r'c:/SIMULIA/CAE/2018/win_b64/code/python2.7/lib/abaqus_plugins/odbCombine')
+    sys.path.insert(19, assembly_config.odbCombinePath)
     import odbCombineKernel
     # Combine ODBs 
     odbCombineKernel.combineOdbs(jobName=CombinedODB, 
@@ -967,30 +758,77 @@ def xDisplacement(modelData):
     r1 = a1.referencePoints
     refPoints1=(r1[r1.keys()[0]], )
     region = a1.Set(referencePoints=refPoints1, name='TOP_RP')
+    bcValues = loadCaseValues('X_DISP')
     mdb.models[modelName].DisplacementBC(name='MOVE_RP', createStepName=stepName, 
-        region=region, u1=1E-6, u2=0.0, u3=UNSET, ur1=UNSET, ur2=UNSET, ur3=0.0, 
+        region=region, u1=bcValues['u1'], u2=bcValues['u2'], u3=UNSET, ur1=UNSET, ur2=UNSET, ur3=bcValues['ur3'], 
         amplitude=UNSET, fixed=OFF, distributionType=UNIFORM, fieldName='', 
         localCsys=None)
         
     return 
     
-def readlastline(file):
-    with open(file, "rb") as f:
-        f.seek(-2, 2)  # Jump to the second last byte.
-        while f.read(1) != b"\n":  # Until EOL is found ...
-            f.seek(-2, 1)  # ... jump back, over the read byte plus one more.
-        last = np.char.split(f.read().decode().strip(), sep=',') # Convert binary string to UTF-8 stripped string array
-        last = np.array(last.tolist()).astype(float)    # Getting rid of 
-    f.close()
-    return last  # Read all data from this point on.
+def loadCaseBCs(modelData,loadCaseNames):
+    '''Creates one displacement BC on the top reference point and one load case 
+    per entry of loadCaseNames in the linear perturbation step, so that every
+    load case is solved in a single job. The encastre bottom BC (Initial step)
+    is active in all load cases.
+    
+    Parameters
+    --------------
+    modelData : DICTIONARY
+        modelData = {
+            'modelName':'Model-1',
+            'stepName':'Step-1',
+            'assemblyDim':assemblyDim,
+            'dim':dim}
+    loadCaseNames : LIST
+        Keys of assembly_config.loadCases, e.g. ['X_DISP','ROT']. The load 
+        cases get the same names (used by odbPostProcessLoadCases).
+    '''
+    #Data unpackaging 
+    modelName = modelData['modelName']
+    stepName = modelData['stepName']
+    a1 = mdb.models[modelName].rootAssembly
+    r1 = a1.referencePoints
+    refPoints1=(r1[r1.keys()[0]], )
+    region = a1.Set(referencePoints=refPoints1, name='TOP_RP')
+    step = mdb.models[modelName].steps[stepName]
+    for loadCaseName in loadCaseNames:
+        bcName = 'MOVE_RP_'+loadCaseName
+        bcValues = loadCaseValues(loadCaseName)
+        mdb.models[modelName].DisplacementBC(name=bcName, createStepName=stepName, 
+            region=region, u1=bcValues['u1'], u2=bcValues['u2'], u3=UNSET, ur1=UNSET, ur2=UNSET, ur3=bcValues['ur3'], 
+            amplitude=UNSET, fixed=OFF, distributionType=UNIFORM, fieldName='', 
+            localCsys=None)
+        step.LoadCase(name=loadCaseName, boundaryConditions=((bcName, 1.0), ), 
+            includeActiveBaseStateBC=ON)
+    return
+
+def loadCaseValues(loadCaseName):
+    '''
+    'MOVE_RP' boundary condition values for a load case defined in 
+    assembly_config.loadCases. Degrees of freedom not listed there are UNSET.
+
+    Parameters
+    ----------
+    loadCaseName : STR
+        Key of assembly_config.loadCases (e.g. 'X_DISP' or 'ROT').
 
+    Returns
+    -------
+    bcValues : DICT
+        {'u1':..., 'u2':..., 'ur3':...} ready to be passed to the BC.
+    '''
+    bcValues = {'u1':UNSET, 'u2':UNSET, 'ur3':UNSET}
+    bcValues.update(assembly_config.loadCases[loadCaseName])
+    return bcValues
+    
 
 #################################
 ### ANALYSIS INITIALIZATION 
 #################################
 
-# Initialize Wall clock time 
-startTime = time.clock()
+# Launch of this session to here (CAE start-up), added to the first individual
+caeStartup = timing.launch_delay()
 
 # Line to save findAts instead of masks
 # To grab indices (F[i]), replace COORDINATE with INDEX
@@ -1000,9 +838,10 @@ session.journalOptions.setValues(replayGeometry=COORDINATE,recoverGeometry=COORD
 ### MODEL PARAMETERS (All things to change are here)
 ######################################################
 
-visualizationFlag = 1 #Flag for combining odbs or not. 
+visualizationFlag = assembly_config.visualizationFlag #Flag for combining odbs or not. 
     # 0 = don't combine for computational efficiency (~15% faster)
     # 1 = combine to visualize entire assembly results 
+    # 2 = deferred, see deferred_viz.py
 dim = [-10.0, -10.0, 0.0, 10.0, 10.0, 5.0] #[minX,minY,minZ,maxX,maxY,maxZ]
 assemblyDim = [5,3] #[Number of substructures to instance in x-direction,
                     # Number of substructure to instance in y-direction]
@@ -1033,40 +872,47 @@ partsInfo = [[],[],[],[],[]]
 
 
 
-def runAssembly():
-    import numpy as np
-    xDispJobName = 'X_DISP' #Job name for x-displacement load conditions 
-    rotateJobName= 'ROT' #Job name for rotation load conditions 
-    
-    visualizationFlag = 0 #Flag for combining odbs or not. 
-    # 0 = don't combine for computational efficiency (~15% faster)
-    # 1 = combine to visualize entire assembly results 
-    dim = [-0.005, -0.005, 0.0, 0.005, 0.005, 0.0025] #[minX,minY,minZ,maxX,maxY,maxZ]
-    assemblyDim = [5,3] #[Number of substructures to instance in x-direction,
+def modelParameters():
+    '''
+    Model data dictionary used by every model-building function. The values
+    are shared with kill_code.py through assembly_config.py.
 
-        # Line to save findAts instead of masks
-    # To grab indices (F[i]), replace COORDINATE with INDEX
-    session.journalOptions.setValues(replayGeometry=COORDINATE,recoverGeometry=COORDINATE)
+    Returns
+    -------
+    modelData : DICT 
+        modelData = {
+            'modelName':'Model-1',
+            'stepName':'Step-1',
+            'assemblyDim':assemblyDim,
+            'dim':dim}
+    '''
+    modelData = {
+        'modelName':assembly_config.modelName,
+        'stepName':assembly_config.stepName,
+        'assemblyDim':assembly_config.assemblyDim, #[Number of substructures to instance in x-direction,
+                                                   # Number of substructure to instance in y-direction]
+        'dim':assembly_config.dim} #[minX,minY,minZ,maxX,maxY,maxZ]
+    return modelData
+
+def importCatalog():
+    '''
+    Imports every substructure of the catalog into a new model, pickles the
+    catalog information to partsInfo.p, writes the columnar catalog/ directory
+    and saves the model as assembly.cae.
+    Only needed when the catalog changes (run with the 'import' argument);
+    optimization runs open assembly.cae instead.
 
+    Returns
+    -------
+    None.
+    '''
     substructureNames = np.array(['CrossAsymmetric'])
-
-    instanceNames = []
     partsInfo = [[],[],[],[],[],[]]
-
-    modelData = {
-        'modelName':'Model-1',
-        'stepName':'Step-1',
-        'assemblyDim':assemblyDim,
-        'dim':dim}
+    modelData = modelParameters()
 
     #Import Cross Substructure 
     path = os.getcwd()+'/'
     
-    ###################################################
-    ### The following lines of code are needed when not 
-    ### using the open/modify method
-    ###################################################
-    
     #Check if Cross-3_Z3.prt exists
     # file = 'Cross-3_Z3.prt'
     # if os.path.isfile(file) == True:
@@ -1077,50 +923,77 @@ def runAssembly():
         # assemblyFolder = 'C:/temp/Cross Optimization/Cross Assembly/Open and Modify/'
         # shutil.move(repositoryFolder+file, 
             # assemblyFolder+file)
-    #  Need to change nSubs to get value from updated CSV file headers
     Mdb()
     partsInfo = importSubstructure(modelData=modelData,geometryName=substructureNames[0],
-         allSubInfo=partsInfo,nSubs=64,nVars=3,nAtt=4,pathName=path)
+         allSubInfo=partsInfo,pathName=path)
 
     for arr in range(len(partsInfo)): #Changing lists of lists to Array of lists
          partsInfo[arr] = np.array(partsInfo[arr])
         
-    ## Could save at this point to avoid importing substructures each run
+    ## Save at this point to avoid importing substructures each run
     pickle.dump( partsInfo, open( "partsInfo.p", "wb" ) )
+    # Columnar catalog (with the generator header information) straight from the CSV
+    catalog_from_csv([path+substructureNames[0]+'DataPoints.csv'], path+'catalog')
     
     # Save cae at this point
-    BREAK
-    mdb.save()
-    BREAK
-    # Stop execution of code to change partsInfo.p
-    # sys.exit()
+    mdb.saveAs(pathName=path+'assembly.cae')
+    return
 
-    Mdb()
-    openMdb('assembly.cae')
-    
-    # Read in all relevant substructure information (previously the output of the 'importSubstructure'
-    # function)
-    partsInfo = pickle.load( open( 'partsInfo.p', "rb" ))
-    #Read in design variables from matlab via inputs.txt
-    desiredAttributes = np.loadtxt('input.txt', dtype=float)
+# Grid skeleton kept between evaluations of one CAE session (assembly_config.warmModel)
+#   'instanceNames': stable instance name of every cell, 'topology': GridTopology,
+#   'parts': part currently behind every instance
+warmState = {}
 
-    #Add function to take in design variables[3]/attribute metrics[4] from optimizer, return array with new substructures for assembly
-    newSubstructures, actDVs, actAMs, mass = nearestMatch(desiredAttributes, partsInfo, desiredComp=np.array([0,1,2]), partsInfoIndex=3)
+def cellInstanceNames(assemblyDim):
+    '''
+    Instance names that do not depend on the part behind the instance 
+    ('Cell-1', 'Cell-2', ... in assembly order), so that sets and ties keep 
+    their names when the part is replaced.
+    '''
+    return ['Cell-'+str(n+1) for n in range(assemblyDim[0]*assemblyDim[1])]
+
+def buildAssembly(modelData,newSubstructures,loadCaseNames,multiLoadCase,cellNames=None):
+    '''
+    Builds the whole assembly in the current model: instances, edge sets, ties,
+    step, rigid top surface, boundary conditions and field output request.
+
+    Parameters
+    ----------
+    modelData : DICT 
+        See modelParameters.
+    newSubstructures : LIST
+        Part name of every cell, in assembly order.
+    loadCaseNames : LIST
+        [x-displacement, rotation] load case names (see loadCaseBCs).
+    multiLoadCase : BOOL
+        Both load cases in one linear perturbation step (multiLoadCaseJob).
+    cellNames : LIST
+        Instance names (see instanceAssembly).
+
+    Returns
+    -------
+    instanceNames : LIST
+        Instance name of every cell.
+    topology : GridTopology
+        Assembly connectivity (see gridTopology).
+    '''
+    assemblyDim = modelData['assemblyDim']
 
     # Instance substructures in the assembly
-    instanceNames = instanceAssembly(modelData,newSubstructures=newSubstructures)
+    instanceNames = instanceAssembly(modelData,newSubstructures=newSubstructures,
+        cellNames=cellNames)
 
-    # Create a connectivity matrix based on the assembly dimensions
-    NOD = AssemblyConnectivity(assemblyDim=assemblyDim)
+    # Connectivity of the assembly grid (cached per assemblyDim)
+    topology = gridTopology(assemblyDim)
 
     # Create geometry sets for each substructure edge 
     BoundarySets(modelData,instanceNames=instanceNames)
 
     # Tie all instances together
-    TieInstances(modelData,instanceNames=instanceNames,NOD=NOD)
+    TieInstances(modelData,instanceNames=instanceNames,topology=topology)
 
-    # Create static, general step 
-    CreateStep(modelData)
+    # Create static, general step (linear perturbation step for the load cases)
+    CreateStep(modelData,multiLoadCase=multiLoadCase)
 
     #Create analytical surface for boundary conditions 
     createAnalyticalSurface(modelData)
@@ -1137,11 +1010,207 @@ def runAssembly():
     #Tie analytical surface to top edges of top substructures 
     tieRigidBodyandParts(assemblyDim,instanceNames)
 
-    #Create x-displacement BC on the surface 
-    xDisplacement(modelData)
+    if multiLoadCase:
+        #Create the x-displacement and rotation load cases on the surface
+        loadCaseBCs(modelData,loadCaseNames)
+    else:
+        #Create x-displacement BC on the surface 
+        xDisplacement(modelData)
 
     #Request substructure field output for post-processing and visualization
     FieldOutputRequest(instanceNames=instanceNames)
+
+    return instanceNames, topology
+
+def swapInstances(modelData,warmState,newSubstructures):
+    '''
+    Updates a model built by buildAssembly (with cellInstanceNames) for new 
+    substructures. Only the instances whose part changed are replaced, in place
+    (the instance keeps its name and position), and only their edge sets, the 
+    ties to their neighbours and the bottom/top boundary node sets they belong 
+    to are recreated. Step, rigid body, boundary conditions and field output 
+    request refer to sets by name and are kept.
+
+    Parameters
+    ----------
+    modelData : DICT 
+        See modelParameters.
+    warmState : DICT
+        See warmState, updated with the new parts once the edge sets, ties and
+        boundary sets are rebuilt. Cleared if the update fails, so that the next
+        evaluation rebuilds the model from assembly.cae.
+    newSubstructures : LIST
+        Part name of every cell, in assembly order.
+
+    Returns
+    -------
+    changed : LIST
+        Assembly order indices of the replaced instances.
+    '''
+    modelName = modelData['modelName']
+    assemblyDim = modelData['assemblyDim']
+    instanceNames = warmState['instanceNames']
+    parts = warmState['parts']
+    a = mdb.models[modelName].rootAssembly
+
+    newParts = [str(newSubstructures[n]) for n in range(0,len(instanceNames))]
+    changed = [n for n in range(0,len(instanceNames)) if newParts[n] != parts[n]]
+    if not changed:
+        return changed
+
+    try:
+        for n in changed:
+            a.instances[instanceNames[n]].replace(
+                instanceOf=mdb.models[modelName].parts[newParts[n]])
+        BoundarySets(modelData,instanceNames=instanceNames,cells=changed)
+        TieInstances(modelData,instanceNames=instanceNames,topology=warmState['topology'],
+            cells=changed)
+
+        touched = set(changed)
+        if touched.intersection(grid_builder.boundaryCells(assemblyDim,'Bottom')):
+            bottomBCSet(assemblyDim,instanceNames)
+            mdb.models[modelName].boundaryConditions['BottomBC'].setValues(
+                region=a.sets['BottomBCNodes'])
+        if touched.intersection(grid_builder.boundaryCells(assemblyDim,'Top')):
+            topBCSet(assemblyDim,instanceNames)
+            mdb.models[modelName].constraints['Tie'].setValues(
+                slave=a.sets['TopBCNodes'])
+    except Exception:
+        # The model is half updated: rebuild it from scratch next time
+        warmState.clear()
+        raise
+    warmState['parts'] = newParts
+    return changed
+
+def runAssembly(desiredAttributes, partsInfo, indNum=None, numCpus=1, generation=None):
+    '''
+    Builds and analyzes the assembly for one design vector.
+
+    Parameters
+    ----------
+    desiredAttributes : Numpy ARRAY
+        Design vector from the optimizer (normalized design variables of every cell).
+    partsInfo : LIST
+        Catalog information (catalog.load_parts_info).
+    indNum : INT
+        Individual number recorded with the run in the results log (and in 
+        PlottingInfo.txt ahead of the design variables with textRecords = 1). 
+        None when the optimizer writes it itself (one individual per run).
+    numCpus : INT
+        Number of CPUs given to each analysis job.
+    generation : INT
+        Generation recorded with the run in the results log (the RESULTS_GENERATION
+        environment variable of the session when None).
+
+    Returns
+    -------
+    result : DICT
+        'outputs' : [k_xy,-k_theta,-mass] sent back to the optimizer (penalized on yielding)
+        plus the raw 'k_xy', 'maxMises1', 'k_theta', 'maxMises2' and 'mass', and
+        'governingCell', the assembly order index of the cell with maxMises2.
+        Stress recovery stops at the first cell above the yield stress, so 
+        maxMises2 of a yielding assembly is only known to exceed it.
+    '''
+    global caeStartup
+    xDispJobName = 'X_DISP' #Job name for x-displacement load conditions 
+    rotateJobName= 'ROT' #Job name for rotation load conditions 
+    loadCasesJobName = 'LOAD_CASES' #Job name for both load cases (multiLoadCaseJob)
+    multiLoadCase = assembly_config.multiLoadCaseJob == 1
+    
+    visualizationFlag = assembly_config.visualizationFlag #Flag for combining odbs or not. 
+    # 0 = don't combine for computational efficiency (~15% faster)
+    # 1 = combine to visualize entire assembly results 
+    # 2 = deferred: only for the individuals on the front, in the background (deferred_viz.py)
+
+    # Line to save findAts instead of masks
+    # To grab indices (F[i]), replace COORDINATE with INDEX
+    session.journalOptions.setValues(replayGeometry=COORDINATE,recoverGeometry=COORDINATE)
+
+    modelData = modelParameters()
+    assemblyDim = modelData['assemblyDim']
+
+    # Wall/CPU time of every stage (timing.py), recorded with the run
+    timer = timing.StageTimer(indNum)
+    with timer:
+        if caeStartup is not None:
+            # First individual of the session: time to start CAE and this script
+            timer.add('cae_start', caeStartup[1], caeStartup[2], caeStartup[0])
+            caeStartup = None
+
+        #Add function to take in design variables[3]/attribute metrics[4] from optimizer, return array with new substructures for assembly
+        with timing.stage('match'):
+            newSubstructures, actDVs, actAMs, mass = nearestMatch(desiredAttributes, partsInfo, desiredComp=np.array([0,1,2]), partsInfoIndex=3)
+            partIndices = catalogMatcher(partsInfo).indices(desiredAttributes)[0]
+
+        if assembly_config.warmModel == 1 and warmState:
+            # Model kept from the previous evaluation: only swap the changed cells
+            with timing.stage('build'):
+                changed = swapInstances(modelData,warmState,newSubstructures)
+            print(str(len(changed))+' of '+str(len(warmState['parts']))+' instances replaced')
+        else:
+            with timing.stage('open_mdb'):
+                Mdb()
+                openMdb('assembly.cae')
+            cellNames = None
+            if assembly_config.warmModel == 1:
+                cellNames = cellInstanceNames(assemblyDim)
+            with timing.stage('build'):
+                instanceNames, topology = buildAssembly(modelData,newSubstructures,
+                    [xDispJobName,rotateJobName],multiLoadCase,cellNames)
+            if assembly_config.warmModel == 1:
+                warmState.update({'instanceNames':instanceNames, 'topology':topology,
+                    'parts':[str(newSubstructures[n]) for n in range(len(instanceNames))]})
+
+        ###################################
+        ## Job Creation and Post Processing
+        ###################################
+        # Assemblies the feasibility screen classifies as certain-pass cannot yield:
+        # skip the stress recovery
+        screen = load_screen()
+        recoverStress = True
+        if screen is not None:
+            recoverStress = screen.classify_parts(partIndices,partsInfo) != CERTAIN_PASS
+            if not recoverStress:
+                print('Certain-pass assembly (feasibility screen), stresses not recovered')
+        if multiLoadCase:
+            k_xy,maxMises1,k_theta,maxMises2 = runLoadCasesJob(modelData,
+                loadCasesJobName,visualizationFlag,numCpus,recoverStress)
+        else:
+            k_xy,maxMises1,k_theta,maxMises2 = runLoadCaseJobs(modelData,
+                xDispJobName,rotateJobName,visualizationFlag,numCpus,recoverStress)
+
+        if maxMises2 > assembly_config.yieldStress: #Yield stress of titanium = 1000 MPA
+            output = list(assembly_config.penaltyOutputs)
+        else:
+            output = [k_xy,-k_theta,-mass]
+
+        if visualizationFlag == 2:
+            # Keep the odbs of individuals on the front only, combined in the background
+            jobNames = [loadCasesJobName] if multiLoadCase else [xDispJobName,rotateJobName]
+            with timing.stage('combine'):
+                deferred_viz.keep_odbs(indNum,output,jobNames,assemblyDim[0]*assemblyDim[1])
+
+    print(timer.summary())
+
+    result = {'outputs':output, 'k_xy':k_xy, 'maxMises1':maxMises1,
+              'k_theta':k_theta, 'maxMises2':maxMises2, 'mass':mass,
+              'governingCell':Post_P.lastGoverningCell if recoverStress else None}
+    #Record the run in the results log for post-processing. NOT USED IN OPTIMIZATION
+    record_evaluation(desiredAttributes, result, partIndices, actDVs, actAMs, indNum,
+        wall=timer.wall, cpu=timer.cpu, generation=generation)
+    return result
+
+def runLoadCaseJobs(modelData,xDispJobName,rotateJobName,visualizationFlag,numCpus=1,
+                    recoverStress=True):
+    '''
+    Runs one static job per load case: x-displacement, then the 'MOVE_RP' BC 
+    is changed to the rotation and the model is analyzed again.
+
+    Returns
+    -------
+    k_xy, maxMises1, k_theta, maxMises2
+    '''
+    assemblyDim = modelData['assemblyDim']
     if visualizationFlag == 1:
         ###############################################################
         # Create XML files for substructure visualization (odb combine)
@@ -1169,16 +1238,17 @@ def runAssembly():
         outfile.write(xmlXDisp)
         outfile.close()
 
-    ###################################
-    ## Job Creation and Post Processing
-    ###################################
-    
     #Stiffness k_xy
     
-    [xDispJobName,xDispJob] = CreateJob(jobName = xDispJobName)
+    #Reset the boundary condition (left on the rotation by a previous evaluation of a warm model)
+    mdb.models[modelData['modelName']].boundaryConditions['MOVE_RP'].setValues(
+        **loadCaseValues('X_DISP'))
+    [xDispJobName,xDispJob] = CreateJob(jobName = xDispJobName,numCpus=numCpus)
      
-    xDispJob.submit()
-    xDispJob.waitForCompletion()
+    with timing.stage('submit'):
+        xDispJob.submit()
+    with timing.stage('wait'):
+        xDispJob.waitForCompletion()
     if visualizationFlag == 1:
         odbCombineFunc(CombinedODB=xDispJobCombined,xmlFileName=xdispFileName)
 
@@ -1188,42 +1258,144 @@ def runAssembly():
     #Stiffness k_theta 
     
     #Change boundary condition to rotation 
-    mdb.models[modelData['modelName']].boundaryConditions['MOVE_RP'].setValues(u1=UNSET,
-        u2=UNSET, ur3=0.052)
-    [rotateJobName,rotateJob] = CreateJob(jobName = rotateJobName)
-
-    rotateJob.submit()
-    rotateJob.waitForCompletion()
+    mdb.models[modelData['modelName']].boundaryConditions['MOVE_RP'].setValues(
+        **loadCaseValues('ROT'))
+    [rotateJobName,rotateJob] = CreateJob(jobName = rotateJobName,numCpus=numCpus)
+
+    with timing.stage('submit'):
+        rotateJob.submit()
+    with timing.stage('wait'):
+        rotateJob.waitForCompletion()
     if visualizationFlag == 1:
         odbCombineFunc(CombinedODB=rotateJobCombined,xmlFileName=rotateFileName)
 
     k_theta,maxMises2 = odbPostProcess(jobName=rotateJobName, 
-        loadFlag=3,assemblyDim = assemblyDim)
-
-    print time.clock()-startTime, 'seconds process time'
-    #Write outputs to master text file for post-processing. NOT USED IN OPTIMIZATION
-    fData=open('AssemblyOutput.txt', "a")
-    fData.write(str(k_xy)+','+str(maxMises1)+','+str(k_theta)+','+str(maxMises2)+','+str(-mass)+'\n') #mass is sent in as negative to minimize in optimizer
-    fData.close()
-    if maxMises2 > 1000E6: #Yield stress of titanium = 1000 MPA
-        output = [1.0E10,-1.0E10,-1.0E10]
-    else:
-        output = [k_xy,-k_theta,-mass]
+        loadFlag=3,assemblyDim = assemblyDim,limit=assembly_config.yieldStress,
+        recoverStress=recoverStress)
+
+    return k_xy,maxMises1,k_theta,maxMises2
+
+def runLoadCasesJob(modelData,jobName,visualizationFlag,numCpus=1,recoverStress=True):
+    '''
+    Runs both load cases in a single job (multiLoadCaseJob mode, see 
+    loadCaseBCs), so that preprocessing, stiffness assembly and factorization 
+    are done once per individual.
+
+    Returns
+    -------
+    k_xy, maxMises1, k_theta, maxMises2
+    '''
+    assemblyDim = modelData['assemblyDim']
+    if visualizationFlag == 1:
+        # Create XML file for substructure visualization (odb combine)
+        ODBpath=os.getcwd()
+        jobCombined = 'Combined_'+jobName
+        xmlFileName = ODBpath+'/'+jobCombined+'.xml'
+        outfile = open(xmlFileName,'w')
+        outfile.write(xmlGenerate(modelData,jobName=jobName,path=ODBpath))
+        outfile.close()
+
+    [jobName,job] = CreateJob(jobName = jobName,numCpus=numCpus)
+    with timing.stage('submit'):
+        job.submit()
+    with timing.stage('wait'):
+        job.waitForCompletion()
+    if visualizationFlag == 1:
+        odbCombineFunc(CombinedODB=jobCombined,xmlFileName=xmlFileName)
+
+    return odbPostProcessLoadCases(jobName=jobName,assemblyDim=assemblyDim,
+        limit=assembly_config.yieldStress,recoverStress=recoverStress)
+
+def cpusArgument():
+    '''
+    CPUs per analysis job, given as 'cpus=N' after '--' on the abaqus command
+    line (set by scheduler.py). Defaults to 1.
+    '''
+    numCpus = 1
+    for arg in sys.argv:
+        if arg.startswith('cpus='):
+            numCpus = int(arg[len('cpus='):])
+    return numCpus
+
+def runSingle():
+    '''
+    Evaluates the single design vector in input.txt and pickles the optimizer
+    outputs to output.p (one individual per Abaqus session).
+    '''
+    # Read in all relevant substructure information (previously the output of the 'importSubstructure'
+    # function)
+    partsInfo = load_parts_info()
+    #Read in design variables from matlab via inputs.txt
+    desiredAttributes = np.loadtxt('input.txt', dtype=float)
+    result = runAssembly(desiredAttributes, partsInfo, numCpus=cpusArgument())
     #Write output data to a pickle 
-    pickle.dump( output, open( "output.p", "wb" ) )
-    
-    #Write desired and actual DVs to master text file. NOT USED IN OPTIMIZATION
-    fOptimizerInfo=open('PlottingInfo.txt','a')
-    fOptimizerInfo.write(','.join(['%.3f' % num for num in desiredAttributes])+';'+','.join(['%.3f' % num for num in np.array(actDVs.tolist()).astype(float).flatten()])+';'+','.join(['%.3f' % num for num in np.array(actAMs.tolist()).astype(float).flatten()]))
-    fOptimizerInfo.close()
-    
+    pickle.dump( result['outputs'], open( "output.p", "wb" ) )
+    return
 
+def runBatch():
+    '''
+    Evaluates every design vector in input.txt (one per row) in this Abaqus 
+    session, so that CAE startup and catalog loading are paid once per batch.
+    Individual numbers for the results log are read from inputIds.txt.
+    
+    output.p holds one result dictionary (see runAssembly) per row, or None for
+    rows that failed. It is rewritten after every row so that kill_code.py can 
+    recover the finished rows if the batch is killed.
+    '''
+    numCpus = cpusArgument()
+    partsInfo = load_parts_info()
+    designs = np.loadtxt('input.txt', dtype=float, ndmin=2)
+    if os.path.isfile('inputIds.txt'):
+        indNums = np.loadtxt('inputIds.txt', dtype=int, ndmin=1)
+    else:
+        indNums = [None]*len(designs)
+    results = []
+    for row in range(len(designs)):
+        try:
+            results.append(runAssembly(designs[row], partsInfo, indNum=indNums[row],
+                numCpus=numCpus))
+        except Exception as err:
+            print('Individual '+str(indNums[row])+' failed: '+str(err))
+            results.append(None)
+        pickle.dump( results, open( "output.p", "wb" ) )
     return
 
 
-# Should change importing procedure and assembly procedure to 2 functions in future iterations
-runAssembly()
+def runServer():
+    '''
+    Keeps this CAE session alive as an evaluation server (eval_server.py): design
+    vectors arrive over a socket ('port=N' or 'unix=PATH' arguments) and the
+    objectives are sent back, with the catalog loaded once for the whole run.
+    '''
+    from eval_server import EvaluationServer, server_address
+    from surrogate import load_surrogate
+    from eval_cache import EvaluationCache
+    numCpus = cpusArgument()
+    partsInfo = load_parts_info()
+    def evaluateBatch(designs, indNums, generation=None):
+        results = []
+        for row in range(len(designs)):
+            try:
+                results.append(runAssembly(designs[row], partsInfo, indNum=indNums[row],
+                    numCpus=numCpus, generation=generation))
+            except Exception as err:
+                print('Individual '+str(indNums[row])+' failed: '+str(err))
+                results.append(None)
+        return results
+    port, unix = server_address()
+    EvaluationServer(partsInfo, evaluateBatch, EvaluationCache('evalCache.db'),
+        screen=load_screen(), surrogate=load_surrogate()).serve(port, unix)
+    return
 
-# if __name__ == "__main__":
-    # runAssembly("Example_OptimizerOutput.txt")
-    
+
+# Run with 'import' to rebuild assembly.cae/catalog from the catalog, with 'batch' 
+# to evaluate every row of input.txt, otherwise a single design vector is evaluated
+# (abq2018 cae noGUI=AssemblyModifyEdit.py -- batch)
+if 'import' in sys.argv:
+    importCatalog()
+elif 'batch' in sys.argv:
+    runBatch()
+elif 'server' in sys.argv:
+    runServer()
+else:
+    runSingle()
@@ -1,8 +1,10 @@
 global indNum
+global generation
 
 
 %status1 = system('abaqus cae script=Assembly.py');
 indNum = 0;
+generation = 0;
 writeFile = 'PlottingInfo.txt';
 % if isfile(writeFile)%s.bytes == 0
 optOutput = fopen(writeFile,'w');
@@ -24,6 +26,14 @@ formatSpec = "\r\n%i;";
 
 numOfSubstructures = 64; %Manually input for number of iterations
 numOfVars = 3;% same
+batchEvaluation = true; % evaluate each generation with one kill_code.py call
+                        % (UseVectorized) instead of one call per individual
+evaluationServer = false; % send each generation to a running eval_server.py
+                          % (python eval_server.py, or abq2018 cae noGUI=AssemblyModifyEdit.py -- server)
+                          % instead of going through input.mat/output.mat
+serverPort = 50007;
+% (python nsga2.py runs the same NSGA-II loop on the Python side, handing every
+% generation to the evaluation pipeline in-process; it restarts from population.mat)
 
 plotfn = @(options,state,flag)gaplotpareto(options,state,flag,[1 2 3]);
 plotfn2 = @(options,state,flag)gaplotpareto(options,state,flag,[1 2]);
@@ -32,7 +42,7 @@ plotfn4 = @(options,state,flag)gaplotpareto(options,state,flag,[2 3]);
 % options2 = gaoptimset('MaxGenerations',2,'PopulationSize',2,'PlotFcns',plotfn);
 options = optimoptions(@gamultiobj,'MaxGenerations',50,'PopulationSize',250,...
                     'PlotFcn',{plotfn,plotfn2,plotfn3,plotfn4,@gaplotscorediversity},...
-                    'OutputFcn',@myoutput);%,'OutputFcn',@indNumPrint);
+                    'OutputFcn',@myoutput,'UseVectorized',batchEvaluation);%,'OutputFcn',@indNumPrint);
                 
 % Restart options below
 %load('population.mat','restart_population');
@@ -43,7 +53,14 @@ options = optimoptions(@gamultiobj,'MaxGenerations',50,'PopulationSize',250,...
 
 n = numOfSubstructures*numOfVars;
 
-[x,fval,exitflag,output,population]=gamultiobj(@evaluation_function,n,[],[],[],[],zeros(n,1),ones(n,1),options);
+if evaluationServer
+    fitnessfcn = @(x) server_evaluation_function(x,serverPort);
+elseif batchEvaluation
+    fitnessfcn = @batch_evaluation_function;
+else
+    fitnessfcn = @evaluation_function;
+end
+[x,fval,exitflag,output,population]=gamultiobj(fitnessfcn,n,[],[],[],[],zeros(n,1),ones(n,1),options);
 
 
 
@@ -66,7 +83,7 @@ function obj = evaluation_function(x)
     
     % write .mat file for python input 
     save('input.mat','x')
-    %run assembly code which should write perf. metrics to "AssemblyOutput.txt"
+    %run assembly code which should write perf. metrics to the results log ("results.bin")
     status2 = system('python kill_code.py')
 
     % read in performance metrics from python-generated .mat file
@@ -77,6 +94,46 @@ function obj = evaluation_function(x)
 end
 
 
+function obj = batch_evaluation_function(x)
+    % x is the whole population (one individual per row)
+    global indNum
+    global generation
+
+    % individual numbers and generation, recorded in the results log (results.bin)
+    ids = (indNum+1:indNum+size(x,1))';
+    indNum = indNum + size(x,1);
+
+    % write .mat file for python input 
+    save('input.mat','x','ids','generation')
+    generation = generation + 1;
+    %run all unique assemblies of the population; --jobs sets the number of
+    %concurrent Abaqus sessions and --cpus the CPUs per analysis job (scheduler.py)
+    status2 = system('python kill_code.py --batch --jobs 1 --cpus 1')
+
+    % read in performance metrics (one row per individual)
+    load('output.mat');
+    obj = -outputs;
+    
+end
+
+
+function obj = server_evaluation_function(x,port)
+    % x is the whole population (one individual per row), sent to the
+    % evaluation server as raw doubles: uint32 rows, uint32 cols, then x row by row.
+    % The reply is uint32 rows, uint32 3 and the outputs row by row.
+    % The server numbers the individuals itself.
+    persistent client
+    if isempty(client)
+        client = tcpclient('127.0.0.1',port,'Timeout',86400);
+    end
+    write(client,uint32(size(x)));
+    write(client,reshape(double(x)',1,[]));
+    header = double(read(client,2,'uint32'));
+    outputs = reshape(read(client,header(1)*header(2),'double'),header(2),header(1))';
+    obj = -outputs;
+end
+
+
 function [state,options,optchanged] = myoutput(options,state,flag) 
          restart_population = state.Population ; %get current population
          save('population.mat','restart_population')
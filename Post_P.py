@@ -3,7 +3,24 @@ Assembly FEA - post-processing script
 
 Extracts the displacement at the upper midpoint
 
+odbPostProcess reads one load case per job (one static step). 
+odbPostProcessLoadCases reads both load cases from the single job of the 
+multi-load-case mode (linear perturbation step with the load cases of 
+assembly_config.loadCases, one frame per load case).
+
+Stress recovery (stressRecovery) visits the substructure odbs jobName_i.odb, 
+takes the max von Mises stress over all bulk data blocks of each one, and 
+stops as soon as a cell exceeds the yield limit (the only use of the value is 
+the yield check in runAssembly). The cell that governed the previous 
+evaluation is visited first. The odb API is not thread-safe, so with 
+assembly_config.stressWorkers > 1 the odbs are split over that many 
+'abaqus python Post_P.py mises ...' processes instead of threads, and the 
+remaining workers are killed when one of them finds a yielding cell (only 
+worth the start-up time of the workers for large grids).
+
 Files needed: jobname+'.odb' - The job file you want to run. 
+              assembly_config.py - yield limit and stress recovery workers
+              timing.py - post-processing time of the individual ('post' stage)
               
 Hardcoded Lines:
     Line 27: the step is hardcoded to 'Step-1' - that could be modified 
@@ -15,33 +32,54 @@ Hardcoded Lines:
     
 '''
 
-from abaqus import *
-from abaqusConstants import *
-import visualization
+try:
+    from abaqus import *
+    from abaqusConstants import *
+    import visualization
+    from visualization import openOdb
+except ImportError: # stress recovery worker, run by 'abaqus python' (no CAE kernel)
+    from odbAccess import openOdb
 import math 
+import os
+import sys
+import time
+import signal
+import subprocess
 import numpy as np 
 
+import assembly_config
+import timing
 
-def odbPostProcess(jobName,loadFlag,assemblyDim):
-    print('in post processing script')
-    ### Obtain Rotation Array 
-    odbName = jobName+'.odb'
-    odb = visualization.openOdb(odbName)
-    step=odb.steps['Step-1']
+# Assembly order index of the cell that governed the last stress recovery,
+# visited first the next time
+lastGoverningCell = None
+
+
+def loadCaseFrame(step,loadCaseName=None):
+    '''
+    Frame holding the results of a load case. Without a load case name (or for 
+    a step without load cases) the last frame is returned.
+    '''
+    if loadCaseName is not None:
+        for frame in step.frames:
+            if frame.loadCase is not None and frame.loadCase.name == loadCaseName:
+                return frame
+    return step.frames[-1] # we only care about the last frame (snapshot) of data
 
+def referencePointSet(odb):
     ## Call for RP-2 Node Set 
     try:
         nodeSet = odb.rootAssembly.nodeSets['REFERENCE_POINT_PART-1-1        1']
     except:
         nodeSet = odb.rootAssembly.nodeSets['REFERENCE_POINT_PART-1-1        2']
     print('found RP-2 node set')
-    elsetName = 'ALL_PART'
-    elset = elemset = None 
-    region = 'over the entire model'
-    assembly = odb.rootAssembly 
+    return nodeSet
 
-    i=0
-    frame = step.frames[-1] # we only care about the last frame (snapshot) of data
+def performanceMetric(frame,nodeSet,loadFlag):
+    '''
+    Stiffness at the reference point: reaction over prescribed displacement
+    (loadFlag 1: x, 2: y) or moment over rotation (loadFlag 3: z-rotation).
+    '''
     forceField = frame.fieldOutputs['RF'] # RF = reaction force 
     forceField_nodeSet = forceField.getSubset(region=nodeSet)
     dispField = frame.fieldOutputs['U'] # U = displacement 
@@ -57,6 +95,151 @@ def odbPostProcess(jobName,loadFlag,assemblyDim):
         rotationField_nodeSet = rotationField.getSubset(region=nodeSet)
         performanceMetric = momentField_nodeSet.values[0].data[2]/rotationField_nodeSet.values[0].data[2]
         print('calculated performance metric')
+    return performanceMetric
+
+def substructureMises(odbName,loadCaseName=None):
+    '''
+    Largest von Mises stress of one substructure odb, over all of its bulk 
+    data blocks (one per element type/section).
+    '''
+    odb = openOdb(odbName,readOnly=True)
+    try:
+        step=odb.steps['Step-1']
+        frame = loadCaseFrame(step,loadCaseName)
+        stress = frame.fieldOutputs['S']
+        blocks = [np.asarray(block.mises).ravel() for block in stress.bulkDataBlocks]
+        blocks = [block for block in blocks if block.size > 0]
+        maxMises = float(np.concatenate(blocks).max()) if blocks else -0.1
+    finally:
+        odb.close()
+    return maxMises
+
+def stressRecovery(jobName,nCells,loadCaseName=None,limit=None,order=None,workers=None):
+    '''
+    Largest von Mises stress over the substructure odbs of a job 
+    (jobName_1.odb ... jobName_nCells.odb).
+
+    Parameters
+    ----------
+    jobName : STR
+        Identifier for particular job.
+    nCells : INT
+        Number of substructure instances (odbs).
+    loadCaseName : STR
+        Load case to read (multi-load-case job), the last frame when None.
+    limit : FLOAT
+        Stop as soon as a cell exceeds it (None visits every cell). maxMises is
+        then the stress of that cell, not necessarily the largest one.
+    order : LIST
+        Assembly order indices of the cells, in the order they are visited. By 
+        default the governing cell of the previous recovery comes first.
+    workers : INT
+        Worker processes (assembly_config.stressWorkers when None); 1 reads 
+        every odb in this process.
+
+    Returns
+    -------
+    recovery : DICT
+        'maxMises' : largest stress found, 'cell' : assembly order index of the
+        cell it belongs to, 'visited' : number of odbs read, 'exceeded' : True 
+        if the limit was exceeded.
+    '''
+    global lastGoverningCell
+    if order is None:
+        order = list(range(nCells))
+        if lastGoverningCell is not None and lastGoverningCell < nCells:
+            order.remove(lastGoverningCell)
+            order.insert(0,lastGoverningCell)
+    if workers is None:
+        workers = assembly_config.stressWorkers
+    if workers > 1 and len(order) > 1:
+        values = workerMises(jobName,order,loadCaseName,limit,workers)
+    else:
+        values = []
+        for cell in order:
+            values.append((cell,substructureMises(jobName+'_'+str(cell+1)+'.odb',loadCaseName)))
+            if limit is not None and values[-1][1] > limit:
+                break
+    recovery = {'maxMises':-0.1, 'cell':None, 'visited':len(values), 'exceeded':False}
+    for cell, maxMises in values:
+        if maxMises > recovery['maxMises']:
+            recovery['maxMises'] = maxMises
+            recovery['cell'] = cell
+    recovery['exceeded'] = limit is not None and recovery['maxMises'] > limit
+    lastGoverningCell = recovery['cell']
+    print('stress recovery: '+str(recovery))
+    return recovery
+
+def workerMises(jobName,order,loadCaseName,limit,workers,pollTime=0.05):
+    '''
+    Reads the substructure odbs in worker processes ('abaqus python Post_P.py 
+    mises ...'), cells dealt out in turn so that every worker starts with the 
+    most likely governing ones. Once a worker reports a cell above the limit 
+    the others are killed.
+
+    Returns a list of (cell, maxMises) of the cells that were read.
+    '''
+    script = os.path.abspath(__file__).replace('.pyc','.py')
+    processes = []
+    for i in range(workers):
+        cells = order[i::workers]
+        if not cells:
+            continue
+        command = (assembly_config.abaqusCommand+' python "'+script+'" mises '+jobName+' '
+            +str(loadCaseName)+' '+str(limit)+' '+' '.join([str(cell) for cell in cells]))
+        kwargs = {}
+        if os.name != 'nt':
+            kwargs['preexec_fn'] = os.setsid
+        processes.append(subprocess.Popen(command,shell=True,stdout=subprocess.PIPE,
+            universal_newlines=True,**kwargs))
+    values = []
+    running = list(processes)
+    while running:
+        for process in list(running):
+            if process.poll() is None:
+                continue
+            running.remove(process)
+            for line in process.stdout.read().splitlines():
+                fields = line.split()
+                if len(fields) == 3 and fields[0] == 'MISES':
+                    values.append((int(fields[1]),float(fields[2])))
+        if limit is not None and [cell for cell, value in values if value > limit]:
+            for process in running:
+                killWorker(process)
+            break
+        if running:
+            time.sleep(pollTime)
+    return values
+
+def killWorker(process):
+    '''Kills a stress recovery worker and the processes it started.'''
+    if os.name == 'nt':
+        subprocess.call('taskkill /F /T /PID '+str(process.pid),shell=True)
+    else:
+        try:
+            os.killpg(process.pid,signal.SIGKILL)
+        except OSError:
+            pass
+    process.wait()
+
+def maxSubstructureMises(jobName,assemblyDim,loadCaseName=None,limit=None):
+    '''
+    Largest von Mises stress over the substructure odbs of a job (see 
+    stressRecovery, which also reports the governing cell).
+    '''
+    recovery = stressRecovery(jobName,assemblyDim[0]*assemblyDim[1],loadCaseName,limit)
+    return recovery['maxMises']
+
+@timing.timed('post')
+def odbPostProcess(jobName,loadFlag,assemblyDim,limit=None,recoverStress=True):
+    print('in post processing script')
+    ### Obtain Rotation Array 
+    odbName = jobName+'.odb'
+    odb = openOdb(odbName)
+    step=odb.steps['Step-1']
+    nodeSet = referencePointSet(odb)
+    frame = loadCaseFrame(step)
+    metric = performanceMetric(frame,nodeSet,loadFlag)
     odb.close()
     print('closed odb')
     # combinedOdb = 'Combined_'+jobName+'.odb'
@@ -65,22 +248,50 @@ def odbPostProcess(jobName,loadFlag,assemblyDim):
     # assembly = odb.rootAssembly
     # frame = step.frames[-1]
     maxMises = -0.1
-    #Iterate through different ODBs for stress recovery
-    if loadFlag ==3: #Only check stress on the rotation job
-        for i in range(1,assemblyDim[0]*assemblyDim[1]+1):
-            odbName = jobName+'_'+str(i)+'.odb'
-            odb = visualization.openOdb(odbName)
-            step=odb.steps['Step-1']
-            frame = step.frames[-1]
-            allFields = frame.fieldOutputs
-            stress = allFields['S']
-            maxMisesSub = max(stress.bulkDataBlocks[0].mises)
-            odb.close()
-            
-            if maxMisesSub > maxMises:
-                maxMises = maxMisesSub
+    if loadFlag ==3 and recoverStress: #Only check stress on the rotation job
+        maxMises = maxSubstructureMises(jobName,assemblyDim,limit=limit)
     
+    return metric,maxMises 
 
-    
-    return performanceMetric,maxMises 
+@timing.timed('post')
+def odbPostProcessLoadCases(jobName,assemblyDim,xLoadCase='X_DISP',rotLoadCase='ROT',limit=None,
+                            recoverStress=True):
+    '''
+    Post-processing of the multi-load-case job: both stiffnesses are read from 
+    the frames of one odb, and the stresses of the rotation load case from the 
+    substructure odbs (stopping at the first cell above limit, see 
+    stressRecovery). Without recoverStress (certain-pass assemblies of the
+    feasibility screen) maxMises2 is not recovered either (-0.1).
+
+    Returns
+    -------
+    k_xy, maxMises1, k_theta, maxMises2 (maxMises1 is not recovered, as in 
+    odbPostProcess for the x-displacement job)
+    '''
+    print('in post processing script')
+    odb = openOdb(jobName+'.odb')
+    step=odb.steps['Step-1']
+    nodeSet = referencePointSet(odb)
+    k_xy = performanceMetric(loadCaseFrame(step,xLoadCase),nodeSet,loadFlag=1)
+    k_theta = performanceMetric(loadCaseFrame(step,rotLoadCase),nodeSet,loadFlag=3)
+    odb.close()
+    print('closed odb')
+    maxMises1 = -0.1
+    maxMises2 = -0.1
+    if recoverStress:
+        maxMises2 = maxSubstructureMises(jobName,assemblyDim,rotLoadCase,limit)
+    return k_xy,maxMises1,k_theta,maxMises2
+
+if __name__ == "__main__" and len(sys.argv) > 1 and sys.argv[1] == 'mises':
+    # Stress recovery worker (see workerMises):
+    # abaqus python Post_P.py mises jobName loadCaseName|None limit|None cell ...
+    jobName = sys.argv[2]
+    loadCaseName = None if sys.argv[3] == 'None' else sys.argv[3]
+    limit = None if sys.argv[4] == 'None' else float(sys.argv[4])
+    for cell in [int(cell) for cell in sys.argv[5:]]:
+        maxMises = substructureMises(jobName+'_'+str(cell+1)+'.odb',loadCaseName)
+        print('MISES '+str(cell)+' '+repr(maxMises))
+        sys.stdout.flush()
+        if limit is not None and maxMises > limit:
+            break
     
@@ -0,0 +1,240 @@
+'''
+Abaqus API profile
+
+Runs the model building and post-processing of 'AssemblyModifyEdit.py' and
+'Post_P.py' in this process, against the stand-in of the Abaqus API in
+fake_abaqus/ (fakeKernel.py), and reports how many API calls every builder
+makes and where the time goes as the grid grows.
+
+For every grid size the assembly_config.assemblyDim is replaced and recorded
+design vectors (benchmark.load_designs, tiled to the number of cells) are
+evaluated with runAssembly: one cold evaluation (openMdb and buildAssembly),
+then --swaps warm ones (swapInstances, with assembly_config.warmModel = 1).
+Every builder function runs in a scope of the call recorder, so the calls are
+counted where they are issued (innermost builder), and its own time is split
+into the time spent in API calls and in the script itself.
+
+The API calls of the stand-in only cost what it does itself (bookkeeping,
+node selection, synthetic results); '--latency NAME=S' makes every call NAME
+sleep S seconds (e.g. Job.waitForCompletion=2.0, or sets[]=0.001 to see what
+a slow repository lookup would do to the builders).
+
+Importing the script evaluates input.txt, as a single-mode Abaqus session
+would (runSingle). That evaluation runs in a scratch directory, like the
+others, and is not profiled.
+
+Files needed:
+    -fake_abaqus/ (stand-in modules), catalog/ (or partsInfo.p),
+     OptimizerOutputRound3.txt and input.txt (design vectors)
+    -AssemblyModifyEdit.py, Post_P.py and the modules they import
+
+Usage:
+    python abaqus_profile.py [5x3 10x10 20x20 ...] [--swaps 5]
+                             [--latency NAME=SECONDS ...] [--calls] [--verbose]
+        --calls lists the calls per API name of the largest grid
+'''
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+import contextlib
+
+import numpy as np
+
+FAKE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fake_abaqus')
+sys.path.insert(0, FAKE_DIR)
+
+import fakeKernel
+import assembly_config
+from catalog import load_parts_info, CATALOG_DIR, LEGACY_FILE
+from nearest_match import partName
+from benchmark import load_designs
+from kill_code import option_value
+
+# Functions of AssemblyModifyEdit.py (and Post_P.py) profiled as scopes, in
+# the order they run
+BUILDERS = ['instanceAssembly', 'BoundarySets', 'TieInstances', 'CreateStep',
+            'createAnalyticalSurface', 'instanceAnalyticalSurface', 'defineRigidBody',
+            'CreateBottomBC', 'tieRigidBodyandParts', 'boundaryNodeSet', 'loadCaseBCs',
+            'xDisplacement', 'FieldOutputRequest', 'swapInstances', 'CreateJob',
+            'runLoadCasesJob', 'runLoadCaseJobs', 'odbPostProcess',
+            'odbPostProcessLoadCases', 'stressRecovery', 'runAssembly']
+DEFAULT_GRIDS = [[5,3], [10,10], [20,20]]
+
+
+def load_script(scratch, design, quiet=True):
+    '''
+    Imports AssemblyModifyEdit.py on the stand-in (evaluating design in
+    scratch, see module docstring) and wraps the builders in recorder scopes.
+    '''
+    np.savetxt(os.path.join(scratch, 'input.txt'), np.atleast_2d(design))
+    argv = sys.argv
+    sys.argv = ['AssemblyModifyEdit.py']
+    try:
+        with open(os.devnull, 'w') as devnull:
+            with contextlib.redirect_stdout(devnull if quiet else sys.stdout):
+                import AssemblyModifyEdit
+    finally:
+        sys.argv = argv
+    import Post_P
+    recorder = fakeKernel.recorder
+    for name in BUILDERS:
+        if hasattr(AssemblyModifyEdit, name):
+            setattr(AssemblyModifyEdit, name, recorder.wrap(getattr(AssemblyModifyEdit, name)))
+        elif hasattr(Post_P, name):
+            setattr(Post_P, name, recorder.wrap(getattr(Post_P, name)))
+    return AssemblyModifyEdit
+
+
+def profile_grid(script, size, designs, partsInfo, swaps=5, scratch='.', quiet=True):
+    '''
+    Profiles the evaluations of one grid size: one dictionary per evaluation
+    with the recorder summaries ('scopes', 'names'), the wall 'seconds', the
+    'outputs' and whether it was 'cold' (model built from assembly.cae).
+    '''
+    assembly_config.assemblyDim = list(size)
+    nCells = size[0]*size[1]
+    script.warmState.clear()
+    # A results log per grid, as the number of cells of its records differs
+    os.environ['RESULTS_LOG'] = os.path.join(scratch, 'results_%dx%d.bin' % tuple(size))
+    evaluations = []
+    for k in range(min(swaps+1, len(designs))):
+        design = np.resize(designs[k], max(len(designs[k]), 3*nCells))
+        cold = assembly_config.warmModel != 1 or not script.warmState
+        fakeKernel.recorder.reset()
+        startTime = time.perf_counter()
+        with open(os.devnull, 'w') as devnull:
+            with contextlib.redirect_stdout(devnull if quiet else sys.stdout):
+                result = script.runAssembly(design, partsInfo, indNum=k+1)
+        evaluations.append({'cold':cold, 'seconds':time.perf_counter() - startTime,
+                            'scopes':fakeKernel.recorder.byScope(),
+                            'names':fakeKernel.recorder.byName(),
+                            'outputs':result['outputs']})
+    return evaluations
+
+
+def mean_calls(evaluations, scope, key='calls'):
+    '''Mean of key of a scope over the evaluations (0 when it did not run).'''
+    if not evaluations:
+        return 0.
+    return np.mean([evaluation['scopes'].get(scope, {}).get(key, 0.)
+                    for evaluation in evaluations])
+
+
+def growth(cells, calls):
+    '''Exponent p of calls ~ cells**p between the smallest and the largest grid.'''
+    if len(cells) < 2 or calls[0] <= 0 or calls[-1] <= 0 or cells[0] == cells[-1]:
+        return float('nan')
+    return np.log(calls[-1]/calls[0]) / np.log(float(cells[-1])/cells[0])
+
+
+def report(profiles, calls=False):
+    '''
+    Text report: API calls per builder and grid (cold, then mean of the warm
+    evaluations), the growth exponent of the calls, and the milliseconds
+    of the builders of the largest grid (in the script / in API calls).
+    '''
+    sizes = sorted(profiles, key=lambda size: size[0]*size[1])
+    cells = [size[0]*size[1] for size in sizes]
+    cold = dict((size, [e for e in profiles[size] if e['cold']]) for size in sizes)
+    warm = dict((size, [e for e in profiles[size] if not e['cold']]) for size in sizes)
+    lines = ['API calls per evaluation (cold / warm)']
+    lines.append('%-24s' % 'builder' + ''.join(['%16s' % ('%dx%d' % size) for size in sizes])
+                 + '%8s' % 'growth')
+    for name in BUILDERS + ['total']:
+        if name == 'total':
+            coldCalls = [np.mean([sum(s['calls'] for s in e['scopes'].values())
+                                  for e in cold[size]]) if cold[size] else 0. for size in sizes]
+            warmCalls = [np.mean([sum(s['calls'] for s in e['scopes'].values())
+                                  for e in warm[size]]) if warm[size] else 0. for size in sizes]
+        else:
+            coldCalls = [mean_calls(cold[size], name) for size in sizes]
+            warmCalls = [mean_calls(warm[size], name) for size in sizes]
+        if not any(coldCalls) and not any(warmCalls):
+            continue
+        # Builders of the warm model only (swapInstances) grow with their warm calls
+        lines.append('%-24s' % name + ''.join(['%16s' % ('%d / %.0f' % (c, w))
+                                               for c, w in zip(coldCalls, warmCalls)])
+                     + '%8.2f' % growth(cells, coldCalls if any(coldCalls) else warmCalls))
+
+    largest = sizes[-1]
+    lines.append('')
+    lines.append('Milliseconds per evaluation, %dx%d (cold / warm)' % tuple(largest))
+    lines.append('%-24s %18s %18s' % ('builder', 'script', 'API calls'))
+    for name in BUILDERS:
+        own = [mean_calls(cold[largest], name, 'seconds'), mean_calls(warm[largest], name, 'seconds')]
+        inApi = [mean_calls(cold[largest], name, 'apiSeconds'),
+                 mean_calls(warm[largest], name, 'apiSeconds')]
+        if not any(own):
+            continue
+        lines.append('%-24s %18s %18s' % (name,
+            '%.1f / %.1f' % (1E3*(own[0]-inApi[0]), 1E3*(own[1]-inApi[1])),
+            '%.1f / %.1f' % (1E3*inApi[0], 1E3*inApi[1])))
+    for label, evaluations in (('cold', cold[largest]), ('warm', warm[largest])):
+        if evaluations:
+            lines.append('%s evaluation: %.1f ms' % (label,
+                1E3*np.mean([e['seconds'] for e in evaluations])))
+
+    if calls:
+        lines.append('')
+        lines.append('API calls per name, %dx%d (cold / warm)' % tuple(largest))
+        names = {}
+        for label, evaluations in (('cold', cold[largest]), ('warm', warm[largest])):
+            for evaluation in evaluations:
+                for name, (count, seconds) in evaluation['names'].items():
+                    entry = names.setdefault(name, {'cold':0., 'warm':0., 'seconds':0.})
+                    entry[label] += float(count)/len(evaluations)
+                    entry['seconds'] += seconds
+        lines.append('%-34s %16s %12s' % ('call', 'calls', 'total ms'))
+        for name in sorted(names, key=lambda name: -names[name]['cold']):
+            entry = names[name]
+            lines.append('%-34s %16s %12.2f' % (name, '%d / %.0f' % (entry['cold'], entry['warm']),
+                                                1E3*entry['seconds']))
+    return '\n'.join(lines)
+
+
+def latency_options(argv=None):
+    '''api name -> seconds from the '--latency NAME=SECONDS' arguments.'''
+    if argv is None:
+        argv = sys.argv
+    latency = {}
+    for i, arg in enumerate(argv[:-1]):
+        if arg == '--latency':
+            name, seconds = argv[i+1].rsplit('=', 1)
+            latency[name] = float(seconds)
+    return latency
+
+
+if __name__ == "__main__":
+    sizes = [[int(n) for n in arg.split('x')] for arg in sys.argv[1:]
+             if 'x' in arg and arg.replace('x', '').isdigit()]
+    swaps = option_value('--swaps', 5)
+    quiet = '--verbose' not in sys.argv
+    designs = load_designs()
+    partsInfo = load_parts_info()
+    fakeKernel.configure(parts=[partName(partsInfo, index) for index in range(len(partsInfo[0]))],
+                         box=assembly_config.dim)
+    fakeKernel.latency.update(latency_options())
+
+    home = os.getcwd()
+    scratch = tempfile.mkdtemp(prefix='abaqus-profile-')
+    for name in (CATALOG_DIR, LEGACY_FILE):
+        if os.path.isdir(name):
+            shutil.copytree(name, os.path.join(scratch, name))
+        elif os.path.isfile(name):
+            shutil.copy(name, scratch)
+    os.environ['RESULTS_LOG'] = os.path.join(scratch, 'results.bin')
+    os.environ['EVAL_TRACE'] = os.path.join(scratch, 'evalTrace.json')
+    os.chdir(scratch)
+    try:
+        script = load_script(scratch, designs[-1], quiet)
+        profiles = {}
+        for size in sizes or DEFAULT_GRIDS:
+            profiles[tuple(size)] = profile_grid(script, size, designs, partsInfo, swaps,
+                                                 scratch, quiet)
+    finally:
+        os.chdir(home)
+        shutil.rmtree(scratch, ignore_errors=True)
+    print(report(profiles, '--calls' in sys.argv))
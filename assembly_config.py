@@ -0,0 +1,65 @@
+'''
+Assembly model parameters
+
+Shared between the Abaqus script ('AssemblyModifyEdit.py', run by the Abaqus
+Python 2.7 interpreter) and the optimization driver ('kill_code.py', run by
+Python 3). Anything that changes the analysis result for a given set of snapped
+substructures must live here so that both sides agree on it (e.g. the
+evaluation cache key in 'eval_cache.py' is built from these values).
+
+Keep this file importable by both interpreters: no Abaqus imports, no
+Python 3-only syntax.
+'''
+
+modelName = 'Model-1'
+stepName = 'Step-1'
+
+dim = [-0.005, -0.005, 0.0, 0.005, 0.005, 0.0025] #[minX,minY,minZ,maxX,maxY,maxZ]
+assemblyDim = [5,3] #[Number of substructures to instance in x-direction,
+                    # Number of substructure to instance in y-direction]
+
+# Values applied to the 'MOVE_RP' boundary condition for each load case.
+# Degrees of freedom that are not listed are left UNSET.
+loadCases = {
+    'X_DISP': {'u1':1E-6, 'u2':0.0, 'ur3':0.0}, # x-displacement (k_xy)
+    'ROT': {'ur3':0.052},                       # z-rotation (k_theta)
+    }
+
+# 1 = compute both load cases in a single job (linear perturbation step with one
+#     load case each, the stiffness is assembled and factorized once)
+# 0 = one static job per load case
+multiLoadCaseJob = 1
+
+# 1 = build the assembly once per CAE session and only replace the parts of the
+#     cells that changed for the following evaluations (batch/server modes)
+# 0 = rebuild the assembly from assembly.cae for every evaluation
+warmModel = 1
+
+yieldStress = 1000E6 #Yield stress of titanium = 1000 MPA
+
+# Processes reading the substructure odbs in the stress recovery (Post_P.py).
+# 1 = read them in the CAE session. More only pays off for large grids, as
+# every worker is an 'abaqus python' process of its own.
+stressWorkers = 1
+abaqusCommand = 'abq2018'
+
+# Every evaluation is appended to the binary results log (results_log.py).
+# 1 = also append to the text records AssemblyOutput.txt and PlottingInfo.txt
+textRecords = 0
+
+# Combined odbs of the whole assembly, for visualization (odbCombine plug-in)
+# 0 = none (~15% faster)
+# 1 = combine both jobs of every individual during its evaluation
+# 2 = deferred (deferred_viz.py): keep the odbs of the individuals on the
+#     current Pareto front only, combined by a low-priority background session
+visualizationFlag = 0
+odbCombinePath = r'c:/SIMULIA/CAE/2018/win_b64/code/python2.7/lib/abaqus_plugins/odbCombine'
+
+# 0 = off
+# 1 = append the stage times of every evaluation to evalTrace.json as Chrome
+#     trace events (timing.py); the results log gets them either way
+traceEvaluations = 0
+
+# Outputs sent back to the optimizer for failed/killed runs
+# [k_xy, -k_theta, -mass]
+penaltyOutputs = [1.0E10,-1.0E10,-1.0E10]
@@ -0,0 +1,367 @@
+'''
+Offline pipeline benchmark
+
+Replays recorded design vectors (OptimizerOutputRound3.txt and input.txt)
+through the evaluation pipeline of 'kill_code.py --batch' without Abaqus:
+catalog loading, snapping (nearestMatch/catalogMatcher), de-duplication and
+the evaluation cache (evaluate_population), the worker pool of scheduler.py,
+and the results log with the stage times of every individual. Abaqus is
+replaced by a deterministic stand-in, the static condensation solver
+(condensation_solver.py) plus injected latency and failures:
+    -latency: every solve sleeps latency*exp(jitter*N(0,1)) seconds
+    -failures: a fraction failureRate of the solves raise, like a crashed or
+     killed Abaqus run (the row is penalized and not cached)
+Both are drawn from the snapped assembly and the seed, so a replay is
+repeatable and the same assembly always gets the same delay and fate.
+
+The rows are evaluated population by population (one generation per
+population), in a scratch directory with an empty cache and results log, and
+the benchmark reports:
+    -individuals and solver evaluations per second
+    -p50/p95/p99 latency of every stage (results log stages per individual,
+     plus 'generation' per population and the catalog load)
+    -cache hits, unique assemblies, screened and failed rows
+    -peak resident memory of the process
+
+Metrics can be saved as a baseline (JSON) and compared with a later run;
+throughput, hit rate, latency and memory worse than the baseline by more
+than the tolerance are reported as regressions (exit status 1).
+
+Rows shorter than the longest design vector (input.txt; the recorded round
+used smaller assemblies) are tiled to its length.
+
+Files needed:
+    -catalog/ (or partsInfo.p), OptimizerOutputRound3.txt, input.txt and the
+     modules of the pipeline (kill_code.py, condensation_solver.py, ...)
+
+Usage:
+    python benchmark.py [--population 250] [--workers 4] [--latency 0.0]
+                        [--jitter 0.5] [--failure-rate 0.0] [--seed 0] [--limit N]
+                        [--no-cache] [--verbose] [--save baseline.json]
+                        [--compare baseline.json] [--tolerance 0.2] [--help]
+'''
+
+import os
+import sys
+import json
+import time
+import zlib
+import shutil
+import tempfile
+import contextlib
+import subprocess as sp
+
+import numpy as np
+
+import assembly_config
+from catalog import load_parts_info
+from eval_cache import EvaluationCache
+from eval_server import evaluate_population
+from scheduler import EvaluationScheduler
+from condensation_solver import CondensationBackend
+from results_log import STAGES, read_log
+from kill_code import option_value
+
+try:
+    import resource
+except ImportError: # Windows
+    resource = None
+
+
+DESIGN_FILES = ['OptimizerOutputRound3.txt', 'input.txt']
+PERCENTILES = [50, 95, 99]
+
+
+def load_designs(files=DESIGN_FILES, nDesign=None):
+    '''
+    Design vectors of the recorded files: one per line (comma or space
+    separated), or a single one written one value per line.
+
+    nDesign: INT - length of the replayed design vectors (default: the longest
+             row); shorter rows are tiled, longer ones cut
+    '''
+    rows = []
+    for path in files:
+        if not os.path.isfile(path):
+            continue
+        with open(path) as f:
+            lines = [np.array(line.replace(',', ' ').split(), dtype=float) for line in f
+                     if line.strip()]
+        if lines and all(len(line) == 1 for line in lines):
+            rows.append(np.concatenate(lines))
+        else:
+            rows.extend(lines)
+    if not rows:
+        return np.zeros((0, 0))
+    if nDesign is None:
+        nDesign = max(len(row) for row in rows)
+    return np.array([np.resize(row, nDesign) for row in rows])
+
+
+def assembly_seed(partIndices, seed):
+    '''Seed of the injected latency/failure of an assembly.'''
+    return (zlib.crc32(np.asarray(partIndices, dtype=np.int64).tobytes()) ^ seed) & 0x7fffffff
+
+
+class StandInBackend(CondensationBackend):
+    '''
+    Condensation solver with injected latency and failures (see module docstring).
+
+    latency: FLOAT - median seconds added to every solve
+    jitter: FLOAT - standard deviation of the log of the latency
+    failureRate: FLOAT - fraction of the assemblies whose solve fails
+    seed: INT - seed of the latency and failure draws
+    '''
+
+    def __init__(self, partsInfo, latency=0., jitter=0.5, failureRate=0., seed=0, **kwargs):
+        CondensationBackend.__init__(self, partsInfo, **kwargs)
+        self.latency = latency
+        self.jitter = jitter
+        self.failureRate = failureRate
+        self.seed = seed
+
+    def solve(self, partIndices):
+        rng = np.random.RandomState(assembly_seed(partIndices, self.seed))
+        if self.latency > 0:
+            time.sleep(self.latency*np.exp(self.jitter*rng.standard_normal()))
+        if rng.random_sample() < self.failureRate:
+            raise RuntimeError('Injected failure')
+        return CondensationBackend.solve(self, partIndices)
+
+    def evaluate_batch(self, designs, ids=None, generation=None):
+        '''Like 'AssemblyModifyEdit.py -- batch': failed rows give None.'''
+        if ids is None:
+            ids = [None]*len(designs)
+        results = []
+        for design, indNum in zip(designs, ids):
+            try:
+                results.append(self.evaluate(design, indNum, generation=generation))
+            except Exception:
+                results.append(None)
+        return results
+
+
+class StandInScheduler(EvaluationScheduler):
+    '''
+    EvaluationScheduler whose workers are StandInBackend instances (one per
+    worker, the solvers are not thread-safe) instead of Abaqus sessions in
+    scratch directories.
+
+    backend_kwargs: DICT - StandInBackend arguments
+    '''
+
+    def __init__(self, partsInfo, max_workers=4, chunk_size=None, **backend_kwargs):
+        self.partsInfo = partsInfo
+        self.backend_kwargs = backend_kwargs
+        EvaluationScheduler.__init__(self, os.getcwd(), max_workers=max_workers,
+                                     chunk_size=chunk_size)
+
+    def prepare_workdir(self, name):
+        return StandInBackend(self.partsInfo, incremental=True, **self.backend_kwargs)
+
+    def run_chunk(self, designs, ids, generation=None):
+        backend = self.workdirs.get()
+        try:
+            return backend.evaluate_batch(designs, ids, generation)
+        finally:
+            self.workdirs.put(backend)
+
+
+def peak_rss_mb():
+    '''Peak resident memory of this process in MB (None where unavailable).'''
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak/1024.**2 if sys.platform == 'darwin' else peak/1024.
+    try:
+        import psutil
+        return psutil.Process().memory_info().peak_wset/1024.**2
+    except (ImportError, AttributeError):
+        return None
+
+
+def percentiles(values):
+    values = np.asarray(values, dtype=float)
+    values = values[~np.isnan(values)]
+    if len(values) == 0:
+        return None
+    return dict(('p%i' % q, float(np.percentile(values, q))) for q in PERCENTILES)
+
+
+def code_version():
+    '''Git commit of the benchmarked code (None outside a repository).'''
+    try:
+        return sp.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                               stderr=sp.STDOUT).decode().strip()
+    except (OSError, sp.CalledProcessError):
+        return None
+
+
+def run_benchmark(designs, population=250, workers=4, latency=0., jitter=0.5,
+                  failureRate=0., seed=0, useCache=True, quiet=True):
+    '''
+    Replays the design vectors and returns the metrics (see module docstring).
+    The cache, results log and trace are written to a scratch directory that is
+    removed afterwards. With quiet, the output of the pipeline (nearestMatch
+    prints every design) is discarded.
+    '''
+    scratch = tempfile.mkdtemp(prefix='benchmark-')
+    saved = dict((name, os.environ.get(name)) for name in ('RESULTS_LOG', 'EVAL_TRACE'))
+    os.environ['RESULTS_LOG'] = os.path.join(scratch, 'results.bin')
+    os.environ['EVAL_TRACE'] = os.path.join(scratch, 'evalTrace.json')
+    try:
+        startTime = time.perf_counter()
+        partsInfo = load_parts_info()
+        catalogTime = time.perf_counter() - startTime
+        cache = EvaluationCache(os.path.join(scratch, 'evalCache.db')) if useCache else None
+        scheduler = StandInScheduler(partsInfo, max_workers=workers, latency=latency,
+                                     jitter=jitter, failureRate=failureRate, seed=seed)
+
+        totals = {}
+        generationTimes = []
+        with open(os.devnull, 'w') as devnull:
+            with contextlib.redirect_stdout(devnull if quiet else sys.stdout):
+                for generation, start in enumerate(range(0, len(designs), population)):
+                    rows = designs[start:start+population]
+                    ids = np.arange(start+1, start+len(rows)+1)
+                    generationStart = time.perf_counter()
+                    outputs, counts = evaluate_population(rows, ids, partsInfo,
+                                                          scheduler.evaluate, cache,
+                                                          generation=generation)
+                    generationTimes.append(time.perf_counter() - generationStart)
+                    for name, value in counts.items():
+                        totals[name] = totals.get(name, 0) + value
+        seconds = time.perf_counter() - startTime
+
+        records = read_log(os.environ['RESULTS_LOG'])
+        wall = np.array(records['wall'], dtype=float).reshape(len(records), len(STAGES))
+        stages = {'catalog': {'p50':catalogTime, 'p95':catalogTime, 'p99':catalogTime},
+                  'generation': percentiles(generationTimes)}
+        for k, name in enumerate(STAGES):
+            stage = percentiles(wall[:, k])
+            if stage is not None:
+                stages[name] = stage
+        solved = totals.get('evaluated', 0)
+        metrics = {
+            'version': code_version(),
+            'date': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'settings': {'rows':len(designs), 'population':population, 'workers':workers,
+                         'latency':latency, 'jitter':jitter, 'failureRate':failureRate,
+                         'seed':seed, 'cache':useCache,
+                         'assemblyDim':list(assembly_config.assemblyDim)},
+            'seconds': seconds,
+            'individuals_per_s': len(designs)/seconds,
+            'evaluations_per_s': solved/seconds,
+            'counts': totals,
+            'cache_hit_rate': cache.stats()['hit_rate'] if cache is not None else 0.,
+            'stages': stages,
+            'peak_rss_mb': peak_rss_mb(),
+        }
+    finally:
+        for name, value in saved.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+        shutil.rmtree(scratch, ignore_errors=True)
+    return metrics
+
+
+def report(metrics):
+    '''Text report of the metrics.'''
+    counts = metrics['counts']
+    lines = ['%i individuals in %.2f s: %.1f individuals/s, %.1f solver evaluations/s'
+             % (metrics['settings']['rows'], metrics['seconds'], metrics['individuals_per_s'],
+                metrics['evaluations_per_s']),
+             '%i unique assemblies, %i cached (hit rate %.1f%%), %i evaluated, %i failed'
+             % (counts.get('unique', 0), counts.get('cached', 0),
+                100.*metrics['cache_hit_rate'], counts.get('evaluated', 0),
+                counts.get('failed', 0))]
+    if metrics['peak_rss_mb'] is not None:
+        lines.append('peak RSS %.1f MB' % metrics['peak_rss_mb'])
+    lines.append('%-10s %10s %10s %10s' % ('stage', 'p50 ms', 'p95 ms', 'p99 ms'))
+    for name in sorted(metrics['stages']):
+        stage = metrics['stages'][name]
+        lines.append('%-10s %10.2f %10.2f %10.2f' % (name, 1E3*stage['p50'], 1E3*stage['p95'],
+                                                    1E3*stage['p99']))
+    return '\n'.join(lines)
+
+
+def compare(metrics, baseline, tolerance=0.2):
+    '''
+    Regressions of metrics against a baseline: throughput and cache hit rate
+    lower, or p95 stage latency and peak RSS higher, by more than tolerance
+    (relative). Returns a list of messages (empty when there is none).
+    '''
+    regressions = []
+    def check(name, value, reference, higherIsBetter):
+        if value is None or reference is None or reference == 0:
+            return
+        change = value/reference - 1.
+        if (higherIsBetter and change < -tolerance) or (not higherIsBetter and change > tolerance):
+            regressions.append('%s: %.4g -> %.4g (%+.0f%%)' % (name, reference, value, 100.*change))
+    if metrics['settings'] != baseline['settings']:
+        print('Warning: the baseline was run with different settings: '
+              + json.dumps(baseline['settings']))
+    check('individuals_per_s', metrics['individuals_per_s'], baseline['individuals_per_s'], True)
+    check('evaluations_per_s', metrics['evaluations_per_s'], baseline['evaluations_per_s'], True)
+    check('cache_hit_rate', metrics['cache_hit_rate'], baseline['cache_hit_rate'], True)
+    check('peak_rss_mb', metrics['peak_rss_mb'], baseline['peak_rss_mb'], False)
+    for name, stage in metrics['stages'].items():
+        if name in baseline['stages']:
+            check(name + ' p95', stage['p95'], baseline['stages'][name]['p95'], False)
+    return regressions
+
+
+# Command line options taking a value, and flags
+VALUE_OPTIONS = ('--population', '--workers', '--latency', '--jitter', '--failure-rate',
+                 '--seed', '--limit', '--save', '--compare', '--tolerance')
+FLAG_OPTIONS = ('--no-cache', '--verbose')
+
+
+def check_arguments(argv):
+    '''Prints the usage and exits for -h/--help, and for unknown options or
+    options missing their value (exit status 2), so that a typo does not
+    silently run the default benchmark.'''
+    usage = __doc__[__doc__.index('Usage:'):].rstrip()
+    if '-h' in argv or '--help' in argv:
+        print(usage)
+        sys.exit(0)
+    k = 0
+    while k < len(argv):
+        if argv[k] in VALUE_OPTIONS and k + 1 < len(argv):
+            k += 2
+        elif argv[k] in FLAG_OPTIONS:
+            k += 1
+        else:
+            problem = 'missing value for ' if argv[k] in VALUE_OPTIONS else 'unknown argument '
+            print('benchmark.py: ' + problem + argv[k] + '\n' + usage)
+            sys.exit(2)
+
+
+if __name__ == "__main__":
+    check_arguments(sys.argv[1:])
+    designs = load_designs()
+    limit = option_value('--limit', 0)
+    if limit:
+        designs = designs[:limit]
+    metrics = run_benchmark(designs, population=option_value('--population', 250),
+                            workers=option_value('--workers', 4),
+                            latency=option_value('--latency', 0.),
+                            jitter=option_value('--jitter', 0.5),
+                            failureRate=option_value('--failure-rate', 0.),
+                            seed=option_value('--seed', 0),
+                            useCache='--no-cache' not in sys.argv,
+                            quiet='--verbose' not in sys.argv)
+    print(report(metrics))
+    if '--save' in sys.argv:
+        with open(option_value('--save', 'baseline.json'), 'w') as f:
+            json.dump(metrics, f, indent=1)
+    if '--compare' in sys.argv:
+        with open(option_value('--compare', 'baseline.json')) as f:
+            baseline = json.load(f)
+        regressions = compare(metrics, baseline, option_value('--tolerance', 0.2))
+        print('Compared with ' + str(baseline.get('version')) + ' (' + baseline['date'] + '): '
+              + (str(len(regressions)) + ' regressions' if regressions else 'no regressions'))
+        for regression in regressions:
+            print('  ' + regression)
+        sys.exit(1 if regressions else 0)
@@ -0,0 +1,354 @@
+'''
+Substructure catalog storage
+
+Replaces the partsInfo.p pickle (a list of six object arrays re-read with
+encoding='latin1' in every evaluation) with a versioned directory of fixed-dtype
+columns:
+
+    catalog/
+        meta.json          - version, number of parts, column names, categories
+        substructure.npy   - uint16 codes into meta['categories']['Substructure']
+        material.npy       - uint16 codes into meta['categories']['Material']
+        id.npy             - int32 part ids
+        dvs.npy            - float64 (nDVs, nParts) design variables
+        atts.npy           - float64 (nAtts, nParts) attribute metrics (K_xy, K_y, K_theta, mass)
+        stress.npy         - float64 (nStress, nParts) maxMises1..3
+
+The numeric columns are opened with np.load(mmap_mode='r'), so loading costs the
+same for 64 or 100k parts and only the pages that are read come into memory.
+The 2D columns keep the partsInfo layout (one row per variable), and
+Catalog.partsInfo() returns the familiar six-entry list without copying them.
+load_parts_info falls back to the old pickle when no catalog exists.
+
+read_data_points parses a substructure generator file (e.g.
+'CrossAsymmetricDataPoints.csv') in a single pass: the header block (number of
+substructures, DV bounds and steps, CornerSize) and the data table, whose
+column groups are inferred from the header names. catalog_from_csv turns one or
+more of those files (one per geometry) into a catalog directory.
+
+Keep this file importable by both the Abaqus Python 2.7 interpreter and Python 3.
+
+Usage (convert partsInfo.p, or build the catalog from generator files):
+    python catalog.py [partsInfo.p] [catalog directory]
+    python catalog.py CrossAsymmetricDataPoints.csv [more .csv files] [catalog directory]
+'''
+
+import os
+import re
+import sys
+import csv
+import json
+import pickle
+
+import numpy as np
+
+
+CATALOG_VERSION = 1
+CATALOG_DIR = 'catalog'
+LEGACY_FILE = 'partsInfo.p'
+
+# Column names of the 2D columns, in partsInfo row order
+DV_NAMES = ['Thick13', 'Thick24', 'Fillet']
+ATT_NAMES = ['K_xy', 'K_y', 'K_theta', 'mass']
+STRESS_NAMES = ['maxMises1', 'maxMises2', 'maxMises3']
+# Leading columns of a generator file, every other column is grouped by name
+NAME_COLUMNS = ['Substructure', 'ID', 'Material']
+STRESS_PREFIX = 'maxMises'
+ATT_PREFIXES = ('K_', 'mass')
+COLUMNS = {'substructure':'uint16', 'material':'uint16', 'id':'int32',
+           'dvs':'float64', 'atts':'float64', 'stress':'float64'}
+
+
+def _text(value):
+    '''str of a catalog string (bytes when the pickle is read from Python 3)'''
+    if not isinstance(value, str):
+        value = value.decode('latin1')
+    return value
+
+
+def encode_categories(values):
+    '''Categorical codes of values, and the categories (in order of appearance).'''
+    categories = []
+    codes = np.empty(len(values), dtype=COLUMNS['substructure'])
+    lookup = {}
+    for i, value in enumerate(values):
+        value = _text(value)
+        if value not in lookup:
+            lookup[value] = len(categories)
+            categories.append(value)
+        codes[i] = lookup[value]
+    return codes, categories
+
+
+class CategoricalColumn(object):
+    '''
+    Read-only string column stored as integer codes. Indexing with an integer
+    returns the string, anything else (slices, index arrays) a string array;
+    strings are only built for the entries that are read.
+    '''
+
+    def __init__(self, codes, categories):
+        self.codes = codes
+        self.categories = np.array(categories)
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __getitem__(self, index):
+        if isinstance(index, (int, np.integer)):
+            return str(self.categories[self.codes[index]])
+        return self.categories[np.asarray(self.codes[index])]
+
+    def __array__(self, dtype=None, copy=None):
+        # The names are always gathered into a new array, whatever copy asks for
+        values = self.categories[np.asarray(self.codes)]
+        return values if dtype is None else values.astype(dtype)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+
+class Catalog(object):
+    '''
+    Substructure catalog opened from a catalog directory (see load_catalog).
+
+    substructure, material: CategoricalColumn - geometry and material names
+    id: ARRAY of INT - part ids (part names are substructure-id_Zid)
+    dvs, atts, stress: ARRAY - (nVariables, nParts) columns, memory mapped
+    meta: DICT - contents of meta.json
+    '''
+
+    def __init__(self, path=CATALOG_DIR, mmap=True):
+        self.path = path
+        with open(os.path.join(path, 'meta.json')) as f:
+            self.meta = json.load(f)
+        if self.meta['version'] > CATALOG_VERSION:
+            raise ValueError('Catalog version ' + str(self.meta['version']) + ' in ' + path
+                             + ' is newer than this reader (' + str(CATALOG_VERSION) + ')')
+        mmap_mode = 'r' if mmap else None
+        columns = {}
+        for name in COLUMNS:
+            columns[name] = np.load(os.path.join(path, name + '.npy'), mmap_mode=mmap_mode)
+        categories = self.meta['categories']
+        self.substructure = CategoricalColumn(columns['substructure'], categories['Substructure'])
+        self.material = CategoricalColumn(columns['material'], categories['Material'])
+        self.id = columns['id']
+        self.dvs = columns['dvs']
+        self.atts = columns['atts']
+        self.stress = columns['stress']
+
+    def __len__(self):
+        return self.meta['nParts']
+
+    def partsInfo(self):
+        '''Catalog in the partsInfo.p layout: [names, ids, materials, dvs, atts, stress].'''
+        return [self.substructure, self.id, self.material, self.dvs, self.atts, self.stress]
+
+
+def save_catalog(path, substructure, ids, material, dvs, atts, stress,
+                 dvNames=None, attNames=None, stressNames=None, source=None, extra=None):
+    '''
+    Writes a catalog directory.
+
+    substructure, material: sequences of STR (or bytes) - one entry per part
+    ids: sequence of INT
+    dvs, atts, stress: ARRAY - (nVariables, nParts), the partsInfo layout
+    dvNames, attNames, stressNames: LIST of STR - column names (defaults for the cross catalog)
+    source: STR - file the catalog was built from, recorded in meta.json
+    extra: DICT - further entries for meta.json
+    '''
+    if not os.path.isdir(path):
+        os.makedirs(path)
+    substructureCodes, substructureCategories = encode_categories(substructure)
+    materialCodes, materialCategories = encode_categories(material)
+    columns = {'substructure':substructureCodes, 'material':materialCodes, 'id':ids,
+               'dvs':dvs, 'atts':atts, 'stress':stress}
+    for name, dtype in COLUMNS.items():
+        np.save(os.path.join(path, name + '.npy'),
+                np.ascontiguousarray(np.asarray(columns[name], dtype=dtype)))
+    meta = {'version':CATALOG_VERSION,
+            'nParts':len(substructureCodes),
+            'categories':{'Substructure':substructureCategories,
+                          'Material':materialCategories},
+            'dvNames':list(dvNames or DV_NAMES),
+            'attNames':list(attNames or ATT_NAMES),
+            'stressNames':list(stressNames or STRESS_NAMES),
+            'source':source}
+    meta.update(extra or {})
+    # meta.json is written last, so a catalog with meta.json is complete
+    with open(os.path.join(path, 'meta.json'), 'w') as f:
+        json.dump(meta, f, indent=1, sort_keys=True)
+    return meta
+
+
+def _number(text):
+    try:
+        return float(text)
+    except ValueError:
+        return None
+
+
+def _header_value(row):
+    '''Numbers of a header row, e.g. 'Thick13  Min:,0.0005, Max:,0.002, Step:,0.0005'
+    gives {'Min':0.0005, 'Max':0.002, 'Step':0.0005}; a label followed by a
+    single number gives {'value':number}.'''
+    values = {}
+    for label, value in zip(row[::2], row[1::2]):
+        number = _number(value)
+        if number is None:
+            continue
+        match = re.search(r'(Min|Max|Step)\s*:\s*$', label)
+        values[match.group(1) if match else 'value'] = number
+    return values
+
+
+def read_data_points(fpath):
+    '''
+    Reads a substructure generator file in one pass.
+
+    fpath: STR - e.g. 'CrossAsymmetricDataPoints.csv'
+
+    Returns a DICT with
+        'substructure', 'material': LIST of STR, 'id': ARRAY of INT
+        'dvs', 'atts', 'stress': ARRAY - (nVariables, nParts) column groups
+        'dvNames', 'attNames', 'stressNames': LIST of STR - their header names
+        'nSubs': INT - number of substructures stated in the header (or read)
+        'dvBounds': DICT - {dv name: {'Min':..., 'Max':..., 'Step':...}}
+        'cornerSize': FLOAT (None if absent), 'units': STR (None if absent)
+    The attribute columns are the ones named K_* or mass, the stress columns
+    maxMises*, and the remaining numeric columns are design variables.
+    '''
+    if sys.version_info[0] >= 3:
+        f = open(fpath, newline='')
+    else:
+        f = open(fpath, 'rb')
+    header = {'nSubs':None, 'dvBounds':{}, 'cornerSize':None, 'units':None}
+    names = None
+    rows = []
+    try:
+        for row in csv.reader(f):
+            row = [cell.strip() for cell in row]
+            while row and row[-1] == '':
+                row.pop()
+            if not row:
+                continue
+            if names is not None:
+                rows.append(row)
+                continue
+            label = row[0].split(':')[0].strip()
+            if label == NAME_COLUMNS[0]:
+                names = row
+            elif label.startswith('No. of'):
+                header['nSubs'] = int(_number(row[1]))
+            elif label == 'DV Bounds':
+                if len(row) > 1 and 'Units' in row[1]:
+                    header['units'] = row[1].split(':', 1)[1].strip()
+            elif label == 'CornerSize':
+                header['cornerSize'] = _header_value(row).get('value')
+            else:
+                bounds = _header_value(row)
+                if bounds:
+                    header['dvBounds'][label.split()[0]] = bounds
+    finally:
+        f.close()
+    if names is None:
+        raise ValueError('No ' + NAME_COLUMNS[0] + ' header row in ' + fpath)
+
+    dvNames, attNames, stressNames = [], [], []
+    for name in names[len(NAME_COLUMNS):]:
+        if name.startswith(STRESS_PREFIX):
+            stressNames.append(name)
+        elif name.startswith(ATT_PREFIXES):
+            attNames.append(name)
+        else:
+            dvNames.append(name)
+    columns = list(zip(*rows)) if rows else [()]*len(names)
+    column = dict(zip(names, columns))
+    def group(groupNames):
+        return np.array([column[name] for name in groupNames], dtype=float).reshape(len(groupNames), len(rows))
+    data = {'substructure':list(column[NAME_COLUMNS[0]]),
+            'id':np.array(column[NAME_COLUMNS[1]], dtype=int),
+            'material':list(column[NAME_COLUMNS[2]]),
+            'dvs':group(dvNames), 'atts':group(attNames), 'stress':group(stressNames),
+            'dvNames':dvNames, 'attNames':attNames, 'stressNames':stressNames}
+    data.update(header)
+    if data['nSubs'] is None:
+        data['nSubs'] = len(rows)
+    elif data['nSubs'] != len(rows):
+        raise ValueError(fpath + ' states ' + str(data['nSubs']) + ' substructures but holds '
+                         + str(len(rows)))
+    return data
+
+
+def catalog_from_csv(fpaths, path=CATALOG_DIR):
+    '''
+    Writes the catalog directory for one or more generator files (one per
+    geometry, all with the same column groups). The DV bounds and CornerSize
+    of every file are kept in meta.json.
+    '''
+    files = [read_data_points(fpath) for fpath in fpaths]
+    first = files[0]
+    for data, fpath in zip(files, fpaths):
+        for key in ['dvNames', 'attNames', 'stressNames']:
+            if data[key] != first[key]:
+                raise ValueError(fpath + ' has ' + key + ' ' + str(data[key]) + ', expected '
+                                 + str(first[key]))
+    generators = dict((os.path.basename(fpath),
+                       {'dvBounds':data['dvBounds'], 'cornerSize':data['cornerSize'],
+                        'units':data['units'], 'nSubs':data['nSubs']})
+                      for data, fpath in zip(files, fpaths))
+    return save_catalog(path,
+                        [name for data in files for name in data['substructure']],
+                        np.concatenate([data['id'] for data in files]),
+                        [name for data in files for name in data['material']],
+                        np.concatenate([data['dvs'] for data in files], axis=1),
+                        np.concatenate([data['atts'] for data in files], axis=1),
+                        np.concatenate([data['stress'] for data in files], axis=1),
+                        first['dvNames'], first['attNames'], first['stressNames'],
+                        source=','.join(os.path.basename(fpath) for fpath in fpaths),
+                        extra={'generators':generators})
+
+
+def load_legacy(fileName=LEGACY_FILE):
+    '''partsInfo list from the old pickle (readable from Python 2 and 3).'''
+    with open(fileName, 'rb') as f:
+        if sys.version_info[0] >= 3:
+            return pickle.load(f, encoding='latin1')
+        return pickle.load(f)
+
+
+def from_parts_info(partsInfo, path=CATALOG_DIR, source=None):
+    '''Writes the catalog directory for a partsInfo list.'''
+    return save_catalog(path, partsInfo[0], partsInfo[1], partsInfo[2],
+                        np.array(partsInfo[3], dtype=float),
+                        np.array(partsInfo[4], dtype=float),
+                        np.array(partsInfo[5], dtype=float), source=source)
+
+
+def load_catalog(path=CATALOG_DIR, mmap=True):
+    '''Opens a catalog directory (see Catalog).'''
+    return Catalog(path, mmap)
+
+
+def load_parts_info(path=CATALOG_DIR, legacyFile=LEGACY_FILE):
+    '''
+    partsInfo list from the catalog directory, or from the old pickle when the
+    directory has no catalog.
+    '''
+    if os.path.isfile(os.path.join(path, 'meta.json')):
+        return load_catalog(path).partsInfo()
+    return load_legacy(legacyFile)
+
+
+if __name__ == "__main__":
+    csvFiles = [arg for arg in sys.argv[1:] if arg.lower().endswith('.csv')]
+    others = [arg for arg in sys.argv[1:] if not arg.lower().endswith('.csv')]
+    if csvFiles:
+        path = others[0] if others else CATALOG_DIR
+        meta = catalog_from_csv(csvFiles, path)
+    else:
+        legacyFile = others[0] if others else LEGACY_FILE
+        path = others[1] if len(others) > 1 else CATALOG_DIR
+        meta = from_parts_info(load_legacy(legacyFile), path, source=os.path.basename(legacyFile))
+    print('Wrote ' + str(meta['nParts']) + ' parts to ' + path)
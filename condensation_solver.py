@@ -0,0 +1,556 @@
+'''
+Static condensation solver - Python backend for the assembly stiffness
+
+Every substructure in the catalog is a linear superelement, and the assembly
+built by 'AssemblyModifyEdit.py' is just those superelements tied on shared
+edges, with an encastre bottom edge and a rigid body tied to the top edge. This
+module assembles the same system with scipy.sparse and solves the 'MOVE_RP'
+load cases of assembly_config.py directly, returning k_xy and k_theta in
+milliseconds. It doubles as a local stand-in for Abaqus (see
+'kill_code.py --batch --backend python'), so the pipeline can run and be
+benchmarked without a license. Run that way (or by eval_server.py), its runs
+are logged to resultsPython.bin (results_log.STAND_IN_FILE), apart from the
+results log of the Abaqus runs that cross_check compares against.
+
+Superelement model:
+    Each part is reduced to one retained node per edge (Left, Bottom, Right,
+    Top), with in-plane DOFs u1, u2, ur3, i.e. a 12x12 retained-DOF stiffness
+    matrix. Unless a matrix is supplied, it is generated from the part's catalog
+    attributes: four arms (axial ka, transverse kt, rotational kr) joining the
+    edge nodes to an internal centre node, which is then condensed out. The arm
+    stiffnesses are calibrated so that a single part with the bottom edge fixed
+    and the top edge driven like MOVE_RP reproduces the catalog K_xy, K_y and
+    K_theta exactly. The horizontal arms use the same stiffnesses as the
+    vertical ones (the catalog has no x-direction data).
+
+Stresses are estimated from the catalog stress of each part for the standalone
+run of the same load case (maxMises1 for X_DISP, maxMises3 for ROT), scaled by
+the square root of the strain energy of the cell relative to that of the part
+alone in the load case (stress_scales): a single-part assembly reproduces its
+catalog stresses. They are only meant for the yield check of the stand-in.
+
+Files needed:
+    -catalog/ (or partsInfo.p) - substructure catalog, see catalog.py
+    -assembly_config.py, nearest_match.py, grid_connectivity.py, results_log.py, timing.py
+
+Usage (cross-check against the catalog and the recorded Abaqus runs):
+    python condensation_solver.py
+'''
+
+import time
+
+import numpy as np
+import scipy.sparse as sps
+import scipy.sparse.linalg as spla
+
+import assembly_config
+from catalog import load_parts_info
+from nearest_match import nearestMatch, partName
+from grid_connectivity import gridTopology, setOrder
+from results_log import OK, YIELDED, ResultsLog, record_evaluation
+import timing
+
+
+# Retained node order of a superelement (same order as the connectivity lists)
+SIDES = setOrder
+# DOF order of every node
+DOFS = ['u1', 'u2', 'ur3']
+# Catalog stress (row of maxMises1..3) of the standalone run of every load case
+STANDALONE_STRESS = {'X_DISP': 0, 'ROT': 2}
+# Load cases in the order of the columns of stress_scales
+STRESS_CASES = ['X_DISP', 'ROT']
+
+
+def rigid_map(dx, dy):
+    '''Maps node a DOFs to the rigid body motion of a point offset by (dx, dy).'''
+    return np.array([[1., 0., -dy],
+                     [0., 1., dx],
+                     [0., 0., 1.]])
+
+
+def arm_stiffness(k, dx, dy):
+    '''6x6 stiffness of an arm from node a to node b = a + (dx, dy).
+
+    k is the 3x3 stiffness of the deformation u_b - rigid_map(dx, dy) u_a,
+    which makes the arm free of rigid body modes.'''
+    B = np.hstack([-rigid_map(dx, dy), np.eye(3)])
+    return B.T.dot(k).dot(B)
+
+
+def node_offsets(dim):
+    '''Positions of the retained nodes relative to the centre of a cell.'''
+    a = (dim[3] - dim[0])/2.
+    b = (dim[4] - dim[1])/2.
+    return {'Left': (-a, 0.), 'Bottom': (0., -b), 'Right': (a, 0.), 'Top': (0., b)}
+
+
+def catalog_superelement(K_xy, K_y, K_theta, dim=None):
+    '''
+    Retained-DOF (12x12) stiffness of one part, generated from its catalog attributes.
+
+    K_xy, K_y, K_theta: FLOAT - catalog stiffnesses of the part
+    dim: LIST - [minX,minY,minZ,maxX,maxY,maxZ] of a cell
+    '''
+    if dim is None:
+        dim = assembly_config.dim
+    # Arm deformations are measured at the centre node, so two arms in series
+    # between the bottom and the top edge give exactly half their stiffness
+    kt = 2.*K_xy
+    ka = 2.*K_y
+    kr = 2.*K_theta
+    offsets = node_offsets(dim)
+
+    # Centre node first, then the retained nodes; every arm runs from its
+    # edge node to the centre
+    K = np.zeros((15, 15))
+    for i, side in enumerate(SIDES):
+        dx, dy = offsets[side]
+        if side in ('Bottom', 'Top'):
+            k = np.diag([kt, ka, kr])
+        else:
+            k = np.diag([ka, kt, kr])
+        dofs = np.r_[3*(i+1):3*(i+2), 0:3]
+        K[np.ix_(dofs, dofs)] += arm_stiffness(k, -dx, -dy)
+    # Condense the centre node out
+    Kcc, Kcr, Krr = K[:3, :3], K[:3, 3:], K[3:, 3:]
+    return Krr - Kcr.T.dot(np.linalg.solve(Kcc, Kcr))
+
+
+def catalog_superelements(partsInfo, dim=None):
+    '''Superelements of every part of the catalog, shape (nParts, 12, 12).'''
+    atts = np.array(partsInfo[4], dtype=float) # K_xy, K_y, K_theta, mass
+    return np.array([catalog_superelement(atts[0, i], atts[1, i], atts[2, i], dim)
+                     for i in range(atts.shape[1])])
+
+
+class AssemblyModel(object):
+    '''
+    Global DOF numbering of an assembly grid: tied retained nodes share DOFs,
+    bottom edge nodes are fixed and top edge nodes follow the rigid body
+    reference point (last three reduced DOFs).
+
+    assemblyDim: LIST - [cells in x, cells in y]
+    dim: LIST - [minX,minY,minZ,maxX,maxY,maxZ] of a cell
+    topology: GridTopology - gridTopology(assemblyDim) when None; cells that
+              are masked out carry no stiffness (their rows of cellNodes are -1)
+              and x-periodic grids tie the last column back to the first
+    '''
+
+    def __init__(self, assemblyDim=None, dim=None, topology=None):
+        if assemblyDim is None:
+            assemblyDim = assembly_config.assemblyDim
+        if dim is None:
+            dim = assembly_config.dim
+        if topology is None:
+            topology = gridTopology(assemblyDim)
+        if topology.periodic[1]:
+            raise ValueError('The bottom and top edges carry the boundary conditions, the grid cannot wrap in y')
+        self.assemblyDim = assemblyDim
+        self.dim = dim
+        self.topology = topology
+        nCells = assemblyDim[0]*assemblyDim[1]
+        self.nCells = nCells
+        self.present = topology.present
+
+        # Merge tied nodes (cell, side) with a union-find
+        parent = list(range(4*nCells))
+        def root(i):
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+        for cell, k, neighbour, opposite in topology.edges:
+            a = root(4*cell + k)
+            b = root(4*neighbour + opposite)
+            parent[max(a, b)] = min(a, b)
+        numbering = {}
+        self.cellNodes = -np.ones((nCells, 4), dtype=int)
+        for cell in topology.cells:
+            for k in range(4):
+                self.cellNodes[cell, k] = numbering.setdefault(root(4*cell + k), len(numbering))
+        self.nNodes = len(numbering)
+
+        # Node positions, cells ordered as in instanceAssembly (y fastest)
+        xLength = dim[3] - dim[0]
+        yLength = dim[4] - dim[1]
+        offsets = node_offsets(dim)
+        self.nodeXY = np.zeros((self.nNodes, 2))
+        self.cellXY = np.zeros((nCells, 2))
+        for cell in range(nCells):
+            x, y = divmod(cell, assemblyDim[1])
+            self.cellXY[cell] = (xLength*x, yLength*y)
+            if not self.present[cell]:
+                continue
+            for k, side in enumerate(SIDES):
+                self.nodeXY[self.cellNodes[cell, k]] = self.cellXY[cell] + offsets[side]
+        # Encastre bottom edges and top edges tied to the rigid body
+        bottom = set(self.cellNodes[topology.boundaryCells('Bottom'), SIDES.index('Bottom')])
+        top = set(self.cellNodes[topology.boundaryCells('Top'), SIDES.index('Top')])
+
+        # Rigid body reference point, placed as in defineRigidBody
+        xMin = dim[0]
+        xMax = dim[3]+(assemblyDim[0]-1)*xLength
+        self.refPoint = ((xMax-xMin)/2.0+dim[0], dim[4]+(assemblyDim[1]-1)*yLength)
+
+        # Reduced DOFs: free nodes, then the reference point
+        free = [n for n in range(self.nNodes) if n not in bottom and n not in top]
+        self.nReduced = 3*len(free) + 3
+        self.rpDofs = np.arange(self.nReduced-3, self.nReduced)
+        self.interiorDofs = np.arange(self.nReduced-3)
+        rows, cols, vals = [], [], []
+        for i, n in enumerate(free):
+            for d in range(3):
+                rows.append(3*n+d); cols.append(3*i+d); vals.append(1.)
+        for n in top:
+            A = rigid_map(self.nodeXY[n, 0]-self.refPoint[0], self.nodeXY[n, 1]-self.refPoint[1])
+            for d in range(3):
+                for e in range(3):
+                    if A[d, e] != 0.:
+                        rows.append(3*n+d); cols.append(self.rpDofs[e]); vals.append(A[d, e])
+        self.T = sps.csr_matrix((vals, (rows, cols)), shape=(3*self.nNodes, self.nReduced))
+
+        # Scatter pattern of the (present) cell matrices into the global matrix
+        cellDofs = (3*self.cellNodes[:, :, None] + np.arange(3)).reshape(nCells, 12)
+        self.cellDofs = cellDofs
+        self.scatterRows = np.repeat(cellDofs[self.present], 12, axis=1).ravel()
+        self.scatterCols = np.tile(cellDofs[self.present], (1, 12)).ravel()
+
+    def stiffness(self, cellMatrices):
+        '''Reduced global stiffness (free nodes + reference point) for the
+        cell superelements, shape (nCells, 12, 12).'''
+        K = sps.coo_matrix((np.asarray(cellMatrices)[self.present].ravel(),
+                            (self.scatterRows, self.scatterCols)),
+                           shape=(3*self.nNodes, 3*self.nNodes)).tocsr()
+        return (self.T.T.dot(K).dot(self.T)).tocsc()
+
+    def cell_deformations(self, u):
+        '''Deformation (top edge relative to bottom edge) of every cell for the
+        reduced displacement vector u, shape (nCells, 3).'''
+        full = self.T.dot(u).reshape(self.nNodes, 3)
+        offsets = node_offsets(self.dim)
+        A = rigid_map(0., offsets['Top'][1]-offsets['Bottom'][1])
+        uBottom = full[self.cellNodes[:, SIDES.index('Bottom')]]
+        uTop = full[self.cellNodes[:, SIDES.index('Top')]]
+        deformations = uTop - uBottom.dot(A.T)
+        deformations[~self.present] = 0.
+        return deformations
+
+    def cell_energies(self, u, cellMatrices):
+        '''Strain energy measure u_e^T K_e u_e of every cell for the reduced
+        displacement vector u and the cell superelements, shape (nCells,).'''
+        full = self.T.dot(u)
+        ue = full[self.cellDofs]
+        energies = np.einsum('ci,cij,cj->c', ue, np.asarray(cellMatrices), ue)
+        energies[~self.present] = 0.
+        return np.maximum(energies, 0.)
+
+
+def load_case_dofs(model, bcValues):
+    '''Prescribed reduced DOFs, their values and the free DOFs of a load case.'''
+    prescribed = np.array([model.rpDofs[DOFS.index(dof)] for dof in DOFS if dof in bcValues])
+    values = np.array([bcValues[dof] for dof in DOFS if dof in bcValues], dtype=float)
+    free = np.setdiff1d(np.arange(model.nReduced), prescribed)
+    return prescribed, values, free
+
+
+def solve_load_case(K, model, bcValues):
+    '''
+    Solves one 'MOVE_RP' load case.
+
+    K: sparse matrix - reduced global stiffness (AssemblyModel.stiffness)
+    model: AssemblyModel
+    bcValues: DICT - prescribed reference point DOFs, e.g. {'u1':1E-6,'u2':0.0,'ur3':0.0};
+              DOFs that are not listed are free
+
+    Returns the reduced displacement vector and the reaction at the reference point.
+    '''
+    prescribed, values, free = load_case_dofs(model, bcValues)
+    K = K.tocsr()
+    Kff = K[free][:, free].tocsc()
+    Kfp = K[free][:, prescribed]
+    u = np.zeros(model.nReduced)
+    u[prescribed] = values
+    u[free] = spla.splu(Kff).solve(-Kfp.dot(values))
+    reaction = K[model.rpDofs].dot(u)
+    return u, reaction
+
+
+def condense_reference_point(K, model, factor=None):
+    '''
+    Static condensation of the reduced stiffness onto the reference point.
+
+    The interior DOFs (everything but the reference point) are factorized once
+    and solved for the three unit reference point motions, which covers every
+    'MOVE_RP' load case: K_ii X = -K_ir and S = K_rr + K_ri X.
+
+    K: sparse matrix - reduced global stiffness (AssemblyModel.stiffness)
+    model: AssemblyModel
+    factor: splu of K_ii, factorized here when None
+
+    Returns S (3x3 reference point stiffness) and X (interior displacements
+    per unit reference point DOF, shape (nReduced-3, 3)).
+    '''
+    K = K.tocsr()
+    interior, rp = model.interiorDofs, model.rpDofs
+    Kir = K[interior][:, rp].toarray()
+    if factor is None:
+        factor = spla.splu(K[interior][:, interior].tocsc())
+    X = factor.solve(-Kir)
+    S = K[rp][:, rp].toarray() + Kir.T.dot(X)
+    return S, X
+
+
+def solve_condensed(S, X, model, bcValues):
+    '''
+    Solves one 'MOVE_RP' load case from the condensed system (see
+    condense_reference_point). Reference point DOFs that are not prescribed are
+    free: S_qq u_q = -S_qp u_p.
+
+    Returns the reduced displacement vector and the reaction at the reference
+    point, like solve_load_case.
+    '''
+    prescribed = [DOFS.index(dof) for dof in DOFS if dof in bcValues]
+    free = [d for d in range(3) if d not in prescribed]
+    uRP = np.zeros(3)
+    uRP[prescribed] = [bcValues[DOFS[d]] for d in prescribed]
+    if free:
+        uRP[free] = np.linalg.solve(S[np.ix_(free, free)], -S[np.ix_(free, prescribed)].dot(uRP[prescribed]))
+    u = np.zeros(model.nReduced)
+    u[model.interiorDofs] = X.dot(uRP)
+    u[model.rpDofs] = uRP
+    return u, S.dot(uRP)
+
+
+def stress_scales(superelements, stresses, dim=None):
+    '''
+    Stress per square root of strain energy of every part in every load case
+    of STRESS_CASES, shape (nParts, 2): the catalog stress of the standalone
+    run of the load case (STANDALONE_STRESS) over the square root of the
+    strain energy of the part alone (1x1 assembly) in that load case.
+
+    superelements: ARRAY - (nParts, 12, 12) retained-DOF stiffness of every part
+    stresses: ARRAY - (nParts, 3) catalog maxMises1..3
+    '''
+    single = AssemblyModel(assemblyDim=[1,1], dim=dim)
+    scales = np.zeros((len(superelements), len(STRESS_CASES)))
+    for i, superelement in enumerate(superelements):
+        S, X = condense_reference_point(single.stiffness(superelement[None]), single)
+        for j, case in enumerate(STRESS_CASES):
+            u, _ = solve_condensed(S, X, single, assembly_config.loadCases[case])
+            energy = single.cell_energies(u, superelement[None])[0]
+            scales[i, j] = stresses[i, STANDALONE_STRESS[case]]/np.sqrt(max(energy, 1E-300))
+    return scales
+
+
+def estimate_mises(model, u, cellMatrices, cellScales):
+    '''Estimated max von Mises stress of every cell: the square root of its
+    strain energy times the stress scale of its part for the load case
+    (cellScales, shape (nCells,), see stress_scales).'''
+    return np.sqrt(model.cell_energies(u, cellMatrices))*cellScales
+
+
+def solve_assembly(partIndices, superelements, stressScales=None, model=None):
+    '''
+    k_xy and k_theta (and estimated stresses) of one assembly. Both load cases
+    are solved from a single factorization (condense_reference_point).
+
+    partIndices: ARRAY of INT - catalog index of the part in every cell
+    superelements: ARRAY - (nParts, 12, 12) retained-DOF stiffness of every part
+    stressScales: ARRAY - (nParts, 2) stress_scales of every part, or None to
+                  skip stresses
+    model: AssemblyModel - reused between calls for the same grid
+
+    Returns k_xy, maxMises1, k_theta, maxMises2 (stresses are -1.0 if skipped).
+    '''
+    if model is None:
+        model = AssemblyModel()
+    partIndices = np.asarray(partIndices)[:model.nCells]
+    cellMatrices = superelements[partIndices]
+    K = model.stiffness(cellMatrices)
+    # One factorization for both load cases
+    S, X = condense_reference_point(K, model)
+    cellScales = None if stressScales is None else stressScales[partIndices]
+    return load_case_results(model, lambda bcValues: solve_condensed(S, X, model, bcValues),
+                             cellMatrices, cellScales)
+
+
+def load_case_results(model, solve, cellMatrices=None, cellScales=None):
+    '''
+    Runs both 'MOVE_RP' load cases with solve(bcValues) -> (u, reaction) and
+    extracts k_xy, maxMises1, k_theta, maxMises2 like odbPostProcess.
+
+    cellMatrices: ARRAY - (nCells, 12, 12) superelement of every cell
+    cellScales: ARRAY - (nCells, 2) stress_scales of the part in every cell,
+                or None to skip stresses (reported as -1.0)
+    '''
+    xDisp = assembly_config.loadCases['X_DISP']
+    u, reaction = solve(xDisp)
+    k_xy = reaction[0]/xDisp['u1']
+    maxMises1 = -1.0
+    if cellScales is not None:
+        maxMises1 = estimate_mises(model, u, cellMatrices,
+                                   cellScales[:, STRESS_CASES.index('X_DISP')]).max()
+
+    rotate = assembly_config.loadCases['ROT']
+    u, reaction = solve(rotate)
+    k_theta = reaction[2]/rotate['ur3']
+    maxMises2 = -1.0
+    if cellScales is not None:
+        maxMises2 = estimate_mises(model, u, cellMatrices,
+                                   cellScales[:, STRESS_CASES.index('ROT')]).max()
+    return k_xy, maxMises1, k_theta, maxMises2
+
+
+class CondensationBackend(object):
+    '''
+    Stand-in for the Abaqus batch: evaluates design vectors in-process and
+    returns the same result dictionaries as runAssembly in 'AssemblyModifyEdit.py'.
+
+    partsInfo: LIST - catalog read from partsInfo.p
+    superelements: ARRAY - (nParts, 12, 12) part matrices; generated from the
+                   catalog attributes when None
+    incremental: BOOL - reuse factorizations between assemblies with low-rank
+                 updates (incremental_solver.py)
+    '''
+
+    def __init__(self, partsInfo, superelements=None, assemblyDim=None, dim=None,
+                 incremental=False):
+        self.partsInfo = partsInfo
+        self.model = AssemblyModel(assemblyDim, dim)
+        if superelements is None:
+            superelements = catalog_superelements(partsInfo, self.model.dim)
+        self.superelements = superelements
+        self.stressScales = stress_scales(superelements, np.array(partsInfo[5], dtype=float).T,
+                                          self.model.dim)
+        self.partIndex = dict((partName(partsInfo, i), i) for i in range(len(partsInfo[1])))
+        self.incremental = None
+        if incremental:
+            from incremental_solver import IncrementalSolver
+            self.incremental = IncrementalSolver(superelements, self.stressScales, self.model)
+
+    def solve(self, partIndices):
+        '''k_xy, maxMises1, k_theta, maxMises2 of the assembly of catalog parts.'''
+        if self.incremental is not None:
+            return self.incremental.solve(partIndices)
+        return solve_assembly(partIndices, self.superelements, self.stressScales, self.model)
+
+    def evaluate(self, desiredAttributes, indNum=None, record=True, generation=None):
+        '''Result dictionary for one design vector. With record, the run is
+        appended to the results log (results_log.py) like an Abaqus run, with
+        its generation (current_generation() when None).'''
+        desiredAttributes = np.array(desiredAttributes, dtype=float).flatten()
+        timer = timing.StageTimer(indNum, trace=record)
+        with timer:
+            with timing.stage('match'):
+                newSubstructures, actDVs, actAMs, mass = nearestMatch(
+                    desiredAttributes.copy(), self.partsInfo, desiredComp=np.array([0,1,2]), partsInfoIndex=3)
+                partIndices = np.array([self.partIndex[name] for name in newSubstructures])
+            with timing.stage('solve'):
+                k_xy, maxMises1, k_theta, maxMises2 = self.solve(partIndices)
+        if maxMises2 > assembly_config.yieldStress:
+            output = list(assembly_config.penaltyOutputs)
+        else:
+            output = [k_xy, -k_theta, -mass]
+        result = {'outputs':output, 'k_xy':k_xy, 'maxMises1':maxMises1,
+                  'k_theta':k_theta, 'maxMises2':maxMises2, 'mass':mass}
+        if record:
+            record_evaluation(desiredAttributes, result, partIndices, actDVs, actAMs, indNum,
+                              wall=timer.wall, cpu=timer.cpu, generation=generation)
+        return result
+
+    def evaluate_batch(self, designs, ids=None, generation=None):
+        '''Result dictionaries for every row of designs (like 'AssemblyModifyEdit.py -- batch').'''
+        if ids is None:
+            ids = [None]*len(designs)
+        return [self.evaluate(design, indNum, generation=generation)
+                for design, indNum in zip(designs, ids)]
+
+
+def recorded_runs(partsInfo, assemblyFile='AssemblyOutput.txt', plottingFile='PlottingInfo.txt',
+                  logFile=None):
+    '''
+    Completed runs, from the results log (results_log.py) when it holds any:
+    the records with status OK or YIELDED. Otherwise from the text records,
+    pairing the non-penalty rows of AssemblyOutput.txt with the PlottingInfo.txt
+    entries that hold actual DVs (both are appended in the same order by every
+    completed run).
+
+    Returns a list of (part indices, k_xy, k_theta, maxMises2).
+    '''
+    records = ResultsLog(logFile).records()
+    if len(records):
+        completed = records[np.isin(records['status'], [OK, YIELDED])]
+        return [(np.array(record['parts']), float(record['k_xy']), float(record['k_theta']),
+                 float(record['maxMises2'])) for record in completed]
+    try:
+        outputs = np.atleast_2d(np.genfromtxt(assemblyFile, delimiter=',', skip_header=1))
+        entries = open(plottingFile).read().split('\n')[1:]
+    except (IOError, OSError, ValueError):
+        return []
+    outputs = [row for row in outputs if row.size == 5 and row[1] != -1.0]
+    dvs = []
+    for entry in entries:
+        fields = entry.strip().split(';')
+        if len(fields) >= 4 and fields[2]:
+            dvs.append(np.array(fields[2].split(','), dtype=float).reshape(-1, 3))
+    catalogDVs = np.array(partsInfo[3], dtype=float).T
+    runs = []
+    for row, cellDVs in zip(outputs, dvs):
+        distance = ((cellDVs[:, None, :] - catalogDVs[None, :, :])**2).sum(axis=2)
+        runs.append((distance.argmin(axis=1), row[0], row[2], row[3]))
+    return runs
+
+
+def cross_check(partsInfo):
+    '''
+    Compares the backend with the catalog (every part alone in a 1x1 assembly
+    must reproduce its K_xy, K_theta, maxMises1 and maxMises3) and with the
+    recorded Abaqus runs.
+    Prints and returns the worst relative errors.
+    '''
+    superelements = catalog_superelements(partsInfo)
+    atts = np.array(partsInfo[4], dtype=float)
+    stresses = np.array(partsInfo[5], dtype=float)
+    scales = stress_scales(superelements, stresses.T)
+    single = AssemblyModel(assemblyDim=[1,1])
+    errors = {'catalog_k_xy':0., 'catalog_k_theta':0.,
+              'catalog_maxMises1':0., 'catalog_maxMises3':0.}
+    for i in range(atts.shape[1]):
+        k_xy, maxMises1, k_theta, maxMises2 = solve_assembly([i], superelements, scales, single)
+        errors['catalog_k_xy'] = max(errors['catalog_k_xy'], abs(k_xy/atts[0, i]-1.))
+        errors['catalog_k_theta'] = max(errors['catalog_k_theta'], abs(k_theta/atts[2, i]-1.))
+        errors['catalog_maxMises1'] = max(errors['catalog_maxMises1'],
+                                          abs(maxMises1/stresses[0, i]-1.))
+        errors['catalog_maxMises3'] = max(errors['catalog_maxMises3'],
+                                          abs(maxMises2/stresses[2, i]-1.))
+    print('Single parts vs catalog, max relative error: k_xy %.2e, k_theta %.2e, '
+          'maxMises1 %.2e, maxMises3 %.2e'
+          % (errors['catalog_k_xy'], errors['catalog_k_theta'],
+             errors['catalog_maxMises1'], errors['catalog_maxMises3']))
+
+    runs = recorded_runs(partsInfo)
+    if not runs:
+        print('No completed runs recorded in the results log or AssemblyOutput.txt/PlottingInfo.txt')
+    else:
+        model = AssemblyModel()
+        relative = []
+        for partIndices, k_xy_abq, k_theta_abq, _ in runs:
+            k_xy, _, k_theta, _ = solve_assembly(partIndices, superelements, model=model)
+            relative.append([k_xy/k_xy_abq-1., k_theta/k_theta_abq-1.])
+        relative = np.abs(np.array(relative))
+        errors['abaqus_k_xy'], errors['abaqus_k_theta'] = relative.max(axis=0)
+        print('%i recorded runs vs Abaqus, max relative error: k_xy %.2e, k_theta %.2e'
+              % (len(runs), errors['abaqus_k_xy'], errors['abaqus_k_theta']))
+    return errors
+
+
+if __name__ == "__main__":
+    partsInfo = load_parts_info()
+    cross_check(partsInfo)
+    backend = CondensationBackend(partsInfo)
+    design = np.loadtxt('input.txt', dtype=float)
+    startTime = time.perf_counter()
+    for i in range(100):
+        result = backend.evaluate(design, record=False)
+    print(result)
+    print(str((time.perf_counter()-startTime)/100.) + ' seconds per evaluation')
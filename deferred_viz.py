@@ -0,0 +1,431 @@
+'''
+Deferred visualization
+
+visualizationFlag = 2 (assembly_config.py): instead of combining the odbs of
+every individual in the evaluation (odbCombineKernel.combineOdbs, about 15% of
+an evaluation with visualizationFlag = 1), runAssembly hands the master and
+substructure odbs of its jobs (jobName.odb, jobName_1.odb ...) to the archive
+(keep_odbs), which only keeps them for individuals on the current Pareto front
+of the archived ones:
+    -an infeasible individual, or one an archived individual dominates, keeps
+     nothing: its odbs are overwritten by the next evaluation
+    -otherwise its odbs are moved (renamed) into a directory of its own in the
+     archive, it is queued for combining, and the archived individuals it
+     dominates are evicted (their directories deleted)
+The combines run in a background Abaqus session started with a low priority
+('abq2018 cae noGUI=deferred_viz.py -- combine', start_worker), which takes the
+queued individuals one at a time, writes Combined_jobName.odb next to their
+odbs and then deletes the master and substructure odbs (the combined odb is
+all the visualization needs). All that is left on the critical path of an
+evaluation is the dominance check and a few renames ('combine' stage of the
+results log).
+
+The worker is detached from the session that starts it (new session/process
+group), so the supervisor (supervisor.py) does not wait for it or kill it with
+the evaluation. There is one worker per archive: worker.json in the archive
+records its process id (that of its launcher until it is up), and no other
+worker is started while that process is alive. Individuals left combining by a
+worker that died are queued again by the next one.
+
+The archive is the 'vizArchive' directory of the run (or the VIZ_ARCHIVE path,
+set by kill_code.py so that scratch directories share it), with index.json
+holding the objectives and state (queued, combining, combined, evict) of every
+archived individual (and the worker combining it). It is only changed under a
+file lock, so concurrent sessions (scheduler.py) and the combine workers can
+share it.
+
+Keep this file importable by both the Abaqus Python 2.7 interpreter and Python 3.
+
+Files needed:
+    -assembly_config.py - penalty outputs, Abaqus command, odbCombine plug-in path
+    -results_log.py - file lock
+
+Usage:
+    python deferred_viz.py [vizArchive]
+        lists the archived individuals (objectives, state, combined odbs)
+    abq2018 cae noGUI=deferred_viz.py -- combine [vizArchive]
+        combines the queued individuals (started by start_worker)
+'''
+
+import os
+import sys
+import json
+import errno
+import time
+import shutil
+import subprocess
+from contextlib import contextmanager
+
+import numpy as np
+
+import assembly_config
+from results_log import FileLock
+
+ARCHIVE_DIR = 'vizArchive'
+INDEX_FILE = 'index.json'
+LOCK_FILE = 'index.lock'
+WORKER_FILE = 'worker.json'
+QUEUED, COMBINING, COMBINED, EVICT = 'queued', 'combining', 'combined', 'evict'
+# Worker states: launched (process id of the launcher) and running (its own)
+STARTING, RUNNING = 'starting', 'running'
+# Windows creation flags of the combine worker: low priority, no console and
+# a process group of its own
+BELOW_NORMAL_PRIORITY_CLASS = 0x00004000
+DETACHED_PROCESS = 0x00000008
+CREATE_NEW_PROCESS_GROUP = 0x00000200
+# Windows process access right and exit code of a running process
+PROCESS_QUERY_LIMITED_INFORMATION = 0x1000
+STILL_ACTIVE = 259
+ERROR_ACCESS_DENIED = 5
+
+
+def archive_path(path=None):
+    if path is None:
+        path = os.environ.get('VIZ_ARCHIVE', ARCHIVE_DIR)
+    return path
+
+
+def combine_xml(masterOdb, odbNames):
+    '''Configuration of odbCombineKernel.combineOdbs: master odb and the
+    substructure odbs to combine into it.'''
+    xmlTemplate = """<?xml version="1.0" ?>"""
+    xmlTemplate += """\n<OdbInput>\n\t<MasterOdb Name="""+'"'+str(masterOdb)+'"/>'
+    for odbName in odbNames:
+        xmlTemplate += """\n\t<Odb Name="""+'"'+str(odbName)+'"/>'
+    xmlTemplate += """\n</OdbInput> """
+    return xmlTemplate
+
+
+def job_odbs(jobName, nCells, directory='.'):
+    '''Master and substructure odbs of a job (the files that exist).'''
+    names = [jobName+'.odb'] + [jobName+'_'+str(i)+'.odb' for i in range(1, nCells+1)]
+    return [name for name in names if os.path.isfile(os.path.join(directory, name))]
+
+
+def process_alive(pid):
+    '''True while the process pid runs (False for None).'''
+    if pid is None:
+        return False
+    if os.name == 'nt':
+        # os.kill would terminate the process on Windows
+        import ctypes
+        kernel32 = ctypes.windll.kernel32
+        handle = kernel32.OpenProcess(PROCESS_QUERY_LIMITED_INFORMATION, False, int(pid))
+        if not handle:
+            return kernel32.GetLastError() == ERROR_ACCESS_DENIED
+        code = ctypes.c_ulong()
+        try:
+            if not kernel32.GetExitCodeProcess(handle, ctypes.byref(code)):
+                return True
+            return code.value == STILL_ACTIVE
+        finally:
+            kernel32.CloseHandle(handle)
+    try:
+        # Reaps it when it is an exited child of this process (a zombie
+        # would still take signals)
+        if os.waitpid(int(pid), os.WNOHANG)[0] != 0:
+            return False
+    except OSError:
+        pass
+    try:
+        os.kill(int(pid), 0)
+    except OSError as err:
+        # EPERM: the process exists but belongs to someone else
+        return err.errno == errno.EPERM
+    return True
+
+
+def dominates(a, b):
+    '''True when the objectives a (minimized) dominate b, or equal them.'''
+    a, b = np.asarray(a, dtype=float), np.asarray(b, dtype=float)
+    return bool(np.all(a <= b))
+
+
+class VisualizationArchive(object):
+    '''
+    path: STR - archive directory (archive_path() when None)
+    '''
+
+    def __init__(self, path=None):
+        self.path = archive_path(path)
+
+    @contextmanager
+    def locked(self):
+        '''Index of the archive (DICT key -> entry), saved when the block exits.'''
+        if not os.path.isdir(self.path):
+            try:
+                os.makedirs(self.path)
+            except OSError:
+                pass
+        fd = os.open(os.path.join(self.path, LOCK_FILE), os.O_RDWR | os.O_CREAT)
+        try:
+            if os.fstat(fd).st_size == 0:
+                os.write(fd, b'0')
+            with FileLock(fd):
+                index = self.read_index()
+                yield index
+                with open(os.path.join(self.path, INDEX_FILE), 'w') as f:
+                    json.dump(index, f, indent=1)
+        finally:
+            os.close(fd)
+
+    def read_index(self):
+        try:
+            with open(os.path.join(self.path, INDEX_FILE)) as f:
+                return json.load(f)
+        except (IOError, OSError, ValueError):
+            return {}
+
+    def directory(self, key):
+        return os.path.join(self.path, 'ind_'+str(key))
+
+    def worker(self):
+        '''Registered combine worker {'pid', 'state'} or None (read under locked()).'''
+        try:
+            with open(os.path.join(self.path, WORKER_FILE)) as f:
+                return json.load(f)
+        except (IOError, OSError, ValueError):
+            return None
+
+    def set_worker(self, pid, state):
+        '''Registers the combine worker (under locked()).'''
+        with open(os.path.join(self.path, WORKER_FILE), 'w') as f:
+            json.dump({'pid':pid, 'state':state}, f)
+
+    def clear_worker(self):
+        '''Drops the registration of this process as the worker (under locked()).'''
+        worker = self.worker()
+        if worker is not None and worker['pid'] == os.getpid():
+            os.remove(os.path.join(self.path, WORKER_FILE))
+
+    def register_worker(self):
+        '''Registers this process as the combine worker of the archive.
+        Returns False when another worker is already running.'''
+        with self.locked():
+            worker = self.worker()
+            if (worker is not None and worker['state'] == RUNNING
+                    and worker['pid'] != os.getpid() and process_alive(worker['pid'])):
+                return False
+            self.set_worker(os.getpid(), RUNNING)
+        return True
+
+    def requeue_orphans(self, index):
+        '''Queues again the individuals left combining by a worker that died
+        (and evicts the ones that fell off the front meanwhile).'''
+        for key in list(index):
+            entry = index[key]
+            if entry['state'] in (COMBINING, EVICT) and not process_alive(entry.get('worker')):
+                if entry['state'] == EVICT:
+                    self.remove(index, key)
+                else:
+                    entry['state'] = QUEUED
+
+    def remove(self, index, key):
+        '''Evicts an archived individual (deferred while it is being combined).'''
+        if index[key]['state'] == COMBINING:
+            index[key]['state'] = EVICT
+            return
+        shutil.rmtree(self.directory(key), ignore_errors=True)
+        del index[key]
+
+    def keep(self, key, outputs, jobNames, nCells, workDir='.'):
+        '''
+        Archives the odbs of the jobs of an individual if it is on the front
+        of the archive (see module docstring).
+
+        key: INT or STR - individual number
+        outputs: LIST - [k_xy, -k_theta, -mass] (penalty outputs = infeasible)
+        jobNames: LIST - jobs of the individual, odbs read from workDir
+
+        Returns True when the individual was archived.
+        '''
+        outputs = np.asarray(outputs, dtype=float)
+        if np.all(outputs == np.asarray(assembly_config.penaltyOutputs, dtype=float)):
+            return False
+        objectives = (-outputs).tolist()
+        key = str(key)
+        with self.locked() as index:
+            for other, entry in index.items():
+                if entry['state'] != EVICT and dominates(entry['objectives'], objectives):
+                    return False
+            for other in [other for other, entry in index.items()
+                          if entry['state'] != EVICT and dominates(objectives, entry['objectives'])]:
+                self.remove(index, other)
+            directory = self.directory(key)
+            if os.path.isdir(directory):
+                shutil.rmtree(directory, ignore_errors=True)
+            os.makedirs(directory)
+            for jobName in jobNames:
+                for name in job_odbs(jobName, nCells, workDir):
+                    shutil.move(os.path.join(workDir, name), os.path.join(directory, name))
+            index[key] = {'objectives':objectives, 'jobs':list(jobNames), 'cells':nCells,
+                          'state':QUEUED}
+        return True
+
+    def pending(self):
+        '''Keys of the individuals queued for combining.'''
+        return [key for key, entry in self.read_index().items() if entry['state'] == QUEUED]
+
+    def claim(self):
+        '''Next queued individual (key, entry), marked as combining by this
+        process, or None. When there is none, the worker registration of this
+        process is dropped in the same lock, so the individuals queued after it
+        start a new worker.'''
+        with self.locked() as index:
+            self.requeue_orphans(index)
+            for key in sorted(index, key=lambda key: index[key]['objectives']):
+                if index[key]['state'] == QUEUED:
+                    index[key]['state'] = COMBINING
+                    index[key]['worker'] = os.getpid()
+                    return key, dict(index[key])
+            self.clear_worker()
+        return None
+
+    def finish(self, key, combined=True):
+        '''Marks a claimed individual as combined (queued again when the
+        combine failed), or evicts it if it fell off the front meanwhile.'''
+        with self.locked() as index:
+            if key not in index:
+                return
+            if index[key]['state'] == EVICT:
+                index[key]['state'] = COMBINED
+                self.remove(index, key)
+            else:
+                index[key]['state'] = COMBINED if combined else QUEUED
+
+    def combine_pending(self, combine=None):
+        '''
+        Combines the queued individuals until there are none left:
+        combine(directory, jobName, nCells) for every job (combine_odbs by
+        default). Returns the number of individuals combined (0 right away when
+        another worker is running).
+        '''
+        if combine is None:
+            combine = combine_odbs
+        if not self.register_worker():
+            return 0
+        count = 0
+        try:
+            while True:
+                claimed = self.claim()
+                if claimed is None:
+                    return count
+                key, entry = claimed
+                try:
+                    for jobName in entry['jobs']:
+                        combine(self.directory(key), jobName, entry['cells'])
+                except Exception as err:
+                    print('Combine of individual '+key+' failed: '+str(err))
+                    self.finish(key, combined=False)
+                    return count
+                self.finish(key)
+                count += 1
+        finally:
+            with self.locked():
+                self.clear_worker()
+
+
+def combine_odbs(directory, jobName, nCells):
+    '''
+    Combines the odbs of a job into Combined_jobName.odb in directory (Abaqus
+    CAE kernel), then deletes the master and substructure odbs.
+    '''
+    directory = os.path.abspath(directory)
+    names = job_odbs(jobName, nCells, directory)
+    if not names:
+        return
+    combined = os.path.join(directory, 'Combined_'+jobName)
+    xmlFileName = combined+'.xml'
+    with open(xmlFileName, 'w') as f:
+        f.write(combine_xml(os.path.join(directory, names[0]),
+                            [os.path.join(directory, name) for name in names[1:]]))
+    if os.path.exists(combined+'.odb'):
+        os.remove(combined+'.odb')
+    if assembly_config.odbCombinePath not in sys.path:
+        sys.path.insert(19, assembly_config.odbCombinePath)
+    import odbCombineKernel
+    odbCombineKernel.combineOdbs(jobName=combined, configName=xmlFileName, loadODB=0)
+    for name in names:
+        os.remove(os.path.join(directory, name))
+
+
+def keep_odbs(indNum, outputs, jobNames, nCells, path=None):
+    '''
+    Archives the odbs of an evaluated individual when it is on the front and
+    starts the combine worker if there is anything to combine (called by
+    runAssembly with visualizationFlag = 2).
+    '''
+    archive = VisualizationArchive(path)
+    key = indNum
+    if key is None: # single-mode run, numbered by the optimizer
+        key = 'run'+str(int(time.time()*1000))
+    try:
+        kept = archive.keep(key, outputs, jobNames, nCells)
+    except (IOError, OSError) as err:
+        # Visualization never fails an evaluation
+        print('Odbs of individual '+str(key)+' not archived: '+str(err))
+        return False
+    if kept:
+        start_worker(archive.path)
+    return kept
+
+
+def detach():
+    '''Runs in the worker before the command (POSIX): new session, low priority.'''
+    os.setsid()
+    os.nice(10)
+
+
+def start_worker(path=None):
+    '''
+    Starts a detached low-priority Abaqus session combining the queued
+    individuals of the archive, unless its worker (worker.json) is still
+    running. Returns the process id of the launcher, or None.
+    '''
+    archive = VisualizationArchive(path)
+    script = os.path.abspath(__file__).replace('.pyc', '.py')
+    command = (assembly_config.abaqusCommand+' cae noGUI="'+script+'" -- combine "'
+               +os.path.abspath(archive.path)+'"')
+    kwargs = {}
+    if os.name == 'nt':
+        kwargs['creationflags'] = (BELOW_NORMAL_PRIORITY_CLASS | DETACHED_PROCESS
+                                   | CREATE_NEW_PROCESS_GROUP)
+    else:
+        # close_fds: the worker must not inherit the lock of the index
+        kwargs['preexec_fn'] = detach
+        kwargs['close_fds'] = True
+    with archive.locked():
+        worker = archive.worker()
+        if worker is not None and process_alive(worker['pid']):
+            return None
+        with open(os.devnull, 'r+') as devnull:
+            ps = subprocess.Popen(command, shell=True, stdin=devnull, stdout=devnull,
+                                  stderr=devnull, **kwargs)
+        archive.set_worker(ps.pid, STARTING)
+    return ps.pid
+
+
+def archive_report(path=None):
+    '''Text listing of the archived individuals.'''
+    archive = VisualizationArchive(path)
+    index = archive.read_index()
+    lines = [str(len(index))+' archived individuals in '+archive.path]
+    for key in sorted(index, key=lambda key: index[key]['objectives']):
+        entry = index[key]
+        outputs = -np.asarray(entry['objectives'])
+        combined = [name for name in os.listdir(archive.directory(key))
+                    if name.startswith('Combined_') and name.endswith('.odb')] \
+            if os.path.isdir(archive.directory(key)) else []
+        lines.append('  %-10s k_xy %.4e, k_theta %.4e, mass %.4f, %-9s %s'
+                     % (key, outputs[0], -outputs[1], -outputs[2], entry['state'],
+                        ' '.join(combined)))
+    return '\n'.join(lines)
+
+
+if __name__ == "__main__":
+    if 'combine' in sys.argv:
+        i = sys.argv.index('combine')
+        path = sys.argv[i+1] if len(sys.argv) > i+1 else None
+        print(str(VisualizationArchive(path).combine_pending()) + ' individuals combined')
+    else:
+        print(archive_report(sys.argv[1] if len(sys.argv) > 1 else None))
@@ -0,0 +1,149 @@
+'''
+Evaluation cache
+
+nearestMatch snaps every continuous design vector onto the substructure catalog,
+so many distinct design vectors from the optimizer produce the exact same
+assembly. This module stores the optimizer outputs ([k_xy, -k_theta, -mass])
+of every completed Abaqus run on disk, keyed by the ordered snapped part names
+plus the model settings in 'assembly_config.py' (dim, assemblyDim, load cases,
+and the yield stress and penalty outputs the outputs are penalized against),
+so that kill_code.py can answer repeated assemblies without starting Abaqus.
+
+The store is a single SQLite file, which makes it safe to share between
+concurrent evaluations (each access opens its own short-lived connection and
+SQLite serializes the writers). When the number of entries exceeds max_entries,
+the least recently used entries are evicted. Hit/miss counters are kept in the
+same file so that they cover every process that used the cache.
+
+Files needed:
+    -assembly_config.py - model parameters that are part of the cache key
+
+Usage (prints the cache statistics):
+    python eval_cache.py [cache file]
+'''
+
+import os
+import sys
+import time
+import json
+import sqlite3
+import hashlib
+import contextlib
+
+import assembly_config
+
+
+def make_key(part_names, assemblyDim=None, dim=None, loadCases=None,
+             yieldStress=None, penaltyOutputs=None):
+    '''Hash of the snapped assembly and every setting that changes its result.'''
+    if assemblyDim is None:
+        assemblyDim = assembly_config.assemblyDim
+    if dim is None:
+        dim = assembly_config.dim
+    if loadCases is None:
+        loadCases = assembly_config.loadCases
+    if yieldStress is None:
+        yieldStress = assembly_config.yieldStress
+    if penaltyOutputs is None:
+        penaltyOutputs = assembly_config.penaltyOutputs
+    description = json.dumps({'parts': [str(name) for name in part_names],
+                              'assemblyDim': [int(n) for n in assemblyDim],
+                              'dim': [float(d) for d in dim],
+                              'loadCases': loadCases,
+                              'yieldStress': float(yieldStress),
+                              'penaltyOutputs': [float(v) for v in penaltyOutputs]},
+                             sort_keys=True)
+    return hashlib.sha1(description.encode('utf-8')).hexdigest()
+
+
+class EvaluationCache(object):
+    '''
+    Persistent, size-bounded store of evaluation outputs.
+
+    cache_file: STR - SQLite file holding the results
+    max_entries: INT - entries kept before least recently used ones are evicted
+                       (None = unbounded)
+    timeout: FLOAT - seconds to wait on a lock held by another evaluation
+    '''
+
+    def __init__(self, cache_file='evalCache.db', max_entries=100000, timeout=60.):
+        self.cache_file = cache_file
+        self.max_entries = max_entries
+        self.timeout = timeout
+        with self._connect() as db:
+            db.execute('CREATE TABLE IF NOT EXISTS results ('
+                       'key TEXT PRIMARY KEY, parts TEXT, outputs TEXT, '
+                       'created REAL, last_access REAL)')
+            db.execute('CREATE INDEX IF NOT EXISTS results_last_access '
+                       'ON results (last_access)')
+            db.execute('CREATE TABLE IF NOT EXISTS stats ('
+                       'name TEXT PRIMARY KEY, value INTEGER)')
+            db.executemany('INSERT OR IGNORE INTO stats VALUES (?, 0)',
+                           [('hits',), ('misses',), ('evictions',)])
+
+    @contextlib.contextmanager
+    def _connect(self):
+        # One short-lived connection per access; committed on success
+        db = sqlite3.connect(self.cache_file, timeout=self.timeout)
+        try:
+            db.execute('PRAGMA journal_mode=WAL')
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    def get(self, key):
+        '''Cached outputs for key, or None on a miss.'''
+        with self._connect() as db:
+            row = db.execute('SELECT outputs FROM results WHERE key = ?',
+                             (key,)).fetchone()
+            if row is None:
+                db.execute("UPDATE stats SET value = value + 1 WHERE name = 'misses'")
+                return None
+            db.execute('UPDATE results SET last_access = ? WHERE key = ?',
+                       (time.time(), key))
+            db.execute("UPDATE stats SET value = value + 1 WHERE name = 'hits'")
+        return json.loads(row[0])
+
+    def put(self, key, outputs, part_names=()):
+        '''Store the outputs of a completed run and evict if over capacity.'''
+        now = time.time()
+        with self._connect() as db:
+            db.execute('INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?)',
+                       (key, json.dumps([str(name) for name in part_names]),
+                        json.dumps([float(value) for value in outputs]), now, now))
+        self.evict()
+
+    def evict(self, max_entries=None):
+        '''Drop least recently used entries until at most max_entries remain.'''
+        if max_entries is None:
+            max_entries = self.max_entries
+        if max_entries is None:
+            return 0
+        with self._connect() as db:
+            entries = db.execute('SELECT COUNT(*) FROM results').fetchone()[0]
+            excess = entries - max_entries
+            if excess <= 0:
+                return 0
+            db.execute('DELETE FROM results WHERE key IN (SELECT key FROM results '
+                       'ORDER BY last_access LIMIT ?)', (excess,))
+            db.execute("UPDATE stats SET value = value + ? WHERE name = 'evictions'",
+                       (excess,))
+        return excess
+
+    def stats(self):
+        '''Hit/miss/eviction counters, current size and hit rate.'''
+        with self._connect() as db:
+            stats = dict(db.execute('SELECT name, value FROM stats').fetchall())
+            stats['entries'] = db.execute('SELECT COUNT(*) FROM results').fetchone()[0]
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits']/float(lookups) if lookups else 0.
+        return stats
+
+
+if __name__ == "__main__":
+    cache_file = sys.argv[1] if len(sys.argv) > 1 else 'evalCache.db'
+    if not os.path.exists(cache_file):
+        print('No cache at ' + cache_file)
+    else:
+        print(EvaluationCache(cache_file).stats())
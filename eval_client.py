@@ -0,0 +1,68 @@
+'''
+Evaluation client
+
+Sends design vectors to a running evaluation server ('eval_server.py') and
+returns the objectives. See eval_server.py for the protocol.
+
+Usage (from MATLAB's system, when tcpclient is not available):
+    python eval_client.py [--port 50007 | --unix eval.sock] [input.mat] [output.mat]
+        evaluates every row of x in input.mat and writes outputs to output.mat
+'''
+
+import sys
+import socket
+
+import numpy as np
+
+from eval_server import DEFAULT_PORT, send_matrix, recv_matrix, server_address
+
+
+class EvaluationClient(object):
+    '''
+    Connection to an evaluation server, kept open between requests.
+
+    port: INT - TCP port on the loopback interface
+    unix: STR - Unix socket path (used instead of the port when given)
+    '''
+
+    def __init__(self, port=DEFAULT_PORT, unix=None):
+        if unix is not None:
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.sock.connect(unix)
+        else:
+            self.sock = socket.create_connection(('127.0.0.1', port))
+            self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def evaluate(self, designs):
+        '''Outputs matrix ([k_xy, -k_theta, -mass] per row) for the design vectors.'''
+        send_matrix(self.sock, np.atleast_2d(designs))
+        outputs = recv_matrix(self.sock)
+        if outputs is None:
+            raise IOError('Evaluation server closed the connection')
+        return outputs
+
+    def close(self):
+        send_matrix(self.sock, np.zeros((0, 0)))
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def evaluate(designs, port=DEFAULT_PORT, unix=None):
+    '''One-off request (opens and closes a connection).'''
+    with EvaluationClient(port, unix) as client:
+        return client.evaluate(designs)
+
+
+if __name__ == "__main__":
+    import scipy.io
+    files = [arg for arg in sys.argv[1:] if arg.endswith('.mat')]
+    input_mat = files[0] if files else 'input.mat'
+    output_mat = files[1] if len(files) > 1 else 'output.mat'
+    port, unix = server_address()
+    outputs = evaluate(np.array(scipy.io.loadmat(input_mat)['x'], dtype=float), port, unix)
+    scipy.io.savemat(output_mat, mdict={'outputs': outputs})
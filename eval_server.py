@@ -0,0 +1,301 @@
+'''
+Evaluation server
+
+Long-lived evaluation process that keeps the catalog, the evaluation cache and
+the solver (the Abaqus CAE kernel, or the Python backend of
+'condensation_solver.py') warm between generations, and exchanges design
+vectors and objectives over a socket instead of the input.mat / input.txt /
+output.p / output.mat file relay.
+
+Protocol (little-endian, one request after another on the same connection):
+    request: uint32 rows, uint32 cols, rows*cols float64 - design vectors, row-major
+    reply:   uint32 rows, uint32 3,    rows*3 float64    - [k_xy, -k_theta, -mass] per row
+A request with rows = 0 closes the connection. Connections are served one
+after the other, in the main thread (the Abaqus kernel is not thread-safe).
+Individuals are numbered in the order the server receives them, and every
+request is one generation, both recorded in the results log (results_log.py).
+
+Every request is snapped onto the catalog, rows producing the same assembly are
+evaluated once, cached assemblies are not evaluated at all and neither are the
+ones the feasibility screen (feasibility_screen.py, when fitted) classifies as
+certain-fail, nor the ones the surrogate model (surrogate.py, when fitted) does
+not route to the solver (see evaluate_population, also used by
+'kill_code.py --batch').
+
+Keep this file importable by both the Abaqus Python 2.7 interpreter and Python 3.
+
+Files needed:
+    -catalog/ (or partsInfo.p), assembly_config.py, nearest_match.py, eval_cache.py,
+     feasibility_screen.py (feasibilityScreen.json when fitted), results_log.py,
+     surrogate.py (surrogate.npz when fitted)
+    -condensation_solver.py for the python backend
+
+Usage:
+    python eval_server.py [--port 50007 | --unix eval.sock] [--no-cache]
+        Python backend (condensation_solver.py), runs logged to resultsPython.bin
+        and cached in evalCachePython.db
+    abq2018 cae noGUI=AssemblyModifyEdit.py -- server [port=50007 | unix=eval.sock]
+        Abaqus backend, in one warm CAE session
+Clients: eval_client.py (Python), server_evaluation_function in
+'Optimizer_with_kill_code.m' (MATLAB tcpclient)
+'''
+
+import os
+import sys
+import struct
+import threading
+
+import numpy as np
+try:
+    import socketserver
+except ImportError: # Python 2
+    import SocketServer as socketserver
+
+import assembly_config
+from catalog import load_parts_info
+from nearest_match import catalogMatcher
+from eval_cache import EvaluationCache, make_key
+from feasibility_screen import CERTAIN_FAIL, load_screen
+from results_log import FAILED, PREDICTED, SCREENED, STAND_IN_FILE, record_failure
+from surrogate import load_surrogate
+
+
+DEFAULT_PORT = 50007
+# rows, cols of every message
+HEADER = struct.Struct('<II')
+FLOAT = np.dtype('<f8')
+
+
+def recv_exactly(sock, size):
+    '''Reads exactly size bytes (None if the peer closed the connection first).'''
+    chunks = []
+    while size > 0:
+        chunk = sock.recv(min(size, 1 << 20))
+        if not chunk:
+            return None
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
+
+
+def send_matrix(sock, matrix):
+    '''Sends a 2D float64 matrix (header + raw row-major buffer).'''
+    matrix = np.ascontiguousarray(matrix, dtype=FLOAT)
+    data = matrix.tobytes() if hasattr(matrix, 'tobytes') else matrix.tostring() # older numpy in Abaqus
+    sock.sendall(HEADER.pack(matrix.shape[0], matrix.shape[1]) + data)
+
+
+def recv_matrix(sock):
+    '''Receives a matrix sent by send_matrix (None if the connection was closed).'''
+    header = recv_exactly(sock, HEADER.size)
+    if header is None:
+        return None
+    rows, cols = HEADER.unpack(header)
+    data = recv_exactly(sock, rows*cols*FLOAT.itemsize) if rows*cols else b''
+    if data is None:
+        return None
+    return np.frombuffer(data, dtype=FLOAT).reshape(rows, cols)
+
+
+def write_penalty_record(outputs, indNum=None, partIndices=None, desiredAttributes=None,
+                         status=FAILED, generation=None):
+    """Appends a failed (screened or predicted) run to the results log"""
+    record_failure(outputs, indNum, partIndices, desiredAttributes, status,
+                   generation=generation)
+
+
+def evaluate_population(population, ids, partsInfo, evaluate_batch, cache=None, screen=None,
+                        surrogate=None, generation=None):
+    '''
+    Objectives of a population, evaluating every distinct snapped assembly once.
+
+    population: ARRAY - one design vector per row
+    ids: ARRAY of INT - individual numbers of the rows
+    partsInfo: LIST - catalog (catalog.load_parts_info)
+    evaluate_batch: FUNCTION - (designs, ids, generation) -> list of result
+                    dictionaries (see runAssembly in 'AssemblyModifyEdit.py'), None
+                    for failed rows; may return fewer results than rows (killed batch)
+    cache: EvaluationCache - skip (and store) evaluated assemblies, or None
+    screen: FeasibilityScreen - assemblies it classifies as certain-fail are
+            penalized without being evaluated (see feasibility_screen.py), or None
+    surrogate: Surrogate - refitted from the results log as it grows; the
+               assemblies it does not route to the solver get their predicted
+               outputs (see surrogate.py), or None
+    generation: INT - generation recorded with the runs of the population
+                (RESULTS_GENERATION of the process when None)
+
+    Returns the outputs matrix (one [k_xy, -k_theta, -mass] row per individual,
+    penalized for failed rows) and a dictionary of counts ('screened' and
+    'predicted' are the numbers of evaluations the screen and the surrogate
+    avoided).
+    '''
+    population = np.atleast_2d(np.array(population, dtype=float))
+    ids = np.asarray(ids)
+    matcher = catalogMatcher(partsInfo)
+    indices = matcher.indices(population)
+    part_names = [list(names) for names in matcher.names(indices)]
+    keys = [make_key(names) for names in part_names]
+    unique = {}
+    for row, key in enumerate(keys):
+        unique.setdefault(key, row)
+
+    results = {}
+    if cache is not None:
+        for key in unique:
+            cached = cache.get(key)
+            if cached is not None:
+                results[key] = cached
+    pending = [key for key in unique if key not in results]
+    counts = {'individuals':len(population), 'unique':len(unique),
+              'cached':len(unique)-len(pending), 'screened':0, 'predicted':0, 'evaluated':0,
+              'failed':0}
+
+    if screen is not None and pending:
+        classes = screen.classify_parts(indices[[unique[key] for key in pending]], partsInfo)
+        for key, screen_class in zip(list(pending), classes):
+            if screen_class == CERTAIN_FAIL:
+                # Not cached: the verdict depends on the current fit of the screen
+                row = unique[key]
+                results[key] = list(assembly_config.penaltyOutputs)
+                write_penalty_record(results[key], ids[row], indices[row], population[row],
+                                     SCREENED, generation)
+                pending.remove(key)
+                counts['screened'] += 1
+
+    if surrogate is not None and pending:
+        surrogate.update(partsInfo)
+        solve, predicted = surrogate.route(indices[[unique[key] for key in pending]], partsInfo)
+        for k, key in enumerate(list(pending)):
+            if not solve[k]:
+                # Not cached either: only a solve gives the outputs of an assembly
+                row = unique[key]
+                results[key] = list(predicted[k])
+                write_penalty_record(results[key], ids[row], indices[row], population[row],
+                                     PREDICTED, generation)
+                pending.remove(key)
+                counts['predicted'] += 1
+
+    if pending:
+        rows = [unique[key] for key in pending]
+        batch_results = evaluate_batch(population[rows], ids[rows], generation)
+        counts['evaluated'] = len(batch_results)
+        for i, key in enumerate(pending):
+            # Rows past a kill or that failed get dummy outputs
+            if i < len(batch_results) and batch_results[i] is not None:
+                results[key] = batch_results[i]['outputs']
+                # Only completed runs are cached; timeouts and crashes may not be repeatable
+                if cache is not None:
+                    cache.put(key, results[key], part_names[unique[key]])
+            else:
+                row = unique[key]
+                counts['failed'] += 1
+                results[key] = list(assembly_config.penaltyOutputs)
+                write_penalty_record(results[key], ids[row], indices[row], population[row],
+                                     generation=generation)
+
+    outputs = np.array([results[key] for key in keys], dtype=float)
+    return outputs, counts
+
+
+class EvaluationHandler(socketserver.BaseRequestHandler):
+    '''Answers requests of one client connection until it sends rows = 0.'''
+
+    def handle(self):
+        while True:
+            designs = recv_matrix(self.request)
+            if designs is None or len(designs) == 0:
+                return
+            send_matrix(self.request, self.server.evaluate(designs))
+
+
+class ReusableTCPServer(socketserver.TCPServer):
+    '''TCP server that can rebind its port right after a restart.'''
+    allow_reuse_address = True
+
+
+class EvaluationServer(object):
+    '''
+    partsInfo: LIST - catalog (catalog.load_parts_info)
+    evaluate_batch: FUNCTION - (designs, ids, generation) -> list of result dictionaries
+    cache: EvaluationCache - or None to evaluate every assembly
+    first_id: INT - number given to the first individual received
+    first_generation: INT - generation recorded for the first request
+    screen: FeasibilityScreen - skips certain-fail assemblies, or None
+    surrogate: Surrogate - only solves the assemblies it routes to the solver, or None
+    '''
+
+    def __init__(self, partsInfo, evaluate_batch, cache=None, first_id=1, screen=None,
+                 first_generation=0, surrogate=None):
+        self.partsInfo = partsInfo
+        self.evaluate_batch = evaluate_batch
+        self.cache = cache
+        self.screen = screen
+        self.surrogate = surrogate
+        self.next_id = first_id
+        self.generation = first_generation
+        # Solvers are not thread-safe: clients are answered one request at a time
+        self.lock = threading.Lock()
+
+    def evaluate(self, designs):
+        with self.lock:
+            ids = np.arange(self.next_id, self.next_id+len(designs))
+            self.next_id += len(designs)
+            generation = self.generation
+            self.generation += 1
+            outputs, counts = evaluate_population(designs, ids, self.partsInfo,
+                                                  self.evaluate_batch, self.cache,
+                                                  self.screen, self.surrogate, generation)
+        print(counts)
+        return outputs
+
+    def serve(self, port=DEFAULT_PORT, unix=None):
+        '''Serves until interrupted, on TCP loopback or on the Unix socket unix.'''
+        if unix is not None:
+            if os.path.exists(unix):
+                os.remove(unix)
+            server_class = socketserver.UnixStreamServer
+            address = unix
+        else:
+            server_class = ReusableTCPServer
+            address = ('127.0.0.1', port)
+        server = server_class(address, EvaluationHandler)
+        server.evaluate = self.evaluate
+        print('Evaluation server listening on ' + str(address))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            if unix is not None and os.path.exists(unix):
+                os.remove(unix)
+
+
+def server_address(argv=None):
+    '''(port, unix socket) from '--port N'/'port=N' and '--unix PATH'/'unix=PATH' arguments.'''
+    if argv is None:
+        argv = sys.argv
+    port, unix = DEFAULT_PORT, None
+    for i, arg in enumerate(argv):
+        if arg.startswith('port='):
+            port = int(arg[len('port='):])
+        elif arg.startswith('unix='):
+            unix = arg[len('unix='):]
+        elif arg == '--port' and i+1 < len(argv):
+            port = int(argv[i+1])
+        elif arg == '--unix' and i+1 < len(argv):
+            unix = argv[i+1]
+    return port, unix
+
+
+if __name__ == "__main__":
+    from condensation_solver import CondensationBackend
+    partsInfo = load_parts_info()
+    # Stand-in runs are logged apart from the Abaqus runs
+    os.environ['RESULTS_LOG'] = STAND_IN_FILE
+    backend = CondensationBackend(partsInfo, incremental=True)
+    # Stand-in outputs never answer Abaqus runs (see kill_code.population_evaluator)
+    cache = None if '--no-cache' in sys.argv else EvaluationCache('evalCachePython.db')
+    port, unix = server_address()
+    EvaluationServer(partsInfo, backend.evaluate_batch, cache,
+                     screen=load_screen(), surrogate=load_surrogate()).serve(port, unix)
@@ -0,0 +1,6 @@
+'''
+Stand-in for the Abaqus 'abaqus' module (see fakeKernel.py).
+'''
+
+from fakeKernel import mdb, session, openMdb, AbaqusException
+from fakeKernel import newMdb as Mdb
@@ -0,0 +1,8 @@
+'''
+Stand-in for the Abaqus 'abaqusConstants' module (see fakeKernel.py).
+'''
+
+import fakeKernel
+
+globals().update(fakeKernel.constants)
+__all__ = list(fakeKernel.CONSTANT_NAMES)
@@ -0,0 +1,6 @@
+'''
+Stand-in for the Abaqus 'caeModules' module (see fakeKernel.py).
+'''
+
+import regionToolset
+import visualization
@@ -0,0 +1,775 @@
+'''
+In-process stand-in for the Abaqus CAE kernel
+
+The subset of the Abaqus Scripting Interface used by 'AssemblyModifyEdit.py'
+and 'Post_P.py', so that model building and post-processing run (and can be
+profiled or load-tested) without Abaqus. The modules of this directory
+(abaqus, abaqusConstants, caeModules, regionToolset, visualization, odbAccess)
+re-export it under the names the scripts import; put the directory first on
+sys.path to use them (abaqus_profile.py does).
+
+    mdb         models (parts, rootAssembly, constraints, steps, boundary
+                conditions, field output requests), jobs, saveAs; Mdb() and
+                openMdb() reset this one object, as the scripts hold on to it
+                through 'from abaqus import *'
+    assembly    Instance, translate, replace, nodes.getByBoundingBox, Set,
+                SetByBoolean, ReferencePoint, Surface, faces.findAt
+    jobs        submit() takes a snapshot of the model (cells, their parts and
+                the displacement BCs of every load case); waitForCompletion()
+                returns at once
+    odbs        openOdb of a submitted job ('JOB.odb') or of one of its
+                substructures ('JOB_i.odb'): steps, frames (with load cases),
+                fieldOutputs, getSubset, bulkDataBlocks
+
+Results are synthetic but deterministic: every part gets a stiffness and a
+stress level from the CRC of its name, the cells are combined like springs
+(rows in series, columns in parallel), so the same assembly always gives the
+same outputs and a few parts yield under the rotation load case.
+
+Every API call (methods, repository lookups, bulkDataBlocks) is counted and
+timed by 'recorder', under the innermost scope open at the time (see
+CallRecorder.scope). 'latency' adds a sleep to the calls named in it (e.g.
+{'Job.waitForCompletion': 2.0}) to emulate the cost of the real kernel.
+
+Keep this file importable by both the Abaqus Python 2.7 interpreter and Python 3.
+'''
+
+import os
+import time
+import zlib
+from contextlib import contextmanager
+from functools import wraps
+
+import numpy as np
+
+if hasattr(time, 'perf_counter'):
+    wall_clock = time.perf_counter
+else: # Python 2.7
+    wall_clock = time.time
+
+
+#############################
+### SYMBOLIC CONSTANTS
+#############################
+
+class SymbolicConstant(str):
+    '''Named constant of abaqusConstants (compares equal to its name).'''
+
+    def __repr__(self):
+        return str(self)
+
+
+CONSTANT_NAMES = ['ON', 'OFF', 'UNSET', 'DEFAULT', 'CARTESIAN', 'COMPUTED', 'UNION',
+    'DIFFERENCE', 'INTERSECTION', 'STANDALONE', 'THREE_D', 'TWO_D_PLANAR',
+    'ANALYTIC_RIGID_SURFACE', 'DEFORMABLE_BODY', 'ANALYSIS', 'PERCENTAGE', 'SINGLE',
+    'DOUBLE', 'ODB', 'UNIFORM', 'COORDINATE', 'INDEX', 'MASK', 'NODAL', 'INTEGRATION_POINT',
+    'ELEMENT_NODAL', 'CENTROID', 'MISES']
+constants = dict((name, SymbolicConstant(name)) for name in CONSTANT_NAMES)
+UNSET = constants['UNSET']
+
+
+class AbaqusException(Exception):
+    pass
+
+
+class OdbError(Exception):
+    pass
+
+
+#############################
+### CALL RECORDER
+#############################
+
+class CallRecorder(object):
+    '''
+    Count and seconds of every API call, per scope.
+
+    calls: DICT - (scope, api name) -> [count, seconds]
+    scopes: DICT - scope -> [entries, wall seconds spent in the scope itself,
+            outside its child scopes]
+    '''
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.calls = {}
+        self.scopes = {}
+        self.stack = []
+
+    def scopeName(self):
+        if self.stack:
+            return self.stack[-1][0]
+        return None
+
+    def record(self, name, seconds):
+        entry = self.calls.setdefault((self.scopeName(), name), [0, 0.])
+        entry[0] += 1
+        entry[1] += seconds
+
+    @contextmanager
+    def scope(self, name):
+        '''Attributes the calls of the block to name (nested scopes: the innermost).'''
+        # [name, start, seconds spent in child scopes]
+        frame = [name, wall_clock(), 0.]
+        self.stack.append(frame)
+        try:
+            yield self
+        finally:
+            self.stack.pop()
+            seconds = wall_clock() - frame[1]
+            entry = self.scopes.setdefault(name, [0, 0.])
+            entry[0] += 1
+            entry[1] += seconds - frame[2]
+            if self.stack:
+                self.stack[-1][2] += seconds
+
+    def wrap(self, function, name=None):
+        '''function running in its own scope (name: the function name by default).'''
+        name = name or function.__name__
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            with self.scope(name):
+                return function(*args, **kwargs)
+        return wrapper
+
+    def byScope(self):
+        '''scope -> {'calls', 'apiSeconds', 'entries', 'seconds'}.'''
+        summary = {}
+        for (scope, name), (count, seconds) in self.calls.items():
+            entry = summary.setdefault(scope, {'calls':0, 'apiSeconds':0., 'entries':0,
+                                               'seconds':0.})
+            entry['calls'] += count
+            entry['apiSeconds'] += seconds
+        for scope, (entries, seconds) in self.scopes.items():
+            entry = summary.setdefault(scope, {'calls':0, 'apiSeconds':0., 'entries':0,
+                                               'seconds':0.})
+            entry['entries'] = entries
+            entry['seconds'] = seconds
+        return summary
+
+    def byName(self, scope=False):
+        '''api name -> [count, seconds] over all scopes (or of one scope).'''
+        summary = {}
+        for (callScope, name), (count, seconds) in self.calls.items():
+            if scope is not False and callScope != scope:
+                continue
+            entry = summary.setdefault(name, [0, 0.])
+            entry[0] += count
+            entry[1] += seconds
+        return summary
+
+    def total(self):
+        return sum(count for count, seconds in self.calls.values())
+
+
+recorder = CallRecorder()
+# api name -> seconds slept by every call
+latency = {}
+
+
+def record(name, startWall):
+    delay = latency.get(name)
+    if delay:
+        time.sleep(delay)
+    recorder.record(name, wall_clock() - startWall)
+
+
+def api(function):
+    '''Counts and times a method as '<class>.<method>'.'''
+    @wraps(function)
+    def wrapper(self, *args, **kwargs):
+        startWall = wall_clock()
+        try:
+            return function(self, *args, **kwargs)
+        finally:
+            record(type(self).__name__ + '.' + function.__name__, startWall)
+    return wrapper
+
+
+class Repository(object):
+    '''
+    Named objects of the model (mdb.models, parts, sets, constraints, ...).
+    Lookups, keys() and deletions are API calls ('<label>[]', '<label>.keys',
+    'del <label>[]'); keys() is a list, as in Abaqus Python 2.7.
+    '''
+
+    def __init__(self, label):
+        self.label = label
+        self.items = {}
+        self.order = []
+
+    def _store(self, name, item):
+        if name not in self.items:
+            self.order.append(name)
+        self.items[name] = item
+        return item
+
+    def __getitem__(self, name):
+        startWall = wall_clock()
+        try:
+            return self.items[name]
+        finally:
+            record(self.label + '[]', startWall)
+
+    def __delitem__(self, name):
+        startWall = wall_clock()
+        try:
+            del self.items[name]
+            self.order.remove(name)
+        finally:
+            record('del ' + self.label + '[]', startWall)
+
+    def __contains__(self, name):
+        return name in self.items
+
+    def __len__(self):
+        return len(self.items)
+
+    def keys(self):
+        startWall = wall_clock()
+        try:
+            return list(self.order)
+        finally:
+            record(self.label + '.keys', startWall)
+
+    def values(self):
+        return [self.items[name] for name in self.order]
+
+
+class Options(object):
+    '''Object that only keeps the values it is given (setValues).'''
+
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+    @api
+    def setValues(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+#############################
+### MODEL
+#############################
+
+# Settings of the stand-in, see configure
+settings = {'parts':[], 'box':[-0.005, -0.005, 0.0, 0.005, 0.005, 0.0025], 'edgeNodes':41,
+            'elements':200, 'blocks':2}
+
+
+def configure(parts=None, box=None, edgeNodes=None, elements=None, blocks=None):
+    '''
+    parts: LIST - substructure part names of assembly.cae (created by openMdb)
+    box: LIST - [minX,minY,minZ,maxX,maxY,maxZ] of every substructure
+    edgeNodes: INT - retained nodes on every edge of a substructure
+    elements: INT - elements per bulk data block of the substructure odbs
+    blocks: INT - bulk data blocks per substructure odb
+    '''
+    for name, value in (('parts', parts), ('box', box), ('edgeNodes', edgeNodes),
+                        ('elements', elements), ('blocks', blocks)):
+        if value is not None:
+            settings[name] = value
+
+
+def partValue(partName, salt=''):
+    '''Uniform number in [0, 1) drawn from the part name.'''
+    return (zlib.crc32((str(partName) + salt).encode('ascii')) & 0xffffffff) / 4294967296.
+
+
+class Part(object):
+    '''Part: substructure (retained nodes on the edges of box) or analytic surface.'''
+
+    def __init__(self, name, substructure=True):
+        self.name = name
+        self.substructure = substructure
+        self.nodes = np.zeros((0, 3))
+        self.faces = FaceArray([])
+        if substructure:
+            box = settings['box']
+            edge = np.linspace(0., 1., settings['edgeNodes'])
+            points = []
+            for x0, y0, x1, y1 in ((0, 0, 1, 0), (1, 0, 1, 1), (1, 1, 0, 1), (0, 1, 0, 0)):
+                points.append(np.column_stack([x0 + (x1-x0)*edge[:-1], y0 + (y1-y0)*edge[:-1]]))
+            points = np.concatenate(points)
+            self.nodes = np.column_stack([box[0] + points[:,0]*(box[3]-box[0]),
+                                          box[1] + points[:,1]*(box[4]-box[1]),
+                                          np.zeros(len(points))])
+
+    @api
+    def AnalyticRigidSurfExtrude(self, sketch, depth=1.0):
+        self.faces = FaceArray([Face(self.name, 0)])
+
+
+class Face(object):
+
+    def __init__(self, instanceName, index):
+        self.instanceName = instanceName
+        self.index = index
+
+
+class FaceArray(list):
+
+    @api
+    def findAt(self, *points):
+        return FaceArray(list(self[:1]))
+
+
+class MeshNodeArray(object):
+    '''Nodes of an instance (labels into the node coordinates).'''
+
+    def __init__(self, instance, labels):
+        self.instance = instance
+        self.labels = labels
+
+    def __len__(self):
+        return len(self.labels)
+
+    @api
+    def getByBoundingBox(self, xMin=None, yMin=None, zMin=None, xMax=None, yMax=None,
+                         zMax=None):
+        nodes = self.instance.coordinates()[self.labels]
+        tol = 1E-9*max(1., np.abs(nodes).max()) if len(nodes) else 0.
+        inside = np.ones(len(nodes), dtype=bool)
+        for k, (low, high) in enumerate(((xMin, xMax), (yMin, yMax), (zMin, zMax))):
+            if low is not None:
+                inside &= nodes[:,k] >= low - tol
+            if high is not None:
+                inside &= nodes[:,k] <= high + tol
+        return MeshNodeArray(self.instance, self.labels[inside])
+
+
+class Instance(object):
+
+    def __init__(self, name, part):
+        self.name = name
+        self.part = part
+        self.offset = np.zeros(3)
+        self.faces = part.faces
+
+    def coordinates(self):
+        return self.part.nodes + self.offset
+
+    @property
+    def nodes(self):
+        return MeshNodeArray(self, np.arange(len(self.part.nodes)))
+
+    @api
+    def replace(self, instanceOf):
+        self.part = instanceOf
+        self.faces = instanceOf.faces
+
+
+class Set(object):
+    '''Node or reference point set: (instance name, node label) pairs.'''
+
+    def __init__(self, name, nodes=(), referencePoints=()):
+        self.name = name
+        self.nodes = set(nodes)
+        self.referencePoints = tuple(referencePoints)
+
+
+class Region(object):
+
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+class Assembly(object):
+
+    def __init__(self):
+        self.instances = Repository('instances')
+        self.sets = Repository('sets')
+        self.surfaces = Repository('surfaces')
+        self.referencePoints = Repository('referencePoints')
+        self.features = 0
+
+    @api
+    def DatumCsysByDefault(self, coordSysType):
+        self.features += 1
+
+    @api
+    def Instance(self, name, part, dependent=None):
+        return self.instances._store(name, Instance(name, part))
+
+    @api
+    def translate(self, instanceList, vector):
+        for name in instanceList:
+            self.instances.items[name].offset = self.instances.items[name].offset + np.array(vector)
+
+    @api
+    def Set(self, name, nodes=None, referencePoints=None):
+        members = []
+        for array in nodes or ():
+            if len(array) == 0:
+                raise AbaqusException('Set ' + name + ': empty node selection')
+            members.extend([(array.instance.name, label) for label in array.labels])
+        return self.sets._store(name, Set(name, members, referencePoints or ()))
+
+    @api
+    def SetByBoolean(self, name, sets, operation=constants['UNION']):
+        members = set(sets[0].nodes)
+        for other in sets[1:]:
+            if operation == 'UNION':
+                members |= other.nodes
+            elif operation == 'DIFFERENCE':
+                members -= other.nodes
+            else:
+                members &= other.nodes
+        return self.sets._store(name, Set(name, members))
+
+    @api
+    def ReferencePoint(self, point):
+        self.features += 1
+        return self.referencePoints._store(self.features, Options(point=tuple(point)))
+
+    @api
+    def Surface(self, name, side1Faces=None, side2Faces=None):
+        return self.surfaces._store(name, Options(name=name, faces=side2Faces or side1Faces))
+
+
+class Sketch(object):
+
+    def __init__(self, name):
+        self.name = name
+        self.geometry, self.vertices, self.dimensions, self.constraints = {}, {}, {}, {}
+
+    @api
+    def setPrimaryObject(self, option=None):
+        pass
+
+    @api
+    def unsetPrimaryObject(self):
+        pass
+
+    @api
+    def Line(self, point1, point2):
+        self.geometry[len(self.geometry)] = (point1, point2)
+
+
+class Step(object):
+
+    def __init__(self, name, perturbation=False):
+        self.name = name
+        self.perturbation = perturbation
+        self.loadCases = Repository('loadCases')
+
+    @api
+    def LoadCase(self, name, boundaryConditions=(), includeActiveBaseStateBC=None):
+        return self.loadCases._store(name, Options(name=name,
+                                                   boundaryConditions=tuple(boundaryConditions)))
+
+
+class Model(object):
+
+    def __init__(self, name):
+        self.name = name
+        self.rootAssembly = Assembly()
+        self.parts = Repository('parts')
+        self.constraints = Repository('constraints')
+        self.steps = Repository('steps')
+        self.boundaryConditions = Repository('boundaryConditions')
+        self.fieldOutputRequests = Repository('fieldOutputRequests')
+        self.sketches = Repository('sketches')
+        self.steps._store('Initial', Step('Initial'))
+
+    def _unique(self, repository, name):
+        if name in repository:
+            raise AbaqusException(repository.label + ': "' + name + '" already exists')
+
+    @api
+    def PartFromSubstructure(self, name, substructureFile=None, odbFile=None):
+        return self.parts._store(name, Part(name))
+
+    @api
+    def Part(self, name, dimensionality=None, type=None):
+        return self.parts._store(name, Part(name, substructure=False))
+
+    @api
+    def ConstrainedSketch(self, name, sheetSize=None):
+        return self.sketches._store(name, Sketch(name))
+
+    @api
+    def Tie(self, name, master, slave, **kwargs):
+        self._unique(self.constraints, name)
+        return self.constraints._store(name, Options(name=name, master=master, slave=slave,
+                                                     **kwargs))
+
+    @api
+    def RigidBody(self, name, refPointRegion=None, surfaceRegion=None, **kwargs):
+        self._unique(self.constraints, name)
+        return self.constraints._store(name, Options(name=name, refPointRegion=refPointRegion,
+                                                     surfaceRegion=surfaceRegion))
+
+    @api
+    def StaticStep(self, name, previous, **kwargs):
+        self._unique(self.steps, name)
+        return self.steps._store(name, Step(name))
+
+    @api
+    def StaticLinearPerturbationStep(self, name, previous, **kwargs):
+        self._unique(self.steps, name)
+        return self.steps._store(name, Step(name, perturbation=True))
+
+    @api
+    def EncastreBC(self, name, createStepName, region, **kwargs):
+        self._unique(self.boundaryConditions, name)
+        return self.boundaryConditions._store(name, Options(name=name, region=region,
+            createStepName=createStepName))
+
+    @api
+    def DisplacementBC(self, name, createStepName, region, **kwargs):
+        self._unique(self.boundaryConditions, name)
+        return self.boundaryConditions._store(name, Options(name=name, region=region,
+            createStepName=createStepName, **kwargs))
+
+    @api
+    def FieldOutputRequest(self, name, createStepName, variables=()):
+        return self.fieldOutputRequests._store(name, Options(name=name, variables=variables))
+
+
+#############################
+### JOBS
+#############################
+
+# Snapshot of every submitted job (see Job.submit), read by openOdb
+analyses = {}
+
+
+def dofValue(value):
+    '''Prescribed value of a BC degree of freedom (UNSET: 0).'''
+    if isinstance(value, SymbolicConstant) or value is None:
+        return 0.
+    return float(value)
+
+
+class Job(object):
+
+    def __init__(self, name, model, numCpus=1):
+        self.name = name
+        self.model = model
+        self.numCpus = numCpus
+
+    @api
+    def submit(self):
+        model = mdb.models.items[self.model]
+        if 'Step-1' not in model.steps:
+            raise AbaqusException('Job ' + self.name + ': no analysis step')
+        instances = [instance for instance in model.rootAssembly.instances.values()
+                     if instance.part.substructure]
+        if not instances:
+            raise AbaqusException('Job ' + self.name + ': no substructure instances')
+        step = model.steps.items['Step-1']
+        bcs = model.boundaryConditions.items
+        loadCases = []
+        if step.perturbation:
+            for loadCase in step.loadCases.values():
+                values = bcs[loadCase.boundaryConditions[0][0]].__dict__
+                loadCases.append((loadCase.name, values))
+        else:
+            loadCases.append((None, bcs['MOVE_RP'].__dict__))
+        # Assembly order: y runs fastest (grid_builder.cellPositions)
+        rows = len(set([round(instance.offset[1], 9) for instance in instances]))
+        analyses[self.name] = {'cells':[instance.part.name for instance in instances],
+            'rows':rows,
+            'loadCases':[(name, dict((dof, dofValue(values.get(dof))) for dof in
+                          ('u1', 'u2', 'u3', 'ur1', 'ur2', 'ur3'))) for name, values in loadCases]}
+
+    @api
+    def waitForCompletion(self):
+        pass
+
+
+class Mdb(object):
+    '''The model database (one object, reset by Mdb() and openMdb()).'''
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self, parts=()):
+        self.models = Repository('models')
+        self.jobs = Repository('jobs')
+        model = self.models._store('Model-1', Model('Model-1'))
+        for name in parts:
+            model.parts._store(name, Part(name))
+        return self
+
+    @api
+    def Job(self, name, model, numCpus=1, **kwargs):
+        if name in self.jobs:
+            raise AbaqusException('Job "' + name + '" already exists')
+        return self.jobs._store(name, Job(name, model, numCpus))
+
+    @api
+    def saveAs(self, pathName):
+        self.path = pathName
+
+
+mdb = Mdb()
+
+
+def newMdb():
+    '''Mdb(): empty model database.'''
+    startWall = wall_clock()
+    mdb.reset()
+    record('Mdb', startWall)
+    return mdb
+
+
+def openMdb(pathName):
+    '''openMdb(): the model database with the substructure parts of configure().'''
+    startWall = wall_clock()
+    mdb.reset(settings['parts'])
+    mdb.path = pathName
+    record('openMdb', startWall)
+    return mdb
+
+
+class Session(object):
+
+    def __init__(self):
+        self.journalOptions = Options()
+        self.odbs = {}
+
+    @api
+    def openOdb(self, name, readOnly=False):
+        return openOdb(name, readOnly)
+
+
+session = Session()
+
+
+#############################
+### ODB
+#############################
+
+def cellStiffness(partName):
+    '''Shear and rotational stiffness of a part (about 1E6, from its name).'''
+    return 0.5E6 + 1E6*partValue(partName), 0.5E3 + 1E3*partValue(partName, 'rot')
+
+
+def cellMises(partName, loadCaseValues):
+    '''Largest von Mises stress of a part: a few percent of the parts yield under rotation.'''
+    level = 2E8 + 9E8*partValue(partName, 'mises')**4
+    if loadCaseValues['ur3'] == 0.:
+        level *= 0.1
+    return level
+
+
+def assemblyStiffness(cells, rows):
+    '''k_xy and k_theta of the grid: cells of a column in series, columns in parallel.'''
+    stiffness = np.array([cellStiffness(part) for part in cells]).reshape(-1, rows, 2)
+    return tuple((1. / (1. / stiffness).sum(axis=1)).sum(axis=0))
+
+
+class FieldValue(object):
+
+    def __init__(self, data):
+        self.data = tuple(data)
+
+
+class BulkDataBlock(object):
+
+    def __init__(self, mises):
+        self.mises = mises
+
+
+class FieldOutput(object):
+
+    def __init__(self, name, values=(), blocks=()):
+        self.name = name
+        self._values = list(values)
+        self._blocks = list(blocks)
+
+    @property
+    def values(self):
+        startWall = wall_clock()
+        record('FieldOutput.values', startWall)
+        return self._values
+
+    @property
+    def bulkDataBlocks(self):
+        startWall = wall_clock()
+        record('FieldOutput.bulkDataBlocks', startWall)
+        return self._blocks
+
+    @api
+    def getSubset(self, region=None, position=None):
+        return FieldOutput(self.name, self._values)
+
+
+class Frame(object):
+
+    def __init__(self, loadCase, fieldOutputs):
+        self.loadCase = loadCase
+        self.fieldOutputs = Repository('fieldOutputs')
+        for name, field in fieldOutputs.items():
+            self.fieldOutputs._store(name, field)
+
+
+class OdbStep(object):
+
+    def __init__(self, name, frames):
+        self.name = name
+        self.frames = frames
+
+
+class Odb(object):
+
+    def __init__(self, name, frames):
+        self.name = name
+        self.rootAssembly = Options(nodeSets=Repository('nodeSets'))
+        self.rootAssembly.nodeSets._store('REFERENCE_POINT_PART-1-1        1', Set('RP'))
+        self.steps = Repository('odbSteps')
+        self.steps._store('Step-1', OdbStep('Step-1', frames))
+        self.closed = False
+
+    @api
+    def close(self):
+        self.closed = True
+
+
+def assemblyFrames(analysis):
+    '''Frames of the assembly odb: reaction force/moment at the reference point.'''
+    k_xy, k_theta = assemblyStiffness(analysis['cells'], analysis['rows'])
+    frames = [Frame(None, {})]
+    for name, values in analysis['loadCases']:
+        u = [values['u1'], values['u2'], values['u3']]
+        ur = [values['ur1'], values['ur2'], values['ur3']]
+        # x-displacement resisted by k_xy, y by a stiffer axial mode, rotation by k_theta
+        rf = [k_xy*u[0], 10.*k_xy*u[1], 0.]
+        rm = [0., 0., k_theta*ur[2]]
+        loadCase = Options(name=name) if name is not None else None
+        frames.append(Frame(loadCase, {'U':FieldOutput('U', [FieldValue(u)]),
+                                       'UR':FieldOutput('UR', [FieldValue(ur)]),
+                                       'RF':FieldOutput('RF', [FieldValue(rf)]),
+                                       'RM':FieldOutput('RM', [FieldValue(rm)])}))
+    return frames
+
+
+def substructureFrames(analysis, cell):
+    '''Frames of a substructure odb: von Mises stress in bulk data blocks.'''
+    part = analysis['cells'][cell]
+    frames = [Frame(None, {})]
+    for name, values in analysis['loadCases']:
+        level = cellMises(part, values)
+        blocks = [BulkDataBlock(level*np.linspace(0.1, 1., settings['elements'])*(k+1.)
+                                /settings['blocks']) for k in range(settings['blocks'])]
+        loadCase = Options(name=name) if name is not None else None
+        frames.append(Frame(loadCase, {'S':FieldOutput('S', blocks=blocks)}))
+    return frames
+
+
+def openOdb(path, readOnly=False):
+    '''Odb of a submitted job: 'JOB.odb' (assembly) or 'JOB_i.odb' (substructure i).'''
+    startWall = wall_clock()
+    try:
+        name = os.path.splitext(os.path.basename(path))[0]
+        if name in analyses:
+            return Odb(name, assemblyFrames(analyses[name]))
+        jobName, _, cell = name.rpartition('_')
+        if jobName in analyses and cell.isdigit() and \
+                0 < int(cell) <= len(analyses[jobName]['cells']):
+            return Odb(name, substructureFrames(analyses[jobName], int(cell)-1))
+        raise OdbError('Cannot open ' + path + ': no such job was submitted')
+    finally:
+        record('openOdb', startWall)
@@ -0,0 +1,5 @@
+'''
+Stand-in for the Abaqus 'odbAccess' module (see fakeKernel.py).
+'''
+
+from fakeKernel import openOdb, OdbError
@@ -0,0 +1,13 @@
+'''
+Stand-in for the Abaqus 'regionToolset' module (see fakeKernel.py).
+'''
+
+from fakeKernel import Region as _Region, record as _record, wall_clock as _wall_clock
+
+
+def Region(**kwargs):
+    startWall = _wall_clock()
+    try:
+        return _Region(**kwargs)
+    finally:
+        _record('regionToolset.Region', startWall)
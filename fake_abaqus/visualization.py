@@ -0,0 +1,5 @@
+'''
+Stand-in for the Abaqus 'visualization' module (see fakeKernel.py).
+'''
+
+from fakeKernel import openOdb, OdbError
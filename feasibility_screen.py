@@ -0,0 +1,153 @@
+'''
+Feasibility pre-screen
+
+Classifies snapped assemblies before they are solved, from the catalog
+stresses of their parts. With
+    s = largest catalog maxMises3 (standalone rotation run) over the cells
+        that are built (the first assemblyDim ones, see lattice_estimator.py)
+the rotation-case stress of the assembly is bounded by
+    lower*s <= maxMises2 <= upper*s
+where the amplification bounds are fitted from completed runs (smallest and
+largest maxMises2/s, widened by a safety margin). Then
+    lower*s > yieldStress -> certain-fail: penalized without a solve
+    upper*s < yieldStress -> certain-pass: solved, the stress recovery is skipped
+    otherwise             -> uncertain: solved with the full stress recovery
+Until minRuns completed runs have been fitted every assembly is uncertain, so
+the screen never changes a result it has no data for.
+
+Used by evaluate_population ('eval_server.py', i.e. 'kill_code.py --batch' and
+the evaluation server) and by runAssembly in 'AssemblyModifyEdit.py'.
+
+Keep this file importable by both the Abaqus Python 2.7 interpreter and Python 3.
+
+Files needed:
+    -assembly_config.py - yield stress
+    -lattice_estimator.py, grid_builder.py - cells of the assemblyDim grid
+    -feasibilityScreen.json - fitted bounds (see Usage), no screening without it
+
+Usage:
+    python feasibility_screen.py [results.bin | AssemblyOutput.txt PlottingInfo.txt]
+        fits the bounds from the recorded runs (results log, or the text records
+        when it is empty) and writes feasibilityScreen.json
+'''
+
+import json
+
+import numpy as np
+
+import assembly_config
+from lattice_estimator import lattice_shape
+
+
+CERTAIN_FAIL = -1
+UNCERTAIN = 0
+CERTAIN_PASS = 1
+SCREEN_FILE = 'feasibilityScreen.json'
+# Row of partsInfo[5] (maxMises1..3) used as the stress of a part
+ROTATION_STRESS = 2
+
+
+def stress_feature(partIndices, partsInfo):
+    '''
+    Largest catalog rotation stress over the built cells of every assembly
+    (design vectors may snap more cells than the grid holds, see lattice_shape).
+
+    partIndices: ARRAY of INT (nDesigns, nCells) or (nCells,) - catalog indices
+    partsInfo: LIST - catalog (catalog.load_parts_info)
+    '''
+    partIndices = np.asarray(partIndices, dtype=int)
+    nx, ny = lattice_shape(partIndices.shape[-1])
+    stresses = np.array(partsInfo[5], dtype=float)[ROTATION_STRESS]
+    return stresses[partIndices[..., :nx*ny]].max(axis=-1)
+
+
+class FeasibilityScreen(object):
+    '''
+    lower, upper: FLOAT - amplification bounds (None = not fitted)
+    runs: INT - number of runs the bounds were fitted from
+    minRuns: INT - runs needed before designs are classified
+    yieldStress: FLOAT - assembly_config.yieldStress when None
+    '''
+
+    def __init__(self, lower=None, upper=None, runs=0, minRuns=20, yieldStress=None):
+        self.lower = lower
+        self.upper = upper
+        self.runs = runs
+        self.minRuns = minRuns
+        if yieldStress is None:
+            yieldStress = assembly_config.yieldStress
+        self.yieldStress = yieldStress
+
+    def active(self):
+        return self.lower is not None and self.runs >= self.minRuns
+
+    def classify(self, features):
+        '''CERTAIN_FAIL, UNCERTAIN or CERTAIN_PASS for every stress feature.'''
+        features = np.asarray(features, dtype=float)
+        classes = np.zeros(features.shape, dtype=int)
+        if self.active():
+            classes[self.lower*features > self.yieldStress] = CERTAIN_FAIL
+            classes[self.upper*features < self.yieldStress] = CERTAIN_PASS
+        return classes
+
+    def classify_parts(self, partIndices, partsInfo):
+        '''Classes of assemblies given by their catalog indices (see stress_feature).'''
+        return self.classify(stress_feature(partIndices, partsInfo))
+
+    def save(self, path=SCREEN_FILE):
+        with open(path, 'w') as f:
+            json.dump({'lower':self.lower, 'upper':self.upper, 'runs':self.runs,
+                       'minRuns':self.minRuns, 'yieldStress':self.yieldStress}, f)
+
+    def __repr__(self):
+        return ('FeasibilityScreen(lower=%s, upper=%s, runs=%i, active=%s)'
+                % (self.lower, self.upper, self.runs, self.active()))
+
+
+def fit_screen(features, maxMises, margin=0.1, minRuns=20):
+    '''
+    Amplification bounds from completed runs.
+
+    features: ARRAY - stress_feature of every run
+    maxMises: ARRAY - recovered maxMises2 of every run (runs whose stress was
+              not recovered, i.e. negative, are left out)
+    margin: FLOAT - relative widening of the observed range of maxMises2/s
+    '''
+    features = np.asarray(features, dtype=float)
+    maxMises = np.asarray(maxMises, dtype=float)
+    valid = (maxMises > 0) & (features > 0)
+    if not valid.any():
+        return FeasibilityScreen(runs=0, minRuns=minRuns)
+    ratio = maxMises[valid]/features[valid]
+    return FeasibilityScreen(lower=float(ratio.min()*(1.-margin)),
+                             upper=float(ratio.max()*(1.+margin)),
+                             runs=int(valid.sum()), minRuns=minRuns)
+
+
+def load_screen(path=SCREEN_FILE):
+    '''Fitted screen saved by FeasibilityScreen.save, or None if there is none.'''
+    try:
+        with open(path) as f:
+            data = json.load(f)
+    except (IOError, OSError, ValueError):
+        return None
+    return FeasibilityScreen(data['lower'], data['upper'], data['runs'],
+                             data['minRuns'], data['yieldStress'])
+
+
+if __name__ == "__main__":
+    import sys
+    from catalog import load_parts_info
+    from condensation_solver import recorded_runs
+    partsInfo = load_parts_info()
+    files = [arg for arg in sys.argv[1:] if arg.endswith('.txt')]
+    logs = [arg for arg in sys.argv[1:] if arg.endswith('.bin')]
+    runs = recorded_runs(partsInfo, *files, logFile=logs[0] if logs else None)
+    features = [stress_feature(partIndices, partsInfo) for partIndices, _, _, _ in runs]
+    screen = fit_screen(features, [maxMises2 for _, _, _, maxMises2 in runs])
+    screen.save()
+    print(screen)
+    if screen.runs:
+        classes = screen.classify(features)
+        print('Recorded runs: %i certain-fail, %i uncertain, %i certain-pass'
+              % tuple(np.sum(classes == c) for c in (CERTAIN_FAIL, UNCERTAIN, CERTAIN_PASS)))
@@ -0,0 +1,198 @@
+'''
+Assembly grid builder
+
+Plans the [n x m] assembly grid up front: instance names, the bounding boxes
+of the four edge node sets of every cell, the tie pairs and the cells on the
+bottom/top boundary. Everything is computed in one pass (numpy arrays for the
+boxes), so the plan grows linearly with the number of cells. The Abaqus script
+('AssemblyModifyEdit.py') then issues one set per cell edge, one tie per
+neighbour pair and one union per boundary node set:
+    -instance names count repeats of a part in a dictionary instead of
+     searching the names so far for the part name (quadratic, and it also counts
+     other parts whose name contains this one)
+    -the top/bottom boxes stop short of the corners, which replaces the Boolean
+     differences that removed the corner nodes
+    -'BottomBCNodes'/'TopBCNodes' are created by a single union of all edge sets
+     instead of a chain of pairwise unions
+
+Keep this file importable by both the Abaqus Python 2.7 interpreter and Python 3.
+
+Files needed:
+    -grid_connectivity.py - grid topology (tie pairs, boundary rows)
+
+Usage:
+    python grid_builder.py [5x3 20x20 50x50 100x20 ...]
+        benchmark of the plan and the number of set operations against the
+        previous builder, for the given grid sizes
+'''
+
+import numpy as np
+
+from grid_connectivity import gridTopology, setOrder
+
+# Edge node sets created for every instance
+sides = ['Top','Bottom','Left','Right']
+
+
+def instanceNames(parts):
+    '''
+    Instance name of every cell: part name and the number of times the part
+    has been instanced so far, e.g. ['Cross-3_1', 'Cross-7_1', 'Cross-3_2'].
+
+    parts: LIST - part name of every cell, in assembly order
+    '''
+    counts = {}
+    names = []
+    for part in parts:
+        part = str(part)
+        counts[part] = counts.get(part, 0) + 1
+        names.append(part + '_' + str(counts[part]))
+    return names
+
+
+def setName(instanceName, side):
+    '''Name of the edge node set of an instance (side in sides).'''
+    return instanceName + '_' + side
+
+
+def cellPositions(assemblyDim):
+    '''(x, y) grid positions of every cell in assembly order (y runs fastest).'''
+    n = np.arange(assemblyDim[0]*assemblyDim[1])
+    return n // assemblyDim[1], n % assemblyDim[1]
+
+
+def cellOffsets(assemblyDim, dim):
+    '''
+    Translation of every cell from the part position: ARRAY (nCells, 3).
+
+    dim: LIST - [minX,minY,minZ,maxX,maxY,maxZ] of one substructure
+    '''
+    x, y = cellPositions(assemblyDim)
+    offsets = np.zeros((len(x), 3))
+    offsets[:,0] = x*(dim[3] - dim[0])
+    offsets[:,1] = y*(dim[4] - dim[1])
+    return offsets
+
+
+def edgeBoxes(assemblyDim, dim, cornerTol=1E-3):
+    '''
+    Bounding boxes of the edge node sets of every cell.
+
+    assemblyDim: LIST - [cells in x, cells in y]
+    dim: LIST - [minX,minY,minZ,maxX,maxY,maxZ] of one substructure
+    cornerTol: FLOAT - the top and bottom boxes stop this fraction of the cell
+               width short of the corners, so corner nodes only belong to the
+               left and right sets (a retained DOF cannot carry two ties/BCs)
+
+    Returns a dictionary side -> ARRAY (nCells, 6) of
+    [xMin,yMin,zMin,xMax,yMax,zMax] (getByBoundingBox arguments).
+    '''
+    offsets = cellOffsets(assemblyDim, dim)
+    xMin = offsets[:,0] + dim[0]
+    yMin = offsets[:,1] + dim[1]
+    xMax = offsets[:,0] + dim[3]
+    yMax = offsets[:,1] + dim[4]
+    zero = np.zeros(len(offsets))
+    inset = cornerTol*(dim[3] - dim[0])
+    return {'Top': np.column_stack([xMin+inset, yMax, zero, xMax-inset, yMax, zero]),
+            'Bottom': np.column_stack([xMin+inset, yMin, zero, xMax-inset, yMin, zero]),
+            'Left': np.column_stack([xMin, yMin, zero, xMin, yMax, zero]),
+            'Right': np.column_stack([xMax, yMin, zero, xMax, yMax, zero])}
+
+
+def tiePairs(assemblyDim, topology=None):
+    '''
+    Tie constraints between neighbouring cells, from the edge list of the grid
+    topology (every neighbour pair once, from the cell of the checkerboard with
+    (x+y) even).
+
+    topology: GridTopology - gridTopology(assemblyDim) when None
+
+    Returns a list of (tieName, cell, side, neighbour, neighbourSide), cells as
+    assembly order indices; tie names are 'Constraint-1', 'Constraint-2', ...
+    '''
+    if topology is None:
+        topology = gridTopology(assemblyDim)
+    pairs = []
+    for j, (cell, k, neighbour, opposite) in enumerate(topology.edges):
+        pairs.append(('Constraint-' + str(j+1), int(cell), setOrder[k],
+                      int(neighbour), setOrder[opposite]))
+    return pairs
+
+
+def touchingPairs(pairs, cells):
+    '''Tie pairs (see tiePairs) that involve one of the cells.'''
+    cells = set(cells)
+    return [pair for pair in pairs if pair[1] in cells or pair[3] in cells]
+
+
+def boundaryCells(assemblyDim, side, topology=None):
+    '''Assembly order indices of the cells on the 'Bottom' or 'Top' boundary.'''
+    if topology is None:
+        topology = gridTopology(assemblyDim)
+    return topology.boundaryCells(side)
+
+
+def legacyInstanceNames(parts):
+    '''Previous naming (substring search over the names so far), for the benchmark.'''
+    names = []
+    for part in parts:
+        part = str(part)
+        repeats = [name for name in names if part in name]
+        names.append(part + '_' + str(len(repeats)+1))
+    return names
+
+
+def benchmark(sizes, nParts=1000, edgeNodes=41, seed=0):
+    '''
+    Times the plan of every grid size and counts the Abaqus set operations of
+    the previous and the new builder. Node copies count the nodes written by
+    the Boolean operations (the chained unions rewrite the growing
+    'BottomBCNodes'/'TopBCNodes' set for every cell added).
+
+    sizes: LIST of [cells in x, cells in y]
+    nParts: INT - number of distinct parts in the catalog the cells are drawn from
+    edgeNodes: INT - nodes on one substructure edge
+    '''
+    import time
+    rng = np.random.RandomState(seed)
+    dim = [-0.005, -0.005, 0.0, 0.005, 0.005, 0.0025]
+    print('%-8s %7s %12s %12s %10s %12s %12s %12s %12s' % ('grid', 'cells',
+        'names old s', 'names new s', 'plan s', 'set ops old',
+        'set ops new', 'copies old', 'copies new'))
+    for size in sizes:
+        nCells = size[0]*size[1]
+        parts = ['Cross-%d_Z%d' % (i, i) for i in rng.randint(1, nParts+1, nCells)]
+
+        startTime = time.time()
+        legacyInstanceNames(parts)
+        oldTime = time.time() - startTime
+
+        startTime = time.time()
+        instanceNames(parts)
+        namesTime = time.time() - startTime
+
+        startTime = time.time()
+        edgeBoxes(size, dim)
+        pairs = tiePairs(size)
+        bottom = boundaryCells(size, 'Bottom')
+        top = boundaryCells(size, 'Top')
+        planTime = namesTime + time.time() - startTime
+
+        # Per cell: 4 sets + 4 differences (old) or 4 sets (new); ties; unions
+        boundary = len(bottom) + len(top)
+        oldOps = 8*nCells + len(pairs) + boundary
+        newOps = 4*nCells + len(pairs) + 2
+        oldCopies = 4*nCells*edgeNodes
+        for row in (bottom, top):
+            oldCopies += sum(k*edgeNodes for k in range(1, len(row)+1))
+        newCopies = boundary*edgeNodes
+        print('%-8s %7d %12.4f %12.4f %10.4f %12d %12d %12d %12d' % (
+            '%dx%d' % tuple(size), nCells, oldTime, namesTime, planTime,
+            oldOps, newOps, oldCopies, newCopies))
+
+
+if __name__ == "__main__":
+    import sys
+    sizes = [[int(n) for n in arg.split('x')] for arg in sys.argv[1:] if 'x' in arg]
+    benchmark(sizes or [[5,3], [20,20], [50,50], [100,20], [100,100]])
@@ -0,0 +1,167 @@
+'''
+Assembly grid connectivity
+
+Describes which substructures of the [n x m] assembly grid are tied to which.
+Used by the Abaqus script ('AssemblyModifyEdit.py', through 'grid_builder.py')
+to create the tie constraints and the bottom/top boundary sets, and by the
+Python solver backend ('condensation_solver.py') to assemble the global
+stiffness matrix, so both always see the same topology.
+
+The topology (GridTopology) is a compact edge list plus a CSR adjacency with
+side labels, computed with numpy for any assemblyDim, optionally with cells
+masked out (non-rectangular layouts) and periodic wrap in x and/or y. It is
+cached per shape (gridTopology), so building it again is free.
+
+Cells are numbered in assembly order, x outer and y inner (instanceAssembly):
+    cell = x*assemblyDim[1] + y
+
+Keep this file importable by both the Abaqus Python 2.7 interpreter and Python 3.
+'''
+
+import numpy as np
+
+# Substructure sides in the order used by the connectivity lists, and the side
+# of the neighbour each one is tied to
+setOrder = ['Left','Bottom','Right','Top']
+reverseSetOrder = ['Right','Top','Left','Bottom']
+# Grid step to the neighbour on each side of setOrder
+sideSteps = [(-1,0), (0,-1), (1,0), (0,1)]
+
+
+class GridTopology(object):
+    '''
+    Lattice adjacency of an assembly grid.
+
+    assemblyDim: LIST - [cells in x, cells in y]
+    mask: ARRAY of BOOL (cells in x, cells in y) - cells that are present,
+          all cells when None
+    periodic: (BOOL, BOOL) - wrap the grid around in x / y
+
+    Attributes
+    ----------
+    nCells : INT - cells of the full grid (present or not)
+    present : ARRAY of BOOL (nCells,)
+    cells : ARRAY of INT - present cells
+    edges : ARRAY of INT (nEdges, 4) - one row per tied pair of edges:
+            [cell, side, neighbour, neighbourSide], sides as indices of
+            setOrder. Every pair appears once, from the cell with (x+y) even
+            when there is one (the checkerboard order of TieInstances).
+    indptr, indices, sides : ARRAY of INT - CSR adjacency: the neighbours of
+            cell are indices[indptr[cell]:indptr[cell+1]], tied through its
+            sides[indptr[cell]:indptr[cell+1]] (both directions of every edge)
+    '''
+
+    def __init__(self, assemblyDim, mask=None, periodic=(False, False)):
+        nx, ny = int(assemblyDim[0]), int(assemblyDim[1])
+        self.assemblyDim = [nx, ny]
+        self.periodic = (bool(periodic[0]), bool(periodic[1]))
+        self.nCells = nx*ny
+        if mask is None:
+            self.present = np.ones(self.nCells, dtype=bool)
+        else:
+            self.present = np.asarray(mask, dtype=bool).reshape(self.nCells)
+        self.cells = np.nonzero(self.present)[0]
+        self.x = self.cells // ny
+        self.y = self.cells % ny
+
+        # Neighbour of every present cell on every side (-1: none)
+        neighbours = -np.ones((len(self.cells), 4), dtype=int)
+        for k, (dx, dy) in enumerate(sideSteps):
+            x = self.x + dx
+            y = self.y + dy
+            if self.periodic[0]:
+                x = x % nx
+            if self.periodic[1]:
+                y = y % ny
+            inside = (x >= 0) & (x < nx) & (y >= 0) & (y < ny)
+            neighbour = np.where(inside, x*ny + y, 0)
+            inside &= self.present[neighbour]
+            neighbours[:, k] = np.where(inside, neighbour, -1)
+
+        # Edge list, every pair of tied edges once: even cells first (in
+        # order), odd cells only add pairs that wrap between two odd cells
+        order = np.concatenate([np.nonzero((self.x + self.y) % 2 == 0)[0],
+                                np.nonzero((self.x + self.y) % 2 == 1)[0]])
+        seen = set()
+        edges = []
+        for i in order:
+            cell = int(self.cells[i])
+            for k in range(4):
+                neighbour = int(neighbours[i, k])
+                if neighbour < 0:
+                    continue
+                opposite = (k + 2) % 4
+                key = min((cell, k), (neighbour, opposite))
+                if key in seen:
+                    continue
+                seen.add(key)
+                edges.append((cell, k, neighbour, opposite))
+        self.edges = np.array(edges, dtype=int).reshape(-1, 4)
+
+        # CSR adjacency over the full grid numbering
+        rows = np.concatenate([self.edges[:, 0], self.edges[:, 2]])
+        cols = np.concatenate([self.edges[:, 2], self.edges[:, 0]])
+        sides = np.concatenate([self.edges[:, 1], self.edges[:, 3]])
+        order = np.lexsort((sides, rows))
+        self.indices = cols[order]
+        self.sides = sides[order]
+        self.indptr = np.concatenate([[0], np.cumsum(np.bincount(rows, minlength=self.nCells))])
+
+    def neighbours(self, cell):
+        '''[(side, neighbour)] of a cell, sides as names of setOrder.'''
+        start, end = self.indptr[cell], self.indptr[cell+1]
+        return [(setOrder[k], int(n)) for k, n in zip(self.sides[start:end], self.indices[start:end])]
+
+    def boundaryCells(self, side):
+        '''Present cells on the 'Bottom' (y = 0) or 'Top' (y = ny-1) boundary.'''
+        row = 0 if side == 'Bottom' else self.assemblyDim[1] - 1
+        return [int(n) for n in self.cells[self.y == row]]
+
+    def adjacency(self):
+        '''scipy.sparse CSR matrix (nCells x nCells) of the ties, values are
+        1 + the side index (setOrder) of the row cell.'''
+        import scipy.sparse as sps
+        return sps.csr_matrix((self.sides + 1, self.indices, self.indptr),
+                              shape=(self.nCells, self.nCells))
+
+    def connectivity(self):
+        '''Dictionary of AssemblyConnectivity (1-based, 0 = no neighbour).'''
+        NOD = {}
+        for cell in range(self.nCells):
+            NOD[cell+1] = [0, 0, 0, 0]
+        for cell, k, neighbour, opposite in self.edges:
+            NOD[cell+1][k] = neighbour + 1
+            NOD[neighbour+1][opposite] = cell + 1
+        return NOD
+
+
+_topologies = {}
+
+def gridTopology(assemblyDim, mask=None, periodic=(False, False)):
+    '''GridTopology of the shape, built once per (assemblyDim, mask, periodic).'''
+    key = (tuple(int(n) for n in assemblyDim), tuple(bool(p) for p in periodic),
+           None if mask is None else np.asarray(mask, dtype=bool).tobytes())
+    if key not in _topologies:
+        _topologies[key] = GridTopology(assemblyDim, mask, periodic)
+    return _topologies[key]
+
+
+def AssemblyConnectivity(assemblyDim):
+    '''
+    Create connectivity matrix between the substructures for tie constraints.
+
+    Parameters
+    ----------
+    assemblyDim : LIST
+        #[Number of substructures to instance in x-direction,
+        # Number of substructure to instance in y-direction]
+
+    Returns
+    -------
+    NOD : DICT
+        Dictionary that describes which substructures are connected to which.
+        NOD[i] = [left, bottom, right, top] neighbours of instance i (1-based,
+        0 where there is none), see GridTopology for the compact form.
+
+    '''
+    return gridTopology(assemblyDim).connectivity()
@@ -0,0 +1,137 @@
+'''
+Incremental assembly solver
+
+Optimizer offspring usually differ from their parents in only a few of the
+cells chosen by nearestMatch. Instead of assembling and factorizing the whole
+condensed-stiffness system of 'condensation_solver.py' for every assembly, this
+solver keeps the factorization of a reference assembly and treats the changed
+cells as a low-rank correction (Woodbury identity):
+
+    (K + P D P^T)^-1 = K^-1 - K^-1 P (I + D P^T K^-1 P)^-1 D P^T K^-1
+
+where P selects the DOFs touched by the changed cells and D is the change of
+their stiffness. The rank of the update is the number of touched DOFs. Past
+max_rank, the new assembly is factorized from scratch and (with rebase) becomes
+the new reference, since later offspring tend to be closer to it.
+
+As in solve_assembly, the interior DOFs are factorized once per reference and
+condensed onto the reference point, so both load cases share one factorization
+and one low-rank correction (three right-hand sides).
+
+Timing counters (stats) show how many solves were updates versus
+refactorizations and how long each took.
+'''
+
+import time
+
+import numpy as np
+import scipy.sparse.linalg as spla
+
+from condensation_solver import (AssemblyModel, condense_reference_point, solve_condensed,
+                                 load_case_results)
+
+
+class IncrementalSolver(object):
+    '''
+    superelements: ARRAY - (nParts, 12, 12) retained-DOF stiffness of every part
+    stressScales: ARRAY - (nParts, 2) stress_scales of every part, or None to
+                  skip stresses
+    model: AssemblyModel - grid to solve (default from assembly_config.py)
+    max_rank: INT - largest update rank (touched DOFs) before refactorizing
+    rebase: BOOL - make a refactorized assembly the new reference
+    '''
+
+    def __init__(self, superelements, stressScales=None, model=None, max_rank=60, rebase=True):
+        if model is None:
+            model = AssemblyModel()
+        self.model = model
+        self.superelements = superelements
+        self.stressScales = stressScales
+        self.max_rank = max_rank
+        self.rebase = rebase
+        self.reference = None
+        self.factor = None
+        self.counters = {'updates': 0, 'refactors': 0,
+                         'update_time': 0., 'refactor_time': 0., 'update_rank': 0}
+
+    def factorize(self, partIndices):
+        '''Factorization of the interior DOFs of the assembly partIndices.'''
+        K = self.model.stiffness(self.superelements[partIndices]).tocsr()
+        interior = self.model.interiorDofs
+        return spla.splu(K[interior][:, interior].tocsc())
+
+    def set_reference(self, partIndices):
+        '''Makes partIndices the reference assembly.'''
+        self.reference = np.array(partIndices)[:self.model.nCells]
+        self.factor = self.factorize(self.reference)
+
+    def solve(self, partIndices):
+        '''k_xy, maxMises1, k_theta, maxMises2 of the assembly partIndices
+        (see condensation_solver.solve_assembly).'''
+        startTime = time.perf_counter()
+        partIndices = np.array(partIndices)[:self.model.nCells]
+        refactor = self.reference is None
+        if not refactor:
+            changed = np.flatnonzero((partIndices != self.reference) & self.model.present)
+            touched = np.unique(self.model.cellDofs[changed])
+            # Rank is bounded by the touched global DOFs (the reduced ones are fewer)
+            refactor = touched.size > self.max_rank
+        if refactor:
+            if self.rebase or self.reference is None:
+                self.set_reference(partIndices)
+                factor = self.factor
+            else:
+                factor = self.factorize(partIndices)
+        else:
+            factor = self.factor
+        K = self.model.stiffness(self.superelements[partIndices]).tocsr()
+
+        if refactor:
+            S, X = condense_reference_point(K, self.model, factor)
+        else:
+            delta = self.superelements[partIndices] - self.superelements[self.reference]
+            delta[partIndices == self.reference] = 0.
+            dK = self.model.stiffness(delta).tocsr()
+            interior, rp = self.model.interiorDofs, self.model.rpDofs
+            Kir = K[interior][:, rp].toarray()
+            X = self.woodbury(factor, dK[interior][:, interior], factor.solve(-Kir))
+            S = K[rp][:, rp].toarray() + Kir.T.dot(X)
+
+        cellScales = None if self.stressScales is None else self.stressScales[partIndices]
+        results = load_case_results(self.model,
+                                    lambda bcValues: solve_condensed(S, X, self.model, bcValues),
+                                    self.superelements[partIndices], cellScales)
+
+        if refactor:
+            self.counters['refactors'] += 1
+            self.counters['refactor_time'] += time.perf_counter()-startTime
+        else:
+            self.counters['updates'] += 1
+            self.counters['update_time'] += time.perf_counter()-startTime
+        return results
+
+    def woodbury(self, factor, dKff, y):
+        '''Corrects y = K^-1 b (one or several right-hand sides) for the update K + dKff.'''
+        rows, cols = dKff.nonzero()
+        touched = np.union1d(rows, cols)
+        if touched.size == 0:
+            return y
+        self.counters['update_rank'] = max(self.counters['update_rank'], touched.size)
+        D = dKff[touched][:, touched].toarray()
+        P = np.zeros((dKff.shape[0], touched.size))
+        P[touched, np.arange(touched.size)] = 1.
+        Z = factor.solve(P)   # K^-1 P
+        W = Z[touched]        # P^T K^-1 P
+        correction = np.linalg.solve(np.eye(touched.size) + D.dot(W), D.dot(y[touched]))
+        return y - Z.dot(correction)
+
+    def stats(self):
+        '''Update/refactor counts, mean times and their ratio.'''
+        stats = dict(self.counters)
+        if stats['updates']:
+            stats['mean_update_time'] = stats['update_time']/stats['updates']
+        if stats['refactors']:
+            stats['mean_refactor_time'] = stats['refactor_time']/stats['refactors']
+        if stats['updates'] and stats['refactors']:
+            stats['update_to_refactor'] = stats['mean_update_time']/stats['mean_refactor_time']
+        return stats
@@ -5,17 +5,24 @@ Last updated: 9/9/2020 by Patrick Walgren
 Originally created by the honorable Pedro Leal
 
 This script operates as a wrapper around any Abaqus process and monitors its status.
-The script waits until Abaqus is complete (signified by the *.exe processes ceasing to 
-exist) and then passes information back to the optimization/DOE, or will kill all associated
-processes if Abaqus stalls somewhere (sometimes Abaqus will get hung up and not do anything for
-hours). Note: This script is analysis- and VERSION-specific. There are process names that 
-must be changed according to the specific Abaqus version you are running. 
+The script waits until Abaqus is complete (the command it started and every process 
+that command started have exited, see supervisor.py) and then passes information back 
+to the optimization/DOE, or will kill that process tree if Abaqus stalls somewhere 
+(sometimes Abaqus will get hung up and not do anything for hours). Note: This script is 
+analysis- and VERSION-specific. The Abaqus command must be changed according to the 
+specific Abaqus version you are running. 
 
 Files needed:
     -The abaqus script that runs the job ('AssemblyModifyEdit.py' in this case)
     -The I/O files required to pass data from the optimizer to Abaqus (input.p, input.mat,output.p,
     and output.mat in this case) The output/input pickles (.p files) and matlab matrices (.mat files)
     are for passing information between python and matlab.
+    -catalog/ (or partsInfo.p, see catalog.py), nearest_match.py and assembly_config.py,
+    used to snap the design vector
+    onto the catalog and look the resulting assembly up in the evaluation cache 
+    (eval_cache.py, stored in evalCache.db) before Abaqus is started.
+    -results_log.py, timing.py - every run is appended to results.bin in this directory,
+     with the time of every stage (and to the evalTrace.json timeline)
 
                    
 
@@ -24,18 +31,16 @@ Things to change for a different analysis:
     149-155. 
     -If the design vector gets saved as something different than 'x', this must be accounted 
     for on line 178.
-    -The master optimization record gets written to on line 200 if the job times out. Be sure to
-    modify both the magnitudes of the penalized outputs for the specific design problem, as well as
-    the file name associated with the optimization. 
-    -Depending on the run time of your specific analysis, the variables time_terminate and 
-    increment_time should be changed. These can be changed on lines 176 and 178, respectively. 
-    The smaller the increment time, the less "slop" you'll have (where the kill code is waiting
-    but abaqus has already completed), but with more print statements (which may contribute to 
-    unneccesary overhead).
+    -The master optimization record (the results log, see results_log.py) gets a penalty 
+    record if the job times out. Be sure to modify the magnitudes of the penalized outputs
+    (assembly_config.penaltyOutputs) for the specific design problem.
+    -Depending on the run time of your specific analysis, the variable time_terminate 
+    should be changed (in run_abaqus and run_abaqus_batch). Completion is detected as soon as 
+    the Abaqus processes exit, so there is no polling increment to tune.
     
 Things to change for a different VERSION:
-    -All abaqus executables must be change. For Abaqus/2018, these are abq2018.exe. They are found
-    on lines 57,58, and 202. All "pre.exe", "standard.exe", etc. calls should stay the same.
+    -The abaqus command must be changed. For Abaqus/2018, this is abq2018 (abaqusCommand in
+    assembly_config.py).
     
     
 To-do:
@@ -45,120 +50,81 @@ To-do:
 '''
 
 import os
+import sys
 import time
 import math
 import pickle
 import json
-import win32api
 import subprocess as sp
+import threading
 
 import scipy.io
 import numpy as np
 
+import assembly_config
+from eval_cache import EvaluationCache, make_key
+from catalog import load_parts_info
+from nearest_match import catalogMatcher
+from scheduler import EvaluationScheduler
+from eval_server import evaluate_population, write_penalty_record
+from supervisor import run_supervised
+from condensation_solver import CondensationBackend
+from feasibility_screen import CERTAIN_FAIL, SCREEN_FILE, load_screen
+from results_log import DEFAULT_FILE, SCREENED, STAND_IN_FILE, ResultsLog
+from surrogate import SURROGATE_FILE, load_surrogate
+from deferred_viz import ARCHIVE_DIR
+import timing
+
 
 # from DOE_FullFactorial import DOE
 # from wing_model import model
 
-def enhanced_waitForCompletion(processes_to_track = ['ABQcaeK.exe', 'abq2018.exe','pre.exe', 'standard.exe'],
-                                processes_to_kill = ['ABQcaeK.exe', 'abq2018.exe','pre.exe', 'standard.exe'],
-                                increment_time=30., max_time=3600., not_on_kill_list = []):
-    flag = False
-    # Need to wait to get into standard
-
-    current_time = 0
-    process_exists = True
+def launch_abaqus(command, popen_dir, max_time, env=None):
+    """Runs the abaqus command (in the environment env, the one of this process
+    when None) and babysits it (see supervisor.py): waits for the
+    command and every process it starts, and kills exactly that process tree after
+    max_time seconds. Returns True if it had to be killed.
+    The launch is stamped for the CAE start-up time (timing.py), and the session
+    is split into start-up, evaluations and supervision tail from the records it
+    appended to the results log."""
     print('Start waiting')
-    while max_time>current_time and process_exists == True:
-        time.sleep(increment_time)
-        current_time += increment_time
-        tasklistrl = os.popen("tasklist").readlines()
-
-        process_exists = False
-        for process in processes_to_track :
-            for examine in tasklistrl:
-                if process == examine[0:len(process)]:
-                    pid = int(examine[29:34])
-                    if pid not in not_on_kill_list:
-                        process_exists = True
-        if process_exists:
-            print('Current run time: ' + str(current_time))
-        else:
-            print('Current run time: ' + str(current_time) + '. DONE!')
+    log = ResultsLog((env or os.environ).get('RESULTS_LOG'))
+    first = len(log)
+    timing.mark_launch(env)
+    start = time.time()
+    terminated = run_supervised(command, cwd=popen_dir, max_time=max_time, env=env)
+    end = time.time()
+    breakdown = timing.session_breakdown(start, end, log.records()[first:])
+    print('Abaqus session %.1f s: CAE start-up %.1f s, %i evaluations %.1f s, tail %.1f s'
+          % (breakdown['session'], breakdown['cae_start'], breakdown['records'],
+             breakdown['evaluations'], breakdown['tail']))
+    timing.trace_event('abaqus session', start, end - start, {'command':command})
+    timing.trace_event('supervise', end - breakdown['tail'], breakdown['tail'])
+    return terminated
 
-        
-    # If max running time was achieved and still not done, KILL!!
-    if max_time>=current_time and process_exists == True:
-        
-        flag = True
-        print('TIME TO KILL')
-        for process in processes_to_kill:
-            try:
-                kill(str(process), tasklistrl, not_on_kill_list)
-            except:
-                pass
-         
-    # If done, why even complain?! Just get out of there
-    
-    return flag
-
-def kill(process, tasklistrl=None, not_on_kill_list = []):
-    """This function has a dependency of win32api (which abaqus already has).
-       To install, just use pip install pypiwin32"""
-    if tasklistrl == None:
-        tasklistrl = os.popen("tasklist").readlines()
-    process_exists_forsure = False
-    gotpid = False
-    for examine in tasklistrl:
-        if process == examine[0:len(process)]:
-            process_exists_forsure = True
-    if process_exists_forsure:
-        print("That process exists.")
-    else:
-        print("That process does not exist.")
-        # sys.exit()
-    for getpid in tasklistrl:
-        if process == getpid[0:len(process)]:
-            pid = int(getpid[29:34])
-            if pid not in not_on_kill_list:
-                gotpid = True
-                try:
-                    handle = win32api.OpenProcess(1, False, pid)
-                    win32api.TerminateProcess(handle, 0)
-                    win32api.CloseHandle(handle)
-                    print("Successfully killed process %s on pid %d." % (getpid[0:len(process)], pid))
-                except win32api.error as err:
-                    print(err)
-                    # sys.exit()
-    if not gotpid:
-        print("Could not get process pid.")
-
-def get_good_pids(process, tasklistrl=None):
-    """This function has a dependency of win32api (which abaqus already has).
-       To install, just use pip install pypiwin32"""
-    if tasklistrl == None:
-        tasklistrl = os.popen("tasklist").readlines()
-
-    process_exists_forsure = False
-    gotpid = False
-    for examine in tasklistrl:
-        if process == examine[0:len(process)]:
-            process_exists_forsure = True
-    if process_exists_forsure:
-        print("That process exists.")
-    else:
-        print("That process does not exist.")
-        # sys.exit()
-    good_guys = [] 
-    for getpid in tasklistrl:
-        if process == getpid[0:len(process)]:
-            pid = int(getpid[29:34])
-            gotpid = True
-            good_guys.append(pid)
-    if not gotpid:
-        print("Could not get process pid.")
-    return good_guys
-
-def run_abaqus():
+def option_value(name, default):
+    """Value following name on the command line (e.g. --jobs 8), or default"""
+    if name in sys.argv[:-1]:
+        return type(default)(sys.argv[sys.argv.index(name)+1])
+    return default
+
+def set_results_log(current_dir, inputs):
+    """Points the results log (results_log.py), the trace (timing.py) and the
+    archive of deferred visualization (deferred_viz.py) of this run and of every
+    Abaqus session it starts at current_dir, and passes on the generation from
+    input.mat"""
+    os.environ.setdefault('RESULTS_LOG', os.path.join(current_dir, DEFAULT_FILE))
+    os.environ.setdefault('EVAL_TRACE', os.path.join(current_dir, timing.TRACE_FILE))
+    os.environ.setdefault('VIZ_ARCHIVE', os.path.join(current_dir, ARCHIVE_DIR))
+    if 'generation' in inputs:
+        os.environ['RESULTS_GENERATION'] = str(int(np.array(inputs['generation']).flatten()[0]))
+
+def snapped_parts(x, partsInfo):
+    '''Names of the catalog parts that nearestMatch assigns to the design vector x'''
+    matcher = catalogMatcher(partsInfo)
+    return list(matcher.names(matcher.indices(np.array(x, dtype=float).flatten()))[0])
+
+def run_abaqus(use_cache=True):
     # Define work directory (currently uses the command line one)
     current_dir = os.path.dirname(os.path.realpath('__file__'))
     # Command to execute
@@ -173,12 +139,17 @@ def run_abaqus():
     output_file = os.path.join(current_dir, 'output.p')
     # Output file to matlab 
     output_mat = os.path.join(current_dir, 'output.mat')
+    # Catalog used to snap the design vector
+    partsInfo_file = os.path.join(current_dir, 'partsInfo.p')
+    catalog_dir = os.path.join(current_dir, 'catalog')
+    # Evaluation cache shared by all runs in this directory
+    cache_file = os.path.join(current_dir, 'evalCache.db')
+    # Fitted feasibility screen (feasibility_screen.py)
+    screen_file = os.path.join(current_dir, SCREEN_FILE)
     # Command to execute
-    command = 'abq2018 cae nogui=' + abaqus_script
+    command = assembly_config.abaqusCommand + ' cae nogui=' + abaqus_script
     # Time to wait for termination
     time_terminate = 1200.
-    # Time increment for checking (if too small, will not work)
-    increment_time=5.
     # delete previous input/output files
     # try:
         # os.remove(input_file)
@@ -192,41 +163,188 @@ def run_abaqus():
     # Creating input file
     inputs = scipy.io.loadmat(input_mat)
     print(inputs['x'])
+    set_results_log(current_dir, inputs)
+    x = np.array(inputs['x'], dtype=float).flatten()
+
+    # Identical snapped assemblies give identical results, so skip Abaqus on a cache hit
+    if use_cache:
+        partsInfo = load_parts_info(catalog_dir, partsInfo_file)
+        part_names = snapped_parts(inputs['x'], partsInfo)
+        cache = EvaluationCache(cache_file)
+        cache_key = make_key(part_names)
+        outputs = cache.get(cache_key)
+        if outputs is not None:
+            print('Cache hit for assembly ' + cache_key)
+            print(cache.stats())
+            scipy.io.savemat(output_mat, mdict={'outputs': outputs})
+            return outputs
+
+    # Certain-fail assemblies are penalized without starting Abaqus
+    screen = load_screen(screen_file)
+    if screen is not None:
+        partsInfo = load_parts_info(catalog_dir, partsInfo_file)
+        indices = catalogMatcher(partsInfo).indices(x)[0]
+        if screen.classify_parts(indices, partsInfo) == CERTAIN_FAIL:
+            print('Certain-fail assembly (feasibility screen), not evaluated')
+            outputs = list(assembly_config.penaltyOutputs)
+            write_penalty_record(outputs, desiredAttributes=x, partIndices=indices,
+                                 status=SCREENED)
+            scipy.io.savemat(output_mat, mdict={'outputs': outputs})
+            return outputs
 
     np.savetxt(input_file, inputs['x'], fmt='%f')
     
-    # Check for executables that were running before so that
-    # you do not kill another one by accident
-    not_on_kill_list = get_good_pids('python.exe')
-    
-    # Run abaqus script
-    ps = sp.Popen(command, cwd = popen_dir, shell=True)
-    
-    # Wait for termination
-    terminated = enhanced_waitForCompletion(processes_to_track = ['python.exe'],
-                                            processes_to_kill = ['python.exe', 'ABQcaeK.exe', 'abq2018.exe','pre.exe', 'standard.exe'],
-                                            max_time=time_terminate, not_on_kill_list = not_on_kill_list,
-                                            increment_time = increment_time)
+    terminated = launch_abaqus(command, popen_dir, time_terminate)
     # If job is killed or if it did not converge, dummy outputs are generated
     if terminated:
-        outputs = [1.0E10,-1.0E10,-1.0E10]
-        fData=open('AssemblyOutput.txt', "a")
-        fData.write(str(outputs[0])+','+str(-1.0)+','+str(outputs[1])+','+str(-1.0)+','+str(outputs[2])+'\n') #mass is sent in as negative to minimize in optimizer
-        fData.close()
+        outputs = list(assembly_config.penaltyOutputs)
+        write_penalty_record(outputs, desiredAttributes=x)
     else:
         try:
             outputs = pickle.load( open( output_file, "rb" ),encoding='latin1' ) #latin1 encoding needed for translation between python 3.X and 2.X
         except:
-            outputs = [1.0E10,-1.0E10,-1.0E10] 
-            fData=open('AssemblyOutput.txt', "a")
-            fData.write(str(outputs[0])+','+str(-1.0)+','+str(outputs[1])+','+str(-1.0)+','+str(outputs[2])+'\n') #mass is sent in as negative to minimize in optimizer
-            fData.close()
+            outputs = list(assembly_config.penaltyOutputs)
+            write_penalty_record(outputs, desiredAttributes=x)
+        else:
+            # Only completed runs are cached; timeouts and crashes may not be repeatable
+            if use_cache:
+                cache.put(cache_key, outputs, part_names)
+                print(cache.stats())
             
     scipy.io.savemat(output_mat, mdict={'outputs': outputs})
     # write a matlab .mat file for the outputs 
     
     return outputs
 
+def population_evaluator(current_dir=None, use_cache=True, jobs=1, cpus=1, backend='abaqus'):
+    """Evaluation function of whole populations, evaluate(population, ids,
+    generation=None) -> (outputs, counts), as used by run_abaqus_batch and by the
+    Python optimizer (nsga2.py), which calls it once per generation and passes
+    the generation recorded with the runs (RESULTS_GENERATION when None).
+    
+    Rows that snap to the same assembly are evaluated once, cached assemblies and
+    assemblies the feasibility screen (feasibility_screen.py, once fitted)
+    classifies as certain-fail are not evaluated at all, nor are the ones the
+    surrogate model (surrogate.py, surrogate.npz once fitted) predicts, and the
+    remaining unique assemblies are run in a single Abaqus session
+    ('AssemblyModifyEdit.py -- batch'). outputs holds one row of [k_xy, -k_theta,
+    -mass] per individual, and ids (individual numbers) are recorded with every
+    run in the results log (results_log.py, results.bin).
+    With jobs > 1 the unique assemblies are spread over that many concurrent
+    Abaqus sessions, each in its own scratch directory (see scheduler.py), and 
+    every analysis job gets cpus CPUs.
+    With backend='python' the assemblies are solved in-process by the static
+    condensation solver (condensation_solver.py) instead of Abaqus, with one
+    solver kept for every population evaluated, and cached and logged in files
+    of their own (evalCachePython.db, resultsPython.bin).
+    evaluate may be called from several threads at once when jobs > 1 or with
+    the python backend."""
+    if current_dir is None:
+        current_dir = os.path.dirname(os.path.realpath('__file__'))
+    abaqus_script = 'AssemblyModifyEdit.py'
+    input_file = os.path.join(current_dir, 'input.txt')
+    id_file = os.path.join(current_dir, 'inputIds.txt')
+    output_file = os.path.join(current_dir, 'output.p')
+    partsInfo_file = os.path.join(current_dir, 'partsInfo.p')
+    catalog_dir = os.path.join(current_dir, 'catalog')
+    # The python backend is a stand-in: its outputs never answer Abaqus runs
+    cache_file = os.path.join(current_dir, 'evalCachePython.db' if backend == 'python'
+                              else 'evalCache.db')
+    if backend == 'python':
+        os.environ['RESULTS_LOG'] = os.path.join(current_dir, STAND_IN_FILE)
+    screen_file = os.path.join(current_dir, SCREEN_FILE)
+    surrogate_file = os.path.join(current_dir, SURROGATE_FILE)
+    command = assembly_config.abaqusCommand + ' cae nogui=' + abaqus_script + ' -- batch'
+    # Time to wait for termination, per individual run in the batch
+    time_terminate = 1200.
+    solvers = []
+    # Concurrent calls (steady-state mode of nsga2.py) share the solver, one at a
+    # time, or the scratch directories of one scheduler
+    solver_lock = threading.Lock()
+    scheduler = None
+    if backend != 'python' and jobs > 1:
+        scheduler = EvaluationScheduler(current_dir, max_workers=jobs, cpus_per_job=cpus,
+                                        time_terminate=time_terminate)
+
+    def evaluate_batch(designs, design_ids, generation=None):
+        if backend == 'python':
+            with solver_lock:
+                if not solvers:
+                    solvers.append(CondensationBackend(partsInfo, incremental=True))
+                batch_results = solvers[0].evaluate_batch(designs, design_ids, generation)
+                print(solvers[0].incremental.stats())
+            return batch_results
+        if scheduler is not None:
+            return scheduler.evaluate(designs, design_ids, generation)
+        try:
+            os.remove(output_file)
+        except OSError:
+            pass
+        np.savetxt(input_file, designs, fmt='%f')
+        np.savetxt(id_file, design_ids, fmt='%i')
+        env = None
+        if generation is not None:
+            env = dict(os.environ, RESULTS_GENERATION=str(generation))
+        terminated = launch_abaqus(command + ' cpus=' + str(cpus), current_dir,
+                                   time_terminate*len(designs), env)
+        try:
+            batch_results = pickle.load( open( output_file, "rb" ),encoding='latin1' )
+        except:
+            batch_results = []
+        if terminated:
+            print('Batch was killed after ' + str(len(batch_results)) + ' of ' + str(len(designs)) + ' runs')
+        return batch_results
+
+    # Rows that snap to the same assembly are run once, cached assemblies not at all
+    partsInfo = load_parts_info(catalog_dir, partsInfo_file)
+    cache = EvaluationCache(cache_file) if use_cache else None
+    screen = load_screen(screen_file)
+    surrogate = load_surrogate(surrogate_file)
+
+    def evaluate(population, ids, generation=None):
+        outputs, counts = evaluate_population(population, ids, partsInfo, evaluate_batch,
+                                              cache, screen, surrogate, generation)
+        print(str(counts['individuals']) + ' individuals, ' + str(counts['unique']) + ' unique assemblies')
+        if screen is not None:
+            print(str(counts['screened']) + ' runs avoided by the feasibility screen (' + repr(screen) + ')')
+        if surrogate is not None:
+            print(str(counts['predicted']) + ' runs avoided by the surrogate model (' + repr(surrogate) + ')')
+        print(counts)
+        if use_cache:
+            print(cache.stats())
+        return outputs, counts
+    return evaluate
+
+def run_abaqus_batch(use_cache=True, jobs=1, cpus=1, backend='abaqus'):
+    """Evaluates a whole population (one design vector per row of x in input.mat,
+    see population_evaluator) and writes the outputs matrix (one row of
+    [k_xy, -k_theta, -mass] per individual) to output.mat.
+    If input.mat also holds 'ids' (individual numbers) and 'generation', they are
+    recorded with every run in the results log (results_log.py, results.bin)."""
+    current_dir = os.path.dirname(os.path.realpath('__file__'))
+    input_mat = os.path.join(current_dir,'input.mat')
+    output_mat = os.path.join(current_dir, 'output.mat')
+
+    inputs = scipy.io.loadmat(input_mat)
+    set_results_log(current_dir, inputs)
+    population = np.atleast_2d(np.array(inputs['x'], dtype=float))
+    if 'ids' in inputs:
+        ids = np.array(inputs['ids']).flatten().astype(int)
+    else:
+        ids = np.arange(1, len(population)+1)
+
+    evaluate = population_evaluator(current_dir, use_cache, jobs, cpus, backend)
+    outputs, counts = evaluate(population, ids)
+    
+    scipy.io.savemat(output_mat, mdict={'outputs': outputs})
+    return outputs
+
 if __name__ == "__main__":
-    outputs = run_abaqus()
+    # python kill_code.py [--batch [--jobs N] [--cpus M] [--backend abaqus|python]]
+    if '--batch' in sys.argv:
+        outputs = run_abaqus_batch(jobs=option_value('--jobs', 1),
+                                   cpus=option_value('--cpus', 1),
+                                   backend=option_value('--backend', 'abaqus'))
+    else:
+        outputs = run_abaqus()
     print(outputs)
\ No newline at end of file
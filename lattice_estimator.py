@@ -0,0 +1,260 @@
+'''
+Lattice stiffness estimator
+
+Closed-form estimate of the assembly k_xy and k_theta from the catalog
+attributes (K_xy, K_y, K_theta) of the snapped parts, for a whole population at
+once. The assembly is a regular assemblyDim lattice between the encastre bottom
+and the rigid top: the cells of a column are in series, the columns in
+parallel. The estimate mixes the two bounds of such a lattice:
+    columns    sum over columns of (sum over cells of 1/K)^-1: columns that
+               only meet at the rigid top (no coupling through the side ties)
+    rows       (sum over rows of 1/(sum over cells of K))^-1: rows tied
+               rigidly, every row deforming as one
+and, for k_theta, the axial stiffness of the columns acting on the lever arm
+of their distance to the centre of the top, sum over columns of K_y,column*x^2,
+as a rotation of the rigid top stretches the columns on one side and
+compresses the others:
+    k_xy    = c_columns*columns(K_xy) + c_rows*rows(K_xy)
+    k_theta = c_columns*columns(K_theta) + c_rows*rows(K_theta)
+              + c_axial*sum(columns(K_y)*x^2)
+The coefficients are the coupling terms, calibrated by least squares on the
+relative error against completed runs. Uncalibrated they are 1, 0 (and 0): the
+uncoupled columns, exact for a single column such as a 1x1 assembly, which
+reproduces the catalog values of the part.
+
+It is the zero-cost first tier: a screen of a population (no solve) and a
+sanity check of solver outputs (check flags the runs that are further from
+the estimate than the calibration error allows).
+
+Keep this file importable by both the Abaqus Python 2.7 interpreter and Python 3.
+
+Files needed:
+    -assembly_config.py, grid_builder.py
+    -catalog.py, condensation_solver.py - recorded runs, for the calibration (see Usage)
+    -latticeEstimator.json - calibrated coefficients (see Usage), uncalibrated
+     without it
+
+Usage:
+    python lattice_estimator.py [results.bin | AssemblyOutput.txt PlottingInfo.txt] [--check]
+        calibrates the coefficients on the recorded runs (results log, or the
+        text records when it is empty), reports the calibration error
+        (in-sample and 5-fold cross-validated) and the time per assembly, and
+        writes latticeEstimator.json; --check lists the runs the calibrated
+        estimate flags
+'''
+
+import json
+
+import numpy as np
+
+import assembly_config
+from grid_builder import cellPositions
+
+ESTIMATOR_FILE = 'latticeEstimator.json'
+# Rows of the catalog attribute metrics (partsInfo[4])
+K_XY, K_Y, K_THETA = 0, 1, 2
+
+
+def lattice_shape(nCells, assemblyDim=None):
+    '''
+    assemblyDim of assemblies given by nCells catalog indices:
+    assembly_config.assemblyDim when there are enough of them (design vectors
+    may snap more cells than the grid holds, and only the first ones are
+    built), a single column otherwise.
+    '''
+    if assemblyDim is None:
+        assemblyDim = assembly_config.assemblyDim
+    if assemblyDim[0]*assemblyDim[1] <= nCells:
+        return [int(assemblyDim[0]), int(assemblyDim[1])]
+    return [1, nCells]
+
+
+def columns_bound(K):
+    '''Columns in parallel of cells in series: K ARRAY (nDesigns, nx, ny) -> (nDesigns,).'''
+    return (1./(1./K).sum(axis=2)).sum(axis=1)
+
+
+def rows_bound(K):
+    '''Rows in series of cells in parallel: K ARRAY (nDesigns, nx, ny) -> (nDesigns,).'''
+    return 1./(1./K.sum(axis=1)).sum(axis=1)
+
+
+class LatticeEstimator(object):
+    '''
+    xyCoefficients: LIST - c_columns, c_rows of k_xy
+    thetaCoefficients: LIST - c_columns, c_rows, c_axial of k_theta
+    runs: INT - runs the coefficients were calibrated on (0 = uncalibrated)
+    errors: DICT - relative error statistics of the calibration (see calibration_errors)
+    assemblyDim, dim: LIST - grid and cell box, assembly_config when None
+    '''
+
+    def __init__(self, xyCoefficients=None, thetaCoefficients=None, runs=0, errors=None,
+                 assemblyDim=None, dim=None):
+        if xyCoefficients is None:
+            xyCoefficients = [1., 0.]
+        if thetaCoefficients is None:
+            thetaCoefficients = [1., 0., 0.]
+        if dim is None:
+            dim = assembly_config.dim
+        self.xyCoefficients = np.array(xyCoefficients, dtype=float)
+        self.thetaCoefficients = np.array(thetaCoefficients, dtype=float)
+        self.runs = runs
+        self.errors = errors or {}
+        self.assemblyDim = assemblyDim
+        self.dim = dim
+
+    def terms(self, partIndices, partsInfo):
+        '''
+        Basis terms of every assembly: ARRAY (nDesigns, 2) of k_xy (columns,
+        rows) and ARRAY (nDesigns, 3) of k_theta (columns, rows, axial).
+
+        partIndices: ARRAY of INT (nDesigns, nCells) or (nCells,) - catalog indices
+        partsInfo: LIST - catalog (catalog.load_parts_info)
+        '''
+        partIndices = np.atleast_2d(np.asarray(partIndices, dtype=int))
+        assemblyDim = lattice_shape(partIndices.shape[1], self.assemblyDim)
+        partIndices = partIndices[:, :assemblyDim[0]*assemblyDim[1]]
+        nDesigns = len(partIndices)
+        # Cells in assembly order run fastest in y: (designs, x, y) per attribute
+        atts = np.array(partsInfo[4], dtype=float)
+        K = dict((k, atts[k][partIndices].reshape(nDesigns, assemblyDim[0], assemblyDim[1]))
+                 for k in (K_XY, K_Y, K_THETA))
+        x = cellPositions(assemblyDim)[0].reshape(assemblyDim)[:, 0]*(self.dim[3] - self.dim[0])
+        arms = (x - x.mean())**2
+        axial = ((1./(1./K[K_Y]).sum(axis=2))*arms).sum(axis=1)
+        xyTerms = np.column_stack([columns_bound(K[K_XY]), rows_bound(K[K_XY])])
+        thetaTerms = np.column_stack([columns_bound(K[K_THETA]), rows_bound(K[K_THETA]), axial])
+        return xyTerms, thetaTerms
+
+    def estimate(self, partIndices, partsInfo):
+        '''Estimated k_xy and k_theta of every assembly: two ARRAYs (nDesigns,).'''
+        xyTerms, thetaTerms = self.terms(partIndices, partsInfo)
+        return xyTerms.dot(self.xyCoefficients), thetaTerms.dot(self.thetaCoefficients)
+
+    def relative_errors(self, partIndices, k_xy, k_theta, partsInfo):
+        '''Relative errors of the estimate against solver outputs: ARRAY (nRuns, 2).'''
+        estimate = self.estimate(partIndices, partsInfo)
+        return np.column_stack([estimate[0]/np.asarray(k_xy, dtype=float) - 1.,
+                                estimate[1]/np.asarray(k_theta, dtype=float) - 1.])
+
+    def check(self, partIndices, k_xy, k_theta, partsInfo, factor=3.):
+        '''
+        Runs whose k_xy or k_theta is further from the estimate than factor
+        times the 95th percentile of the calibration error (ARRAY of BOOL), all
+        False when uncalibrated.
+        '''
+        errors = np.abs(self.relative_errors(partIndices, k_xy, k_theta, partsInfo))
+        if not self.runs:
+            return np.zeros(len(errors), dtype=bool)
+        limits = factor*np.array([self.errors['k_xy']['p95'], self.errors['k_theta']['p95']])
+        return np.any(errors > limits, axis=1)
+
+    def save(self, path=ESTIMATOR_FILE):
+        with open(path, 'w') as f:
+            json.dump({'k_xy':self.xyCoefficients.tolist(),
+                       'k_theta':self.thetaCoefficients.tolist(),
+                       'runs':self.runs, 'errors':self.errors}, f, indent=1)
+
+    def __repr__(self):
+        return ('LatticeEstimator(k_xy=%s, k_theta=%s, runs=%i)'
+                % (np.array2string(self.xyCoefficients, precision=4),
+                   np.array2string(self.thetaCoefficients, precision=4), self.runs))
+
+
+def calibration_errors(relative):
+    '''Median, 95th percentile and largest absolute relative error of k_xy and k_theta.'''
+    relative = np.abs(np.atleast_2d(relative))
+    return dict((name, {'median':float(np.median(relative[:, k])),
+                        'p95':float(np.percentile(relative[:, k], 95)),
+                        'max':float(relative[:, k].max())})
+                for k, name in enumerate(['k_xy', 'k_theta']))
+
+
+def relative_least_squares(terms, values):
+    '''Coefficients c minimizing the sum of (terms.c/values - 1)^2.'''
+    values = np.asarray(values, dtype=float)
+    return np.linalg.lstsq(terms/values[:, None], np.ones(len(values)), rcond=-1)[0]
+
+
+def calibrate(partIndices, k_xy, k_theta, partsInfo, assemblyDim=None):
+    '''
+    LatticeEstimator calibrated on completed runs (catalog indices of their
+    parts, solver k_xy and k_theta), with its in-sample errors.
+    '''
+    estimator = LatticeEstimator(assemblyDim=assemblyDim)
+    xyTerms, thetaTerms = estimator.terms(partIndices, partsInfo)
+    estimator.xyCoefficients = relative_least_squares(xyTerms, k_xy)
+    estimator.thetaCoefficients = relative_least_squares(thetaTerms, k_theta)
+    estimator.runs = len(xyTerms)
+    estimator.errors = calibration_errors(
+        estimator.relative_errors(partIndices, k_xy, k_theta, partsInfo))
+    return estimator
+
+
+def cross_validated_errors(partIndices, k_xy, k_theta, partsInfo, folds=5, seed=0):
+    '''Errors of estimators calibrated without the runs they are tested on.'''
+    partIndices = np.atleast_2d(np.asarray(partIndices, dtype=int))
+    k_xy, k_theta = np.asarray(k_xy, dtype=float), np.asarray(k_theta, dtype=float)
+    fold = np.random.RandomState(seed).permutation(len(k_xy)) % folds
+    relative = np.zeros((len(k_xy), 2))
+    for k in range(folds):
+        test = fold == k
+        estimator = calibrate(partIndices[~test], k_xy[~test], k_theta[~test], partsInfo)
+        relative[test] = estimator.relative_errors(partIndices[test], k_xy[test],
+                                                   k_theta[test], partsInfo)
+    return calibration_errors(relative)
+
+
+def load_estimator(path=ESTIMATOR_FILE):
+    '''Calibrated estimator saved by LatticeEstimator.save, uncalibrated if there is none.'''
+    try:
+        with open(path) as f:
+            data = json.load(f)
+    except (IOError, OSError, ValueError):
+        return LatticeEstimator()
+    return LatticeEstimator(data['k_xy'], data['k_theta'], data['runs'], data['errors'])
+
+
+def error_report(label, errors):
+    return '%-28s' % label + ', '.join(
+        ['%s median %.2f%%, 95%% %.2f%%, max %.2f%%' % (name, 100.*errors[name]['median'],
+         100.*errors[name]['p95'], 100.*errors[name]['max']) for name in ('k_xy', 'k_theta')])
+
+
+if __name__ == "__main__":
+    import sys
+    import time
+    from catalog import load_parts_info
+    from condensation_solver import recorded_runs
+    partsInfo = load_parts_info()
+    files = [arg for arg in sys.argv[1:] if arg.endswith('.txt')]
+    logs = [arg for arg in sys.argv[1:] if arg.endswith('.bin')]
+    runs = recorded_runs(partsInfo, *files, logFile=logs[0] if logs else None)
+    if not runs:
+        print('No completed runs recorded in the results log or AssemblyOutput.txt/PlottingInfo.txt')
+        sys.exit(1)
+    partIndices = np.array([run[0] for run in runs], dtype=int).reshape(len(runs), -1)
+    k_xy = np.array([run[1] for run in runs], dtype=float)
+    k_theta = np.array([run[2] for run in runs], dtype=float)
+
+    uncalibrated = LatticeEstimator()
+    print(error_report('Uncalibrated (columns):', calibration_errors(
+        uncalibrated.relative_errors(partIndices, k_xy, k_theta, partsInfo))))
+    estimator = calibrate(partIndices, k_xy, k_theta, partsInfo)
+    print(error_report('Calibrated, in-sample:', estimator.errors))
+    if len(runs) >= 10:
+        print(error_report('Calibrated, 5-fold:', cross_validated_errors(partIndices, k_xy,
+                                                                         k_theta, partsInfo)))
+    startTime = time.time()
+    estimator.estimate(partIndices, partsInfo)
+    print('%i runs, %.2f microseconds per assembly' % (len(runs),
+          1E6*(time.time() - startTime)/len(runs)))
+    estimator.save()
+    print(estimator)
+    if '--check' in sys.argv:
+        flagged = np.flatnonzero(estimator.check(partIndices, k_xy, k_theta, partsInfo))
+        print(str(len(flagged)) + ' runs further from the estimate than 3x the 95th percentile error')
+        relative = estimator.relative_errors(partIndices, k_xy, k_theta, partsInfo)
+        for run in flagged:
+            print('  run %i: k_xy %.4e (%+.1f%%), k_theta %.4e (%+.1f%%)'
+                  % (run, k_xy[run], 100.*relative[run, 0], k_theta[run], 100.*relative[run, 1]))
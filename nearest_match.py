@@ -0,0 +1,191 @@
+'''
+Substructure matching
+
+Maps the continuous design vector coming from the optimizer onto the discrete
+catalog of substructures stored in 'partsInfo.p'. Used by the Abaqus script
+('AssemblyModifyEdit.py') to pick the parts to instance, and by the optimization
+driver ('kill_code.py') to know which assembly a design vector will produce
+before Abaqus is ever started.
+
+CatalogMatcher answers a whole population at once: the catalog columns are put
+in a KD-tree (scipy.spatial.cKDTree) once, and every cell of every design vector
+is matched in one query. Without scipy (or for small catalogs) an exact
+vectorized brute-force search is used instead. nearestMatch keeps its original
+interface on top of the matcher.
+
+Keep this file importable by both the Abaqus Python 2.7 interpreter and Python 3.
+'''
+
+import numpy as np
+try:
+    from scipy.spatial import cKDTree
+except ImportError: # Abaqus Python may not ship scipy
+    cKDTree = None
+
+
+# Input design variable ranges for accurate mapping (Need to change CSV to be able to read in these values)
+#thickness = 0.1, 0.8
+thickMin = 0.05
+thickMax = 0.15
+#fillets = 0.1, 2.0
+filletMin = 0.04
+filletMax = 0.175
+# [min, max] of the normalized design variables of a cell (thick13, thick24, fillet)
+dvRanges = np.array([[thickMin, thickMax],
+                     [thickMin, thickMax],
+                     [filletMin, filletMax]])
+
+
+def partName(partsInfo, index):
+    '''
+    Abaqus part name of the substructure at the given catalog index,
+    e.g. 'Cross-12_Z12'.
+    '''
+    name = partsInfo[0][index]
+    if not isinstance(name, str): # partsInfo.p read from Python 3 holds bytes
+        name = name.decode('latin1')
+    return name+'-'+str(partsInfo[1][index])+'_Z'+str(partsInfo[1][index])
+
+
+def mapDesignVariables(desiredAttributes, nComp=3):
+    '''
+    Maps normalized design vectors ([0, 1] from the optimizer) onto the design 
+    variable ranges of the catalog.
+
+    Parameters
+    ----------
+    desiredAttributes : ARRAY
+        One design vector, or a population with one design vector per row.
+    nComp : INT
+        Design variables per cell.
+
+    Returns
+    -------
+    ARRAY of shape (nDesigns, nCells, nComp); the input is not modified.
+    '''
+    desiredAttributes = np.array(desiredAttributes, dtype=float)
+    nDesigns = desiredAttributes.shape[0] if desiredAttributes.ndim > 1 else 1
+    dAtt = desiredAttributes.reshape(nDesigns, -1, nComp)
+    ranges = dvRanges[:nComp]
+    return (ranges[:,1]-ranges[:,0])*dAtt + ranges[:,0]
+
+
+class CatalogMatcher(object):
+    '''
+    Nearest catalog part for every cell of every design vector (sum of square 
+    differences, as in nearestMatch), built once per catalog.
+
+    partsInfo: LIST - catalog read from partsInfo.p
+    desiredComp: ARRAY of INT - rows of partsInfo[partsInfoIndex] to compare
+    partsInfoIndex: INT - 3 to compare design variables, 4 attribute metrics
+    bruteForceSize: INT - catalogs up to this size are searched by brute force
+                          (also used when scipy is not available)
+    '''
+
+    def __init__(self, partsInfo, desiredComp=np.array([0,1,2]), partsInfoIndex=3,
+                 bruteForceSize=256):
+        self.partsInfo = partsInfo
+        self.desiredComp = np.asarray(desiredComp)
+        self.partsInfoIndex = partsInfoIndex
+        # One row per part
+        self.points = np.array(partsInfo[partsInfoIndex], dtype=float)[self.desiredComp].T
+        self.dvs = np.array(partsInfo[3], dtype=float).T
+        self.ams = np.array(partsInfo[4], dtype=float).T
+        self.tree = None
+        if cKDTree is not None and len(self.points) > bruteForceSize:
+            self.tree = cKDTree(self.points)
+
+    def indices(self, desiredAttributes):
+        '''Catalog index of every cell, shape (nDesigns, nCells).'''
+        if self.partsInfoIndex == 3:
+            query = mapDesignVariables(desiredAttributes, self.desiredComp.size)
+        else:
+            query = np.array(desiredAttributes, dtype=float)
+            query = query.reshape(query.shape[0] if query.ndim > 1 else 1, -1, self.desiredComp.size)
+        nDesigns, nCells = query.shape[:2]
+        query = query.reshape(-1, self.desiredComp.size)
+        if self.tree is not None:
+            index = self.tree.query(query)[1]
+        else:
+            # |q-p|^2 = |q|^2 - 2 q.p + |p|^2 (|q|^2 does not change the argmin), 
+            # in chunks to bound the memory of the (queries x parts) matrix
+            pointNorms = np.sum(np.square(self.points), axis=1)
+            chunk = max(1, 2**22//len(self.points))
+            index = np.empty(len(query), dtype=int)
+            for start in range(0, len(query), chunk):
+                q = query[start:start+chunk]
+                index[start:start+chunk] = (pointNorms - 2.*q.dot(self.points.T)).argmin(axis=1)
+        return index.reshape(nDesigns, nCells)
+
+    def match(self, desiredAttributes):
+        '''
+        Snaps one design vector or a population (one design vector per row).
+
+        Returns
+        -------
+        indices : ARRAY of INT (nDesigns, nCells) - catalog index of every cell
+        dvs : ARRAY (nDesigns, nCells, nDVs) - actual design variables
+        ams : ARRAY (nDesigns, nCells, nAMs) - actual attribute metrics
+        mass : ARRAY (nDesigns,) - summed mass (last attribute metric)
+        '''
+        indices = self.indices(desiredAttributes)
+        ams = self.ams[indices]
+        return indices, self.dvs[indices], ams, ams[:,:,-1].sum(axis=1)
+
+    def names(self, indices):
+        '''Part names of catalog indices (any shape), as an object array.'''
+        indices = np.asarray(indices)
+        names = np.empty(indices.shape, dtype='object')
+        for i, index in np.ndenumerate(indices):
+            names[i] = partName(self.partsInfo, index)
+        return names
+
+
+_matcher = None
+
+def catalogMatcher(partsInfo, desiredComp=np.array([0,1,2]), partsInfoIndex=3):
+    '''CatalogMatcher for partsInfo, reused while the same catalog is passed in.'''
+    global _matcher
+    desiredComp = np.asarray(desiredComp)
+    if (_matcher is None or _matcher.partsInfo is not partsInfo
+            or _matcher.partsInfoIndex != partsInfoIndex
+            or not np.array_equal(_matcher.desiredComp, desiredComp)):
+        _matcher = CatalogMatcher(partsInfo, desiredComp, partsInfoIndex)
+    return _matcher
+
+
+def nearestMatch(desiredAttributes, partsInfo, desiredComp, partsInfoIndex): #how should mass be handled
+    '''
+    Find nearest substructures based off of sum of square differences of attributes specified to compare
+
+    Parameters
+    ----------
+    desiredAttributes : LIST
+        Being read in from text file outputted by optimizer
+    partsInfo : list of Numpy ARRAYS [[STR],[INT],[STR],[ARRAYS of FLOATS],[ARRAYS of FLOATS],[ARRAYS of FLOATS]]
+        Contains all substructure's names, ID, Materials, array of design variables, array of attribute metrics, array of max mises
+    desiredComp : Numpy ARRAY
+        Desired components to compare; array of columns to compare within design variables or attribute metrics
+    partsInfoIndex : INT
+        Index to use with parts info to access design variables or attribute metrics
+
+    Returns
+    -------
+    Array of substructure names
+
+    '''
+
+    # Break up desiredAttributes into one row per substructure (mapped onto the DV ranges)
+    matcher = catalogMatcher(partsInfo, desiredComp, partsInfoIndex)
+    indices, dvs, ams, mass = matcher.match(desiredAttributes)
+    if partsInfoIndex == 3:
+        print(mapDesignVariables(desiredAttributes, desiredComp.size)[0])
+    nCells = indices.shape[1]
+    # Object arrays, one entry per substructure
+    assemblyMod = matcher.names(indices[0])
+    actualDVs = np.empty([nCells],dtype='object')
+    actualAMs = np.empty([nCells],dtype='object')
+    for n in range(nCells):
+        actualDVs[n] = dvs[0,n]
+        actualAMs[n] = ams[0,n]
+    return assemblyMod, actualDVs, actualAMs, mass[0]
@@ -0,0 +1,513 @@
+'''
+NSGA-II optimizer
+
+Python counterpart of the gamultiobj loop of 'Optimizer_with_kill_code.m'
+(population 250, 50 generations, design variables in [0, 1]): NSGA-II with
+fast non-dominated sorting and crowding distance computed over the whole
+population with NumPy (dominance matrix, one pass per front), binary
+tournament selection, simulated binary crossover and polynomial mutation.
+
+Every generation goes to the evaluation layer as one batch, in this process:
+evaluate(population, ids, generation) -> outputs ([k_xy, -k_theta, -mass] per
+row), e.g.
+kill_code.population_evaluator (snapping, de-duplication, evaluation cache,
+feasibility screen, surrogate model, Abaqus sessions or the python backend) or
+a running evaluation server (eval_client.py). There is no input.mat/output.mat
+relay and no 'python kill_code.py' process per call; individuals and
+generations are numbered as in the MATLAB driver and recorded in the results
+log.
+
+As in the MATLAB driver the objectives are -outputs, minimized (maximum k_xy,
+minimum k_theta and mass). Rows with the penalty outputs
+(assembly_config.penaltyOutputs: killed, failed, yielded or screened
+assemblies) are infeasible: every feasible individual dominates them, so they
+never make the Pareto front whatever the sign of the penalty.
+
+The optimizer warm-starts from population.mat ('restart_population', written
+by myoutput in the MATLAB driver and by this module after every generation)
+and from the recorded design vectors of OptimizerOutputRound3.txt (latest rows
+first); vectors of smaller assemblies are tiled to the design length, and
+missing individuals are drawn at random.
+
+With --async the run is steady-state and asynchronous instead of generational
+(SteadyStateNSGA2): every one of the --jobs workers evaluates one individual at
+a time, and as soon as one returns, the population is updated and a new
+offspring is dispatched, so a slow or killed run (up to time_terminate in
+kill_code.py) only holds up its own worker instead of the whole generation.
+Both modes end with the evaluations per hour and the worker utilization of the
+run, from the results log (run_statistics), to compare them.
+
+Files needed:
+    -kill_code.py and the evaluation pipeline (or a running eval_server.py)
+    -population.mat / OptimizerOutputRound3.txt for a warm start
+
+Usage:
+    python nsga2.py [--population 250] [--generations 50] [--cells 64] [--seed 0]
+                    [--backend abaqus|python|server] [--jobs 1] [--cpus 1]
+                    [--port 50007 | --unix eval.sock] [--no-cache]
+                    [--restart population.mat OptimizerOutputRound3.txt ...] [--cold]
+                    [--async]
+        --cold starts from a random population; the final population and its
+        Pareto front are written to optimizerOutput.mat (x, fval, population,
+        scores, like the outputs of gamultiobj)
+'''
+
+import os
+import sys
+import time
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import numpy as np
+import scipy.io
+
+import assembly_config
+from kill_code import option_value
+from results_log import PREDICTED, SCREENED, STAGES, read_log
+
+RESTART_FILES = ['population.mat', 'OptimizerOutputRound3.txt']
+CHECKPOINT_FILE = 'population.mat'
+OUTPUT_FILE = 'optimizerOutput.mat'
+
+
+def dominance(F, feasible=None):
+    '''
+    Dominance matrix D (N, N): D[i, j] when individual i dominates j (no
+    objective worse, one better). With feasible, a feasible individual
+    dominates every infeasible one, and infeasible ones do not dominate
+    feasible ones.
+    '''
+    F = np.asarray(F, dtype=float)
+    D = (np.all(F[:, None, :] <= F[None, :, :], axis=2)
+         & np.any(F[:, None, :] < F[None, :, :], axis=2))
+    if feasible is not None:
+        feasible = np.asarray(feasible, dtype=bool)
+        same = feasible[:, None] == feasible[None, :]
+        D = (D & same) | (feasible[:, None] & ~feasible[None, :])
+    return D
+
+
+def non_dominated_sort(F, feasible=None):
+    '''Front of every individual (0: non-dominated), fast non-dominated sorting.'''
+    D = dominance(F, feasible)
+    # Number of individuals dominating each one, reduced as fronts are removed
+    count = D.sum(axis=0)
+    rank = np.full(len(D), -1, dtype=int)
+    remaining = np.ones(len(D), dtype=bool)
+    front = 0
+    while remaining.any():
+        current = remaining & (count == 0)
+        rank[current] = front
+        remaining &= ~current
+        count = count - D[current].sum(axis=0)
+        front += 1
+    return rank
+
+
+def crowding_distance(F, rank):
+    '''Crowding distance of every individual within its front (inf at the ends).'''
+    F = np.asarray(F, dtype=float)
+    distance = np.zeros(len(F))
+    for front in np.unique(rank):
+        members = np.where(rank == front)[0]
+        if len(members) <= 2:
+            distance[members] = np.inf
+            continue
+        order = np.argsort(F[members], axis=0)
+        values = np.take_along_axis(F[members], order, axis=0)
+        span = values[-1] - values[0]
+        span[span == 0] = 1.
+        gaps = np.empty_like(values)
+        gaps[1:-1] = (values[2:] - values[:-2]) / span
+        gaps[0] = gaps[-1] = np.inf
+        contributions = np.empty_like(values)
+        np.put_along_axis(contributions, order, gaps, axis=0)
+        distance[members] = contributions.sum(axis=1)
+    return distance
+
+
+def tournament(rank, crowding, n, rng):
+    '''Indices of n binary tournament winners (lower front, then larger crowding).'''
+    a = rng.randint(len(rank), size=n)
+    b = rng.randint(len(rank), size=n)
+    aWins = (rank[a] < rank[b]) | ((rank[a] == rank[b]) & (crowding[a] >= crowding[b]))
+    return np.where(aWins, a, b)
+
+
+def sbx_crossover(P1, P2, rng, eta=15., probability=0.9, lower=0., upper=1.):
+    '''
+    Simulated binary crossover of the parent rows P1 and P2 (bounded, every
+    variable of a crossed pair with probability 0.5). Returns two children.
+    '''
+    n, d = P1.shape
+    cross = ((rng.rand(n, 1) < probability) & (rng.rand(n, d) < 0.5)
+             & (np.abs(P1 - P2) > 1E-14))
+    y1, y2 = np.minimum(P1, P2), np.maximum(P1, P2)
+    delta = np.where(cross, y2 - y1, 1.)
+    u = rng.rand(n, d)
+    def spread(beta):
+        alpha = 2. - beta**-(eta + 1.)
+        return np.where(u <= 1./alpha, (u*alpha)**(1./(eta + 1.)),
+                        (1./(2. - u*alpha))**(1./(eta + 1.)))
+    c1 = 0.5*((y1 + y2) - spread(1. + 2.*(y1 - lower)/delta)*delta)
+    c2 = 0.5*((y1 + y2) + spread(1. + 2.*(upper - y2)/delta)*delta)
+    c1, c2 = np.clip(c1, lower, upper), np.clip(c2, lower, upper)
+    swap = rng.rand(n, d) < 0.5
+    return (np.where(cross, np.where(swap, c2, c1), P1),
+            np.where(cross, np.where(swap, c1, c2), P2))
+
+
+def polynomial_mutation(X, rng, eta=20., probability=None, lower=0., upper=1.):
+    '''Bounded polynomial mutation, every variable with probability (1/d by default).'''
+    n, d = X.shape
+    if probability is None:
+        probability = 1./d
+    span = upper - lower
+    u = rng.rand(n, d)
+    power = 1./(eta + 1.)
+    below = 2.*u + (1. - 2.*u)*(1. - (X - lower)/span)**(eta + 1.)
+    above = 2.*(1. - u) + 2.*(u - 0.5)*(1. - (upper - X)/span)**(eta + 1.)
+    step = np.where(u < 0.5, np.abs(below)**power - 1., 1. - np.abs(above)**power)
+    mutate = rng.rand(n, d) < probability
+    return np.where(mutate, np.clip(X + step*span, lower, upper), X)
+
+
+def objectives(outputs):
+    '''Objectives (-outputs, minimized) and feasibility (not the penalty outputs).'''
+    outputs = np.atleast_2d(np.array(outputs, dtype=float))
+    feasible = ~np.all(outputs == np.array(assembly_config.penaltyOutputs, dtype=float), axis=1)
+    return -outputs, feasible
+
+
+def survivors(F, size, feasible=None):
+    '''
+    Environmental selection: indices of the size best individuals (whole fronts,
+    the last one cut by crowding distance), with their front and crowding.
+    '''
+    rank = non_dominated_sort(F, feasible)
+    crowding = crowding_distance(F, rank)
+    chosen = np.lexsort((-crowding, rank))[:size]
+    return chosen, rank[chosen], crowding[chosen]
+
+
+def initial_population(size, nDesign, files=RESTART_FILES, rng=None):
+    '''
+    Warm-start population: 'restart_population' of the .mat files, then the
+    rows of the text files (latest first), tiled or cut to nDesign and clipped
+    to [0, 1]; duplicate rows are dropped and the population is completed with
+    random individuals.
+    '''
+    from benchmark import load_designs
+    if rng is None:
+        rng = np.random.RandomState()
+    rows = []
+    for path in files:
+        if not os.path.isfile(path):
+            continue
+        if path.endswith('.mat'):
+            data = scipy.io.loadmat(path)
+            if 'restart_population' in data:
+                rows.extend([np.resize(row, nDesign) for row in
+                             np.atleast_2d(np.array(data['restart_population'], dtype=float))])
+        else:
+            rows.extend(load_designs([path], nDesign)[::-1])
+    population = []
+    seen = set()
+    for row in rows:
+        row = np.clip(row, 0., 1.)
+        key = row.tobytes()
+        if key not in seen:
+            seen.add(key)
+            population.append(row)
+        if len(population) == size:
+            break
+    restarted = len(population)
+    if restarted < size:
+        population.extend(rng.rand(size - restarted, nDesign))
+    print(str(restarted) + ' of ' + str(size) + ' individuals from ' + ', '.join(files))
+    return np.array(population).reshape(size, nDesign)
+
+
+def batch_evaluator(useCache=True, jobs=1, cpus=1, backend='abaqus'):
+    '''evaluate(population, ids, generation) of kill_code.population_evaluator
+    (outputs only).'''
+    from kill_code import population_evaluator
+    evaluate = population_evaluator(None, useCache, jobs, cpus, backend)
+    def evaluator(population, ids, generation=None):
+        return evaluate(population, ids, generation)[0]
+    return evaluator
+
+
+def server_evaluator(port=None, unix=None):
+    '''evaluate(population, ids, generation) of a running evaluation server
+    (which numbers the individuals and generations itself), one connection per
+    calling thread.'''
+    from eval_client import EvaluationClient
+    from eval_server import DEFAULT_PORT
+    clients = threading.local()
+    def evaluator(population, ids, generation=None):
+        if not hasattr(clients, 'client'):
+            clients.client = EvaluationClient(port or DEFAULT_PORT, unix)
+        return clients.client.evaluate(population)
+    return evaluator
+
+
+def run_statistics(start, end, individuals, workers=1, logPath=None):
+    '''
+    Throughput of a run between the epoch times start and end, from the
+    results log: individuals and solver evaluations (records of the run, the
+    screened and predicted ones excepted) per hour, and worker utilization, the evaluation
+    time (total, plus the CAE start-up of the Abaqus sessions) over
+    workers*(end - start).
+    '''
+    records = read_log(logPath)
+    records = records[(records['time'] >= start) & (records['time'] <= end)
+                      & (records['status'] != SCREENED) & (records['status'] != PREDICTED)]
+    wall = np.array(records['wall'], dtype=float).reshape(len(records), len(STAGES))
+    busy = (np.nansum(wall[:, STAGES.index('total')])
+            + np.nansum(wall[:, STAGES.index('cae_start')]))
+    seconds = max(end - start, 1E-9)
+    return {'seconds':seconds, 'individuals':individuals, 'evaluations':len(records),
+            'individuals_per_hour':3600.*individuals/seconds,
+            'evaluations_per_hour':3600.*len(records)/seconds,
+            'workers':workers, 'utilization':busy/(workers*seconds)}
+
+
+def statistics_report(statistics):
+    return ('%i individuals, %i solver evaluations in %.1f s: %.0f evaluations/hour '
+            '(%.0f individuals/hour), worker utilization %.1f%% of %i workers'
+            % (statistics['individuals'], statistics['evaluations'], statistics['seconds'],
+               statistics['evaluations_per_hour'], statistics['individuals_per_hour'],
+               100.*statistics['utilization'], statistics['workers']))
+
+
+class NSGA2(object):
+    '''
+    evaluate: FUNCTION - (population, ids, generation) -> outputs matrix, one
+              [k_xy, -k_theta, -mass] row per individual; generation is
+              recorded with the runs in the results log
+    nDesign: INT - design variables per individual (3 per substructure)
+    populationSize, generations: INT - as in gamultiobj
+    seed: INT - seed of the initial population and of the variation
+    crossoverProbability, crossoverEta: FLOAT - SBX probability per pair and
+              distribution index
+    mutationEta: FLOAT - polynomial mutation distribution index
+    mutationProbability: FLOAT - per variable (1/nDesign when None)
+    firstId, firstGeneration: INT - number of the first individual and
+              generation, recorded in the results log
+    checkpoint: STR - .mat file the population is saved to after every
+              generation ('restart_population', readable by the MATLAB
+              driver), or None
+    workers: INT - solver workers behind evaluate (for the utilization reported
+              by run_statistics)
+    '''
+
+    def __init__(self, evaluate, nDesign, populationSize=250, generations=50, seed=0,
+                 crossoverProbability=0.9, crossoverEta=15., mutationEta=20.,
+                 mutationProbability=None, firstId=1, firstGeneration=0,
+                 checkpoint=CHECKPOINT_FILE, workers=1):
+        self.evaluator = evaluate
+        self.nDesign = nDesign
+        self.populationSize = populationSize
+        self.generations = generations
+        self.rng = np.random.RandomState(seed)
+        self.crossoverProbability = crossoverProbability
+        self.crossoverEta = crossoverEta
+        self.mutationEta = mutationEta
+        self.mutationProbability = mutationProbability
+        self.nextId = firstId
+        self.generation = firstGeneration
+        self.checkpoint = checkpoint
+        self.workers = workers
+        self.statistics = None
+
+    def evaluate(self, population):
+        '''Objectives (-outputs) and feasibility of a population, as one batch.'''
+        ids = np.arange(self.nextId, self.nextId + len(population))
+        self.nextId += len(population)
+        return objectives(self.evaluator(population, ids, self.generation))
+
+    def offspring(self, population, rank, crowding, n=None):
+        '''n offspring of the population (populationSize by default): tournament,
+        SBX and polynomial mutation.'''
+        if n is None:
+            n = self.populationSize
+        parents = tournament(rank, crowding, 2*((n + 1)//2), self.rng)
+        children = sbx_crossover(population[parents[0::2]], population[parents[1::2]],
+                                 self.rng, self.crossoverEta, self.crossoverProbability)
+        children = np.concatenate(children)[:n]
+        return polynomial_mutation(children, self.rng, self.mutationEta,
+                                   self.mutationProbability)
+
+    def save(self, population, scores, path):
+        scipy.io.savemat(path, mdict={'restart_population':population, 'restart_scores':scores,
+                                      'generation':self.generation, 'indNum':self.nextId - 1})
+
+    def run(self, population=None):
+        '''
+        Runs the generations from population (random when None). Returns the
+        final population, its objectives and feasibility.
+        '''
+        if population is None:
+            population = self.rng.rand(self.populationSize, self.nDesign)
+        runStart = startTime = time.time()
+        firstId = self.nextId
+        scores, feasible = self.evaluate(population)
+        chosen, rank, crowding = survivors(scores, self.populationSize, feasible)
+        population, scores, feasible = population[chosen], scores[chosen], feasible[chosen]
+        self.report(time.time() - startTime, rank, feasible)
+        for generation in range(self.generations):
+            self.generation += 1
+            startTime = time.time()
+            children = self.offspring(population, rank, crowding)
+            childScores, childFeasible = self.evaluate(children)
+            population = np.concatenate([population, children])
+            scores = np.concatenate([scores, childScores])
+            feasible = np.concatenate([feasible, childFeasible])
+            chosen, rank, crowding = survivors(scores, self.populationSize, feasible)
+            population, scores, feasible = population[chosen], scores[chosen], feasible[chosen]
+            if self.checkpoint is not None:
+                self.save(population, scores, self.checkpoint)
+            self.report(time.time() - startTime, rank, feasible)
+        self.statistics = run_statistics(runStart, time.time(), self.nextId - firstId,
+                                         self.workers)
+        print(statistics_report(self.statistics))
+        return population, scores, feasible
+
+    def report(self, seconds, rank, feasible):
+        print('generation %i: %.1f s, %i on the Pareto front, %i infeasible, %i individuals so far'
+              % (self.generation, seconds, np.sum((rank == 0) & feasible),
+                 np.sum(~feasible), self.nextId - 1))
+
+
+class SteadyStateNSGA2(NSGA2):
+    '''
+    Asynchronous steady-state NSGA-II: workers individuals are evaluated at a
+    time, each on its own (evaluate is called with one row, from several
+    threads). As soon as one returns it joins the population, the worst
+    individual is dropped (the environmental selection of NSGA-II over
+    populationSize + 1) and a new offspring of the current population is
+    dispatched, so no worker waits for the slowest individual of a
+    generation. The run stops after as many evaluations as the generational
+    mode (populationSize*(generations + 1)). Every populationSize completed
+    individuals count as a generation (report, checkpoint, and the generation
+    recorded in the results log for the individuals dispatched after it).
+    '''
+
+    def run(self, population=None):
+        '''
+        Dispatches population (random individuals when None) first, then
+        offspring. Returns the final population, its objectives and feasibility.
+        '''
+        if population is None:
+            population = self.rng.rand(self.populationSize, self.nDesign)
+        pending = list(population)
+        budget = self.populationSize*(self.generations + 1)
+        X = np.zeros((0, self.nDesign))
+        scores = np.zeros((0, len(assembly_config.penaltyOutputs)))
+        feasible = np.zeros(0, dtype=bool)
+        rank = crowding = np.zeros(0)
+        firstGeneration, firstId = self.generation, self.nextId
+        running = {}
+        completed = 0
+        runStart = startTime = time.time()
+
+        def evaluate_one(x, indNum, generation):
+            return self.evaluator(x[None, :], np.array([indNum]), generation)
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            while True:
+                while len(running) < self.workers and self.nextId - firstId < budget:
+                    if pending:
+                        x = pending.pop(0)
+                    elif len(X) >= 2:
+                        x = self.offspring(X, rank, crowding, 1)[0]
+                    else:
+                        x = self.rng.rand(self.nDesign)
+                    self.generation = firstGeneration + completed//self.populationSize
+                    running[pool.submit(evaluate_one, x, self.nextId, self.generation)] = x
+                    self.nextId += 1
+                if not running:
+                    break
+                done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+                for future in done:
+                    x = running.pop(future)
+                    try:
+                        score, fit = objectives(future.result())
+                    except Exception as err:
+                        print('Evaluation failed: ' + str(err))
+                        score, fit = objectives(assembly_config.penaltyOutputs)
+                    X = np.concatenate([X, x[None, :]])
+                    scores = np.concatenate([scores, score])
+                    feasible = np.concatenate([feasible, fit])
+                    chosen, rank, crowding = survivors(scores, self.populationSize, feasible)
+                    X, scores, feasible = X[chosen], scores[chosen], feasible[chosen]
+                    completed += 1
+                    if completed % self.populationSize == 0:
+                        self.generation = firstGeneration + completed//self.populationSize - 1
+                        if self.checkpoint is not None:
+                            self.save(X, scores, self.checkpoint)
+                        self.report(time.time() - startTime, rank, feasible)
+                        startTime = time.time()
+        self.statistics = run_statistics(runStart, time.time(), completed, self.workers)
+        print(statistics_report(self.statistics))
+        return X, scores, feasible
+
+
+def pareto_front(population, scores, feasible):
+    '''Feasible non-dominated individuals and their objectives.'''
+    front = (non_dominated_sort(scores, feasible) == 0) & feasible
+    return population[front], scores[front]
+
+
+def restart_files(argv=None):
+    '''Files following --restart on the command line (RESTART_FILES by default).'''
+    if argv is None:
+        argv = sys.argv
+    if '--restart' not in argv:
+        return RESTART_FILES
+    files = []
+    for arg in argv[argv.index('--restart')+1:]:
+        if arg.startswith('--'):
+            break
+        files.append(arg)
+    return files
+
+
+if __name__ == "__main__":
+    populationSize = option_value('--population', 250)
+    nDesign = 3*option_value('--cells', 64)
+    seed = option_value('--seed', 0)
+    backend = option_value('--backend', 'abaqus')
+    if backend == 'server':
+        from eval_server import server_address
+        port, unix = server_address()
+        evaluate = server_evaluator(port, unix)
+    else:
+        evaluate = batch_evaluator('--no-cache' not in sys.argv, option_value('--jobs', 1),
+                                   option_value('--cpus', 1), backend)
+
+    firstId, firstGeneration = 1, 0
+    population = None
+    if '--cold' not in sys.argv:
+        files = restart_files()
+        population = initial_population(populationSize, nDesign, files,
+                                        np.random.RandomState(seed))
+        # Continue the numbering of a run checkpointed by this module
+        if CHECKPOINT_FILE in files and os.path.isfile(CHECKPOINT_FILE):
+            checkpoint = scipy.io.loadmat(CHECKPOINT_FILE)
+            if 'indNum' in checkpoint and 'generation' in checkpoint:
+                firstId = int(np.array(checkpoint['indNum']).flatten()[0]) + 1
+                firstGeneration = int(np.array(checkpoint['generation']).flatten()[0]) + 1
+
+    # Steady-state mode: one worker per Abaqus session (--jobs)
+    optimizer_class = SteadyStateNSGA2 if '--async' in sys.argv else NSGA2
+    optimizer = optimizer_class(evaluate, nDesign, populationSize,
+                                option_value('--generations', 50), seed, firstId=firstId,
+                                firstGeneration=firstGeneration,
+                                workers=option_value('--jobs', 1))
+    population, scores, feasible = optimizer.run(population)
+    x, fval = pareto_front(population, scores, feasible)
+    scipy.io.savemat(OUTPUT_FILE, mdict={'x':x, 'fval':fval, 'population':population,
+                                         'scores':scores})
+    print(str(len(x)) + ' individuals on the Pareto front, written to ' + OUTPUT_FILE)
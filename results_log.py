@@ -0,0 +1,394 @@
+'''
+Results log
+
+Append-only binary store of every evaluation, with one fixed-width record per
+evaluated individual. It replaces the text records AssemblyOutput.txt and
+PlottingInfo.txt (still written with assembly_config.textRecords = 1). The file is
+a header (format, record layout) followed by the records, so it can be memory
+mapped as a numpy structured array of any size (read_log), with the last record
+read in O(1) (ResultsLog.last) and generations selected without parsing text
+(ResultsLog.generation).
+
+Record fields:
+    id            individual number (-1 if unknown)
+    generation    optimizer generation (passed by the driver with the evaluation,
+                  or the RESULTS_GENERATION environment variable of the process,
+                  set for the Abaqus sessions)
+    status        OK, YIELDED (penalized for yielding), FAILED (killed or crashed),
+                  SCREENED (certain-fail, see feasibility_screen.py) or PREDICTED
+                  (outputs predicted by the surrogate model, see surrogate.py)
+    time          end of the evaluation (seconds since the epoch)
+    parts         catalog index of the part in every cell
+    desired       design vector from the optimizer
+    dvs, ams      actual design variables / attribute metrics of every cell
+    outputs       [k_xy, -k_theta, -mass] sent back to the optimizer
+    k_xy, k_theta, maxMises1, maxMises2, mass, governingCell
+    wall, cpu     seconds per pipeline stage (STAGES), NaN where not measured
+
+Records are appended with a single write on a file opened in append mode,
+under an exclusive lock, so concurrent evaluators (scheduler.py workers,
+several servers) can share one log. The log of a run is 'results.bin' in the
+working directory, or the path in the RESULTS_LOG environment variable (set by
+kill_code.py so that scratch directories write to the same log).
+
+Keep this file importable by both the Abaqus Python 2.7 interpreter and Python 3.
+
+Files needed:
+    -assembly_config.py
+
+Usage:
+    python results_log.py [results.bin] [--generation N] [--csv out.csv]
+        summary of the log (records per status and generation, last record)
+'''
+
+import os
+import sys
+import json
+import time
+
+import numpy as np
+
+import assembly_config
+
+try:
+    import fcntl
+except ImportError: # Windows
+    fcntl = None
+    import msvcrt
+
+
+MAGIC = b'RESULTS1'
+HEADER_SIZE = 4096
+DEFAULT_FILE = 'results.bin'
+# Log of the python stand-in (condensation_solver.py), kept apart from the
+# Abaqus runs the screen, surrogate and lattice estimator are fitted from
+STAND_IN_FILE = 'resultsPython.bin'
+
+OK = 0
+YIELDED = 1
+FAILED = 2
+SCREENED = 3
+PREDICTED = 4
+STATUS_NAMES = {OK:'ok', YIELDED:'yielded', FAILED:'failed', SCREENED:'screened',
+                PREDICTED:'predicted'}
+
+# Pipeline stages timed for every individual (see timing.py)
+STAGES = ['total', 'cae_start', 'open_mdb', 'match', 'build', 'submit', 'wait',
+          'combine', 'post', 'solve']
+
+
+def record_dtype(nCells, nDesign, nDVs=3, nAMs=4):
+    '''Record layout for assemblies of nCells cells and design vectors of nDesign values.'''
+    return np.dtype([('id', '<i8'), ('generation', '<i4'), ('status', '<i4'),
+                     ('time', '<f8'),
+                     ('parts', '<i4', (nCells,)),
+                     ('desired', '<f4', (nDesign,)),
+                     ('dvs', '<f4', (nCells, nDVs)),
+                     ('ams', '<f4', (nCells, nAMs)),
+                     ('outputs', '<f8', (3,)),
+                     ('k_xy', '<f8'), ('k_theta', '<f8'),
+                     ('maxMises1', '<f8'), ('maxMises2', '<f8'),
+                     ('mass', '<f8'), ('governingCell', '<i4'),
+                     ('wall', '<f8', (len(STAGES),)),
+                     ('cpu', '<f8', (len(STAGES),))])
+
+
+def log_path(path=None):
+    if path is None:
+        path = os.environ.get('RESULTS_LOG', DEFAULT_FILE)
+    return path
+
+
+def current_generation():
+    '''Generation set by the driver (RESULTS_GENERATION), -1 if none.'''
+    try:
+        return int(os.environ.get('RESULTS_GENERATION', -1))
+    except ValueError:
+        return -1
+
+
+def read_header(f):
+    '''Record dtype and header fields of an open log (positioned anywhere).'''
+    f.seek(0)
+    header = f.read(HEADER_SIZE)
+    if len(header) < HEADER_SIZE or header[:len(MAGIC)] != MAGIC:
+        raise IOError('Not a results log')
+    info = json.loads(header[len(MAGIC):].decode('ascii').strip())
+    fields = []
+    for field in info['fields']:
+        name, fmt = str(field[0]), str(field[1])
+        if len(field) > 2:
+            fields.append((name, fmt, tuple(field[2])))
+        else:
+            fields.append((name, fmt))
+    return np.dtype(fields), info
+
+
+class FileLock(object):
+    '''Exclusive lock on an open file descriptor (whole-file on POSIX, first
+    byte on Windows), released when the block exits.'''
+
+    def __init__(self, fd):
+        self.fd = fd
+
+    def __enter__(self):
+        if fcntl is not None:
+            fcntl.flock(self.fd, fcntl.LOCK_EX)
+        else:
+            os.lseek(self.fd, 0, 0)
+            msvcrt.locking(self.fd, msvcrt.LK_LOCK, 1)
+        return self
+
+    def __exit__(self, *exc):
+        if fcntl is not None:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+        else:
+            os.lseek(self.fd, 0, 0)
+            msvcrt.locking(self.fd, msvcrt.LK_UNLCK, 1)
+
+
+class ResultsLog(object):
+    '''
+    path: STR - log file (log_path() when None)
+    nCells, nDesign: INT - record shape, only used to create a new log
+                     (see layout)
+    '''
+
+    def __init__(self, path=None, nCells=None, nDesign=None):
+        self.path = log_path(path)
+        self.nCells = nCells
+        self.nDesign = nDesign
+        self.dtype = None
+        if os.path.exists(self.path) and os.path.getsize(self.path) >= HEADER_SIZE:
+            with open(self.path, 'rb') as f:
+                self.dtype, info = read_header(f)
+            self.nCells = self.dtype['parts'].shape[0]
+            self.nDesign = self.dtype['desired'].shape[0]
+
+    def layout(self, partIndices=None, desired=None):
+        '''Record dtype of this log; a new log is sized from the first record
+        written (all the cells of its design vector), or from
+        assembly_config.assemblyDim when it holds neither.'''
+        if self.dtype is not None:
+            return self.dtype
+        if self.nDesign is None and desired is not None:
+            self.nDesign = np.asarray(desired).size
+        if self.nCells is None:
+            if partIndices is not None:
+                self.nCells = len(partIndices)
+            elif self.nDesign is not None:
+                self.nCells = self.nDesign//3
+            else:
+                self.nCells = assembly_config.assemblyDim[0]*assembly_config.assemblyDim[1]
+        if self.nDesign is None:
+            self.nDesign = 3*self.nCells
+        return record_dtype(self.nCells, self.nDesign)
+
+    def create(self, fd, dtype):
+        '''Writes the header to an empty log (called under the lock).'''
+        fields = []
+        for name in dtype.names:
+            base, shape = dtype.fields[name][0].base, dtype.fields[name][0].shape
+            fields.append([name, base.str] + ([list(shape)] if shape else []))
+        info = json.dumps({'version':1, 'fields':fields, 'stages':STAGES})
+        header = MAGIC + info.encode('ascii')
+        if len(header) > HEADER_SIZE:
+            raise ValueError('Record layout does not fit in the header')
+        os.write(fd, header + b' '*(HEADER_SIZE - len(header)))
+        self.dtype = dtype
+
+    def new_record(self, dtype=None):
+        '''Empty record (id -1, NaN results and timings) to fill and append.'''
+        if dtype is None:
+            dtype = self.layout()
+        record = np.zeros(1, dtype=dtype)
+        record['id'] = -1
+        record['generation'] = current_generation()
+        record['parts'] = -1
+        record['governingCell'] = -1
+        for name in ('desired', 'dvs', 'ams', 'outputs', 'k_xy', 'k_theta', 'maxMises1',
+                     'maxMises2', 'mass', 'wall', 'cpu'):
+            record[name] = np.nan
+        return record
+
+    def append(self, record):
+        '''Appends one record (new_record, filled in) atomically.'''
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT | getattr(os, 'O_BINARY', 0))
+        try:
+            with FileLock(fd):
+                if os.fstat(fd).st_size == 0:
+                    self.create(fd, record.dtype)
+                elif self.dtype is None:
+                    with open(self.path, 'rb') as f:
+                        self.dtype, info = read_header(f)
+                if record.dtype != self.dtype:
+                    raise ValueError('Record layout differs from the log ' + self.path)
+                data = record.tobytes() if hasattr(record, 'tobytes') else record.tostring()
+                while data:
+                    written = os.write(fd, data)
+                    data = data[written:]
+        finally:
+            os.close(fd)
+
+    def write(self, indNum=None, status=OK, partIndices=None, desired=None, dvs=None,
+              ams=None, result=None, wall=None, cpu=None, generation=None):
+        '''
+        Fills a record and appends it.
+
+        result: DICT - runAssembly result ('outputs' and, when the run completed,
+                'k_xy', 'k_theta', 'maxMises1', 'maxMises2', 'mass', 'governingCell')
+        wall, cpu: DICT - seconds per stage name of STAGES
+        generation: INT - generation of the individual, current_generation() when None
+        '''
+        record = self.new_record(self.layout(partIndices, desired))
+        record['time'] = time.time()
+        record['status'] = status
+        if indNum is not None:
+            record['id'] = indNum
+        if generation is not None:
+            record['generation'] = generation
+        if partIndices is not None:
+            partIndices = np.asarray(partIndices).flatten()[:self.nCells]
+            record['parts'][0, :len(partIndices)] = partIndices
+        if desired is not None:
+            desired = np.asarray(desired, dtype=float).flatten()[:self.nDesign]
+            record['desired'][0, :len(desired)] = desired
+        for name, values in (('dvs', dvs), ('ams', ams)):
+            if values is not None:
+                values = np.array(np.asarray(values).tolist(), dtype=float)
+                values = values.reshape(len(values), -1)[:self.nCells]
+                record[name][0, :values.shape[0], :values.shape[1]] = values
+        if result is not None:
+            record['outputs'] = result['outputs']
+            for name in ('k_xy', 'k_theta', 'maxMises1', 'maxMises2', 'mass'):
+                if result.get(name) is not None:
+                    record[name] = result[name]
+            if result.get('governingCell') is not None:
+                record['governingCell'] = result['governingCell']
+        for name, times in (('wall', wall), ('cpu', cpu)):
+            if times:
+                for stage, seconds in times.items():
+                    if stage in STAGES:
+                        record[name][0, STAGES.index(stage)] = seconds
+        self.append(record)
+        return record
+
+    def records(self):
+        '''Every complete record, memory mapped (read-only structured array).'''
+        if not os.path.exists(self.path) or os.path.getsize(self.path) < HEADER_SIZE:
+            return np.zeros(0, dtype=self.layout())
+        with open(self.path, 'rb') as f:
+            self.dtype, info = read_header(f)
+        count = (os.path.getsize(self.path) - HEADER_SIZE) // self.dtype.itemsize
+        if count <= 0:
+            return np.zeros(0, dtype=self.dtype)
+        return np.memmap(self.path, dtype=self.dtype, mode='r', offset=HEADER_SIZE,
+                         shape=(count,))
+
+    def __len__(self):
+        if not os.path.exists(self.path) or os.path.getsize(self.path) < HEADER_SIZE:
+            return 0
+        if self.dtype is None:
+            with open(self.path, 'rb') as f:
+                self.dtype, info = read_header(f)
+        return (os.path.getsize(self.path) - HEADER_SIZE) // self.dtype.itemsize
+
+    def last(self):
+        '''Last complete record (None for an empty log), read with one seek.'''
+        count = len(self)
+        if count == 0:
+            return None
+        with open(self.path, 'rb') as f:
+            f.seek(HEADER_SIZE + (count-1)*self.dtype.itemsize)
+            return np.frombuffer(f.read(self.dtype.itemsize), dtype=self.dtype)[0]
+
+    def generation(self, generation):
+        '''Records of one generation.'''
+        records = self.records()
+        return records[records['generation'] == generation]
+
+
+def write_text_records(desiredAttributes, result, actDVs=None, actAMs=None, indNum=None):
+    '''Appends a run to the text records AssemblyOutput.txt and PlottingInfo.txt
+    (assembly_config.textRecords = 1). Runs without actual DVs (failed, screened
+    or predicted) only get the outputs row of AssemblyOutput.txt.'''
+    fData=open('AssemblyOutput.txt', "a")
+    if actDVs is None:
+        outputs = result['outputs']
+        fData.write(str(outputs[0])+','+str(-1.0)+','+str(outputs[1])+','+str(-1.0)+','+str(outputs[2])+'\n')
+    else:
+        fData.write(str(result['k_xy'])+','+str(result['maxMises1'])+','+str(result['k_theta'])+','+str(result['maxMises2'])+','+str(-result['mass'])+'\n') #mass is sent in as negative to minimize in optimizer
+    fData.close()
+    if actDVs is None:
+        return
+    fOptimizerInfo=open('PlottingInfo.txt','a')
+    if indNum is not None:
+        fOptimizerInfo.write('\r\n'+str(indNum)+';')
+    fOptimizerInfo.write(','.join(['%.3f' % num for num in desiredAttributes])+';'+','.join(['%.3f' % num for num in np.array(actDVs.tolist()).astype(float).flatten()])+';'+','.join(['%.3f' % num for num in np.array(actAMs.tolist()).astype(float).flatten()]))
+    fOptimizerInfo.close()
+
+
+def record_evaluation(desiredAttributes, result, partIndices=None, actDVs=None, actAMs=None,
+                      indNum=None, status=None, wall=None, cpu=None, path=None,
+                      generation=None):
+    '''
+    Records one evaluation in the results log (and in the text records with
+    assembly_config.textRecords = 1).
+
+    result: DICT - runAssembly result
+    status: INT - YIELDED when maxMises2 exceeds the yield stress, OK otherwise
+            when None
+    generation: INT - generation of the individual (see ResultsLog.write)
+    '''
+    if status is None:
+        status = OK
+        if result.get('maxMises2') is not None and result['maxMises2'] > assembly_config.yieldStress:
+            status = YIELDED
+    record = ResultsLog(path).write(indNum, status, partIndices, desiredAttributes, actDVs,
+                                    actAMs, result, wall, cpu, generation)
+    if assembly_config.textRecords == 1:
+        write_text_records(desiredAttributes, result, actDVs, actAMs, indNum)
+    return record
+
+
+def record_failure(outputs, indNum=None, partIndices=None, desiredAttributes=None,
+                   status=FAILED, path=None, generation=None):
+    '''Records a run that produced no results (killed, crashed, screened or
+    predicted) with the outputs sent to the optimizer.'''
+    return record_evaluation(desiredAttributes, {'outputs':outputs}, partIndices,
+                             indNum=indNum, status=status, path=path, generation=generation)
+
+
+def read_log(path=None):
+    '''Memory mapped records of a log (see ResultsLog.records).'''
+    return ResultsLog(path).records()
+
+
+def summary(records):
+    '''Text summary: counts per status and per generation.'''
+    lines = [str(len(records)) + ' records']
+    for status in sorted(STATUS_NAMES):
+        lines.append('  %-9s %i' % (STATUS_NAMES[status], np.sum(records['status'] == status)))
+    generations, counts = np.unique(records['generation'], return_counts=True)
+    for generation, count in zip(generations, counts):
+        lines.append('  generation %i: %i records' % (generation, count))
+    return '\n'.join(lines)
+
+
+if __name__ == "__main__":
+    paths = [arg for arg in sys.argv[1:] if arg.endswith('.bin')]
+    log = ResultsLog(paths[0] if paths else None)
+    records = log.records()
+    if '--generation' in sys.argv:
+        records = records[records['generation'] == int(sys.argv[sys.argv.index('--generation')+1])]
+    print(summary(records))
+    last = log.last()
+    if last is not None:
+        print('last: id %i, generation %i, %s, outputs %s'
+              % (last['id'], last['generation'], STATUS_NAMES.get(int(last['status'])), last['outputs']))
+    if '--csv' in sys.argv:
+        columns = ['id', 'generation', 'status', 'time', 'k_xy', 'k_theta', 'maxMises1',
+                   'maxMises2', 'mass', 'governingCell']
+        np.savetxt(sys.argv[sys.argv.index('--csv')+1],
+                   np.column_stack([records[name] for name in columns]),
+                   delimiter=',', header=','.join(columns), comments='')
@@ -0,0 +1,220 @@
+'''
+Parallel Abaqus evaluation scheduler
+
+Runs several Abaqus sessions at once, each in its own scratch directory so that
+the fixed job names ('X_DISP', 'ROT', 'LOAD_CASES'), the input/output files and the .odb/.lck
+files of one evaluation never collide with another. Every scratch directory gets
+hard links (symbolic links where hard links are not possible) to the model files
+instead of copies, and is reused for later batches.
+
+Each session evaluates a chunk of design vectors with 'AssemblyModifyEdit.py -- batch',
+and every analysis job in it is given cpus_per_job CPUs, so
+max_workers*cpus_per_job should not exceed the cores of the machine.
+
+Files needed (in source_dir):
+    -assembly.cae, catalog/ (or partsInfo.p) and the substructure .sim/.prt/.mdl/.sup/.stt files
+    -AssemblyModifyEdit.py and the modules it imports (every one of them must be
+     in SHARED_FILES, which the scheduler checks when it starts, see
+     unshared_modules)
+
+Every session appends to the results log and the trace in source_dir
+(results_log.py, timing.py; the RESULTS_LOG and EVAL_TRACE paths and the
+launch time are passed on to the sessions). The text records
+(AssemblyOutput.txt, PlottingInfo.txt, assembly_config.textRecords = 1) are
+linked as well.
+'''
+
+import os
+import ast
+import glob
+import math
+import queue
+import pickle
+import subprocess as sp
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import assembly_config
+from supervisor import ProcessTree, popen_kwargs
+from results_log import DEFAULT_FILE
+import timing
+
+
+# Files every Abaqus session needs in its working directory
+SHARED_FILES = ['assembly.cae', 'partsInfo.p', 'AssemblyModifyEdit.py', 'Post_P.py',
+                'nearest_match.py', 'assembly_config.py', 'catalog.py', 'grid_connectivity.py',
+                'grid_builder.py', 'feasibility_screen.py', 'feasibilityScreen.json',
+                'lattice_estimator.py', 'deferred_viz.py',
+                'results_log.py', 'timing.py', 'AssemblyOutput.txt', 'PlottingInfo.txt']
+# Directories whose files are linked into a directory of the same name
+SHARED_DIRS = ['catalog']
+# Substructure files referenced by the parts in assembly.cae
+SHARED_PATTERNS = ['*_Z*.sim', '*_Z*.prt', '*_Z*.mdl', '*_Z*.sup', '*_Z*.stt']
+
+
+def module_imports(path, script=False):
+    '''
+    Top-level names of the modules the Python file path imports when it is
+    loaded: imports in functions and classes are left out, and so is the
+    __main__ block unless the file is run as a script.
+    '''
+    with open(path) as f:
+        tree = ast.parse(f.read(), path)
+    names = set()
+    nodes = list(tree.body)
+    while nodes:
+        node = nodes.pop()
+        if isinstance(node, (ast.FunctionDef, ast.ClassDef)):
+            continue
+        if isinstance(node, ast.If) and not script and '__name__' in ast.dump(node.test):
+            continue
+        if isinstance(node, ast.Import):
+            names.update(alias.name.split('.')[0] for alias in node.names)
+        elif isinstance(node, ast.ImportFrom):
+            if node.module and not node.level:
+                names.add(node.module.split('.')[0])
+        else:
+            nodes.extend(ast.iter_child_nodes(node))
+    return names
+
+
+def unshared_modules(source_dir, script='AssemblyModifyEdit.py'):
+    '''
+    Modules of source_dir (.py files) that script imports, directly or through
+    other modules of source_dir, and that SHARED_FILES does not link into the
+    scratch directories.
+    '''
+    pending = [(script, True)]
+    seen = set()
+    while pending:
+        name, isScript = pending.pop()
+        path = os.path.join(source_dir, name)
+        if name in seen or not os.path.isfile(path):
+            continue
+        seen.add(name)
+        for module in module_imports(path, isScript):
+            pending.append((module + '.py', False))
+    return sorted(name for name in seen if name not in SHARED_FILES)
+
+
+def link_file(source, target):
+    '''Hard links source to target, falling back to a symbolic link.
+    An existing target that no longer points at source is replaced.'''
+    if os.path.lexists(target):
+        if os.path.exists(target) and os.path.samefile(source, target):
+            return
+        os.remove(target)
+    try:
+        os.link(source, target)
+    except OSError:
+        os.symlink(source, target)
+
+
+class EvaluationScheduler(object):
+    '''
+    source_dir: STR - directory holding the model files
+    scratch_root: STR - directory holding one scratch directory per worker
+    max_workers: INT - Abaqus sessions run at the same time
+    cpus_per_job: INT - CPUs given to every analysis job
+    time_terminate: FLOAT - seconds allowed per design vector before a session is killed
+    chunk_size: INT - design vectors per session (default: spread evenly over the workers)
+    abaqus_command: STR - Abaqus executable (default: abaqusCommand in assembly_config.py)
+    '''
+
+    def __init__(self, source_dir, scratch_root=None, max_workers=4, cpus_per_job=1,
+                 time_terminate=1200., chunk_size=None, abaqus_command=None):
+        self.source_dir = os.path.abspath(source_dir)
+        if scratch_root is None:
+            scratch_root = os.path.join(self.source_dir, 'scratch')
+        self.scratch_root = scratch_root
+        self.max_workers = max_workers
+        self.cpus_per_job = cpus_per_job
+        self.time_terminate = time_terminate
+        self.chunk_size = chunk_size
+        if abaqus_command is None:
+            abaqus_command = assembly_config.abaqusCommand
+        self.abaqus_command = abaqus_command
+        missing = unshared_modules(self.source_dir)
+        if missing:
+            raise ValueError('Modules imported by AssemblyModifyEdit.py are not linked into the '
+                             'scratch directories, add them to SHARED_FILES: ' + ', '.join(missing))
+        self.workdirs = queue.Queue()
+        for worker in range(max_workers):
+            self.workdirs.put(self.prepare_workdir('worker-' + str(worker)))
+
+    def prepare_workdir(self, name):
+        '''Creates (or refreshes) a scratch directory linked to the model files.'''
+        workdir = os.path.join(self.scratch_root, name)
+        if not os.path.isdir(workdir):
+            os.makedirs(workdir)
+        shared = [os.path.join(self.source_dir, f) for f in SHARED_FILES]
+        for pattern in SHARED_PATTERNS:
+            shared.extend(glob.glob(os.path.join(self.source_dir, pattern)))
+        for source in shared:
+            if os.path.exists(source):
+                link_file(source, os.path.join(workdir, os.path.basename(source)))
+        for directory in SHARED_DIRS:
+            source_dir = os.path.join(self.source_dir, directory)
+            if not os.path.isdir(source_dir):
+                continue
+            target_dir = os.path.join(workdir, directory)
+            if not os.path.isdir(target_dir):
+                os.makedirs(target_dir)
+            for name in os.listdir(source_dir):
+                link_file(os.path.join(source_dir, name), os.path.join(target_dir, name))
+        return workdir
+
+    def command(self):
+        return (self.abaqus_command + ' cae nogui=AssemblyModifyEdit.py -- batch cpus='
+                + str(self.cpus_per_job))
+
+    def run_chunk(self, designs, ids, generation=None):
+        '''Runs one Abaqus batch session in a free scratch directory, recording
+        generation with its runs (RESULTS_GENERATION of the driver when None).
+
+        Returns one result dictionary per design vector (None for failed or
+        killed rows).'''
+        workdir = self.workdirs.get()
+        try:
+            output_file = os.path.join(workdir, 'output.p')
+            if os.path.exists(output_file):
+                os.remove(output_file)
+            np.savetxt(os.path.join(workdir, 'input.txt'), designs, fmt='%f')
+            np.savetxt(os.path.join(workdir, 'inputIds.txt'), ids, fmt='%i')
+
+            env = dict(os.environ)
+            env.setdefault('RESULTS_LOG', os.path.join(self.source_dir, DEFAULT_FILE))
+            env.setdefault('EVAL_TRACE', os.path.join(self.source_dir, timing.TRACE_FILE))
+            if generation is not None:
+                env['RESULTS_GENERATION'] = str(generation)
+            timing.mark_launch(env)
+            ps = sp.Popen(self.command(), cwd=workdir, shell=True, env=env, **popen_kwargs())
+            tree = ProcessTree(ps)
+            if not tree.wait(self.time_terminate*len(designs)):
+                print('Killing the session in ' + workdir)
+                tree.kill()
+            try:
+                results = pickle.load(open(output_file, 'rb'), encoding='latin1')
+            except Exception:
+                results = []
+        finally:
+            self.workdirs.put(workdir)
+        return list(results) + [None]*(len(designs) - len(results))
+
+    def evaluate(self, designs, ids, generation=None):
+        '''Evaluates every design vector (rows of designs) over the worker pool.
+
+        Returns the result dictionaries in the order of the rows.'''
+        n = len(designs)
+        if n == 0:
+            return []
+        chunk_size = self.chunk_size or int(math.ceil(n/float(self.max_workers)))
+        starts = range(0, n, chunk_size)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            futures = [pool.submit(self.run_chunk, designs[start:start+chunk_size],
+                                   ids[start:start+chunk_size], generation) for start in starts]
+            results = []
+            for future in futures:
+                results.extend(future.result())
+        return results
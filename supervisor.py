@@ -0,0 +1,146 @@
+'''
+Abaqus process supervision
+
+Waits on the process started for an evaluation and on every process it starts
+in turn (the Abaqus launcher hands the analysis to pre/standard/ABQcaeK
+processes), and kills exactly that tree when it runs past its time limit.
+Processes of other evaluations are never looked at, so concurrent evaluations
+(scheduler.py) cannot kill each other, and completion is noticed as soon as the
+last process of the tree exits instead of at the next polling increment.
+
+The tree is followed with:
+    -POSIX: a process group (the command is started in a new session)
+    -Windows: psutil, when installed (children are recorded while the launcher
+     runs, so the ones that outlive it are still waited on and killed). Without
+     psutil only the launcher is waited on, and a timeout runs 'taskkill /T' on it.
+
+Files needed:
+    -none (psutil is optional)
+'''
+
+import os
+import time
+import errno
+import signal
+import subprocess as sp
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+
+def popen_kwargs():
+    '''Start the command in its own process group so it can be killed as a whole.'''
+    if os.name == 'nt':
+        return {'creationflags': sp.CREATE_NEW_PROCESS_GROUP}
+    return {'start_new_session': True}
+
+
+class ProcessTree(object):
+    '''
+    A started command and the processes it starts.
+
+    ps: Popen - started with popen_kwargs()
+    poll_time: FLOAT - seconds between checks of processes that outlive ps
+                       (the exit of ps itself is noticed immediately)
+    '''
+
+    def __init__(self, ps, poll_time=0.05):
+        self.ps = ps
+        self.poll_time = poll_time
+        self.tracked = {}
+
+    def track(self):
+        '''Records the current descendants (psutil only).'''
+        if os.name == 'nt' and psutil is not None and self.ps.poll() is None:
+            try:
+                for child in psutil.Process(self.ps.pid).children(recursive=True):
+                    self.tracked[child.pid] = child
+            except psutil.Error:
+                pass
+
+    def descendants_alive(self):
+        '''True while a process of the tree other than ps is still running.'''
+        if os.name != 'nt':
+            try:
+                os.killpg(self.ps.pid, 0)
+            except OSError as err:
+                # EPERM: the group exists but belongs to someone else
+                return err.errno == errno.EPERM
+            return True
+        if psutil is not None:
+            for pid, process in list(self.tracked.items()):
+                try:
+                    if process.is_running() and process.status() != psutil.STATUS_ZOMBIE:
+                        return True
+                except psutil.Error:
+                    pass
+                del self.tracked[pid]
+        return False
+
+    def wait(self, timeout=None):
+        '''Waits until every process of the tree has exited.
+        Returns False if the timeout (seconds) expired first.'''
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            self.track()
+            if self.ps.poll() is not None and not self.descendants_alive():
+                return True
+            wait_time = self.poll_time
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                wait_time = min(wait_time, remaining)
+            if self.ps.poll() is None:
+                try:
+                    self.ps.wait(timeout=wait_time)
+                except sp.TimeoutExpired:
+                    pass
+            else:
+                time.sleep(wait_time)
+
+    def kill(self):
+        '''Kills every process of the tree and reaps ps.'''
+        if os.name != 'nt':
+            try:
+                os.killpg(self.ps.pid, signal.SIGKILL)
+            except OSError:
+                pass
+        elif psutil is not None:
+            self.track()
+            for process in list(self.tracked.values()):
+                try:
+                    process.kill()
+                except psutil.Error:
+                    pass
+            if self.ps.poll() is None:
+                self.ps.kill()
+        else:
+            sp.call('taskkill /F /T /PID ' + str(self.ps.pid), shell=True)
+        self.ps.wait()
+
+
+def kill_tree(ps):
+    '''Kills the process started by ps and all of its children.'''
+    ProcessTree(ps).kill()
+
+
+def run_supervised(command, cwd=None, max_time=None, poll_time=0.05, env=None):
+    '''
+    Runs command (through the shell, in the environment env, the one of this
+    process when None) and waits for it and every process it starts. After
+    max_time seconds the whole tree is killed.
+
+    Returns True if the command had to be killed.
+    '''
+    startTime = time.monotonic()
+    ps = sp.Popen(command, cwd=cwd, shell=True, env=env, **popen_kwargs())
+    tree = ProcessTree(ps, poll_time)
+    if tree.wait(max_time):
+        print('Done after ' + str(round(time.monotonic()-startTime, 3)) + ' seconds')
+        return False
+    print('TIME TO KILL')
+    tree.kill()
+    return True
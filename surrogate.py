@@ -0,0 +1,437 @@
+'''
+Surrogate model
+
+Predicts the outputs of snapped assemblies from the catalog attributes of their
+parts, so that only the candidates worth a solve reach Abaqus. The features of
+an assembly are the log K_xy, K_y, K_theta and mass of every cell (catalog
+attribute metrics, in assembly order on the assemblyDim grid), the log of the
+series/parallel combination of the cell stiffnesses (cells in series within a
+column, columns in parallel) and the log of the largest catalog rotation stress
+(see feasibility_screen.py). An ensemble of ridge regressions, each fitted on a
+bootstrap sample of the completed runs, predicts log k_xy, log k_theta and
+log maxMises2 for a whole population with a few matrix products; the spread of
+the ensemble plus the leave-one-out error of the fit is the uncertainty of
+every prediction. The mass of an assembly is the sum of the catalog masses and
+is not predicted.
+
+Routing (Surrogate.route, used by evaluate_population in 'eval_server.py'):
+a candidate is solved when it is
+    promising: its optimistic objectives (k_xy and k_theta kappa standard
+               deviations better than predicted) are not dominated by the
+               Pareto front of the solved runs, and its predicted probability
+               of staying below the yield stress is at least minFeasible
+    or drawn for exploration (a fraction of the candidates, so that the model
+               keeps being checked where it is confident)
+Every other candidate gets the predicted outputs (penalty outputs when it
+probably yields) and a PREDICTED record in the results log, and is not cached.
+A candidate the front dominates even optimistically stays dominated as the
+front improves, so predicted rows never reach the Pareto front of the run.
+Until minRuns completed runs have been fitted every candidate is solved.
+
+The model is refitted from the results log every retrainEvery new completed
+runs (Surrogate.update, called for every population), and the front is
+refreshed whenever the log grows.
+
+Keep this file importable by both the Abaqus Python 2.7 interpreter and Python 3.
+
+Files needed:
+    -assembly_config.py, results_log.py, feasibility_screen.py, lattice_estimator.py
+    -surrogate.npz - fitted model (see Usage), no routing without it
+
+Usage:
+    python surrogate.py [results.bin | AssemblyOutput.txt PlottingInfo.txt] [--replay]
+        fits the model from the recorded runs (results log, or the text records
+        when it is empty) and writes surrogate.npz; --replay fits it on the
+        first half of the runs and routes the second half, one population at a
+        time, to report the solver calls per Pareto point saved
+'''
+
+import math
+import threading
+
+import numpy as np
+
+import assembly_config
+from results_log import OK, YIELDED, ResultsLog
+from feasibility_screen import ROTATION_STRESS
+from lattice_estimator import columns_bound, lattice_shape
+
+SURROGATE_FILE = 'surrogate.npz'
+TARGETS = ['k_xy', 'k_theta', 'maxMises2']
+# Ridge penalties tried for every target (features are standardized)
+PENALTIES = [1E-2, 1E-1, 1., 1E1, 1E2, 1E3]
+
+_erf = np.vectorize(math.erf)
+
+
+def assembly_features(partIndices, partsInfo, assemblyDim=None):
+    '''
+    Features of every assembly (see module docstring): ARRAY (nDesigns, 4*nCells + 4).
+
+    partIndices: ARRAY of INT (nDesigns, nCells) or (nCells,) - catalog indices
+    partsInfo: LIST - catalog (catalog.load_parts_info)
+    '''
+    partIndices = np.atleast_2d(np.asarray(partIndices, dtype=int))
+    nx, ny = lattice_shape(partIndices.shape[1], assemblyDim)
+    partIndices = partIndices[:, :nx*ny]
+    nDesigns, nCells = partIndices.shape
+    atts = np.array(partsInfo[4], dtype=float).T[partIndices]
+    stresses = np.array(partsInfo[5], dtype=float)[ROTATION_STRESS][partIndices]
+    # Cells in assembly order run fastest in y: (designs, x, y) per K_xy/K_y/K_theta
+    stiffness = np.maximum(atts[:, :, :3], 1E-30).reshape(nDesigns, nx, ny, 3)
+    lattice = np.column_stack([columns_bound(stiffness[..., k]) for k in range(3)])
+    return np.concatenate([np.log(np.maximum(atts, 1E-30)).reshape(nDesigns, -1),
+                           np.log(lattice),
+                           np.log(np.maximum(stresses.max(axis=1), 1E-30))[:, None]], axis=1)
+
+
+def assembly_mass(partIndices, partsInfo):
+    '''Summed catalog mass of every assembly (as nearestMatch).'''
+    partIndices = np.atleast_2d(np.asarray(partIndices, dtype=int))
+    return np.array(partsInfo[4], dtype=float)[-1][partIndices].sum(axis=1)
+
+
+def objectives_of(outputs):
+    '''Objectives minimized by the optimizers (-outputs) and feasibility.'''
+    outputs = np.atleast_2d(np.asarray(outputs, dtype=float))
+    feasible = ~np.all(outputs == np.asarray(assembly_config.penaltyOutputs, dtype=float), axis=1)
+    return -outputs, feasible
+
+
+def pareto_points(F):
+    '''Non-dominated rows of the objectives F (minimized).'''
+    F = np.atleast_2d(np.asarray(F, dtype=float))
+    dominated = np.zeros(len(F), dtype=bool)
+    for i in range(len(F)):
+        dominated[i] = np.any(np.all(F <= F[i], axis=1) & np.any(F < F[i], axis=1))
+    return F[~dominated]
+
+
+def completed_outputs(partIndices, k_xy, k_theta, maxMises2, partsInfo):
+    '''
+    Outputs [k_xy, -k_theta, -mass] of completed runs, penalized where
+    maxMises2 exceeds the yield stress (as runAssembly).
+    '''
+    outputs = np.column_stack([k_xy, -np.asarray(k_theta, dtype=float),
+                               -assembly_mass(partIndices, partsInfo)])
+    outputs[np.asarray(maxMises2) > assembly_config.yieldStress] = assembly_config.penaltyOutputs
+    return outputs
+
+
+def fit_ridge(X, y, penalty):
+    '''Ridge weights and intercept of y on the standardized features X.'''
+    yMean = y.mean()
+    A = X.T.dot(X) + penalty*np.eye(X.shape[1])
+    return np.linalg.solve(A, X.T.dot(y - yMean)), yMean
+
+
+def ridge_penalty(X, y, penalties=PENALTIES):
+    '''
+    Penalty with the smallest leave-one-out error (closed form from the SVD of
+    the centered X) and that mean squared error.
+    '''
+    U, s, _ = np.linalg.svd(X, full_matrices=False)
+    yc = y - y.mean()
+    Uy = U.T.dot(yc)
+    best = (None, np.inf)
+    for penalty in penalties:
+        shrink = s**2/(s**2 + penalty)
+        fitted = U.dot(shrink*Uy)
+        leverage = np.sum(U**2*shrink, axis=1) + 1./len(y)
+        error = np.mean(((yc - fitted)/np.maximum(1. - leverage, 1E-6))**2)
+        if error < best[1]:
+            best = (penalty, error)
+    return best
+
+
+class Surrogate(object):
+    '''
+    xMean, xScale: ARRAY (nFeatures,) - standardization of the features
+    weights: ARRAY (nTargets, members, nFeatures) - ridge weights of every
+             ensemble member, per target of TARGETS
+    intercepts: ARRAY (nTargets, members)
+    noise: ARRAY (nTargets,) - leave-one-out variance of the log targets
+    runs: ARRAY of INT (nTargets,) - runs every target was fitted from
+    front: ARRAY (nPoints, 3) - objectives (-outputs) of the Pareto front of
+           the solved runs
+    completed: INT - completed runs of the results log when the model was fitted
+    minRuns: INT - runs needed before candidates are routed
+    kappa: FLOAT - standard deviations of optimism of a promising candidate
+    minFeasible: FLOAT - probability of staying below the yield stress needed
+                 for a solve
+    exploration: FLOAT - fraction of the candidates solved whatever the prediction
+    retrainEvery: INT - new completed runs before the model is refitted (update)
+    '''
+
+    def __init__(self, xMean, xScale, weights, intercepts, noise, runs, front=None,
+                 completed=0, minRuns=50, kappa=1., minFeasible=0.05, exploration=0.1,
+                 retrainEvery=250, seed=0):
+        self.xMean = xMean
+        self.xScale = xScale
+        self.weights = weights
+        self.intercepts = intercepts
+        self.noise = noise
+        self.runs = np.asarray(runs, dtype=int)
+        if front is None:
+            front = np.zeros((0, 3))
+        self.front = front
+        self.completed = completed
+        self.minRuns = minRuns
+        self.kappa = kappa
+        self.minFeasible = minFeasible
+        self.exploration = exploration
+        self.retrainEvery = retrainEvery
+        self.rng = np.random.RandomState(seed)
+        self.path = None
+        # Results log records when the front was last refreshed
+        self.seen = None
+        self.lock = threading.Lock()
+
+    def active(self, target=0):
+        return self.runs[target] >= self.minRuns
+
+    def predict(self, features):
+        '''
+        Mean and standard deviation of the log targets (TARGETS) of every row
+        of features: two ARRAYs (nDesigns, nTargets). Targets fitted from too
+        few runs have a NaN mean.
+        '''
+        X = (np.atleast_2d(features) - self.xMean)/self.xScale
+        # (targets, members, designs)
+        members = np.einsum('tmf,nf->tmn', self.weights, X) + self.intercepts[:, :, None]
+        mean = members.mean(axis=1).T
+        std = np.sqrt(members.var(axis=1).T + self.noise)
+        mean[:, self.runs < self.minRuns] = np.nan
+        return mean, std
+
+    def predict_parts(self, partIndices, partsInfo):
+        '''
+        Predictions for assemblies given by their catalog indices, as a
+        dictionary of ARRAYs: 'k_xy', 'k_theta', 'maxMises2' (median), their
+        'logStd', the catalog 'mass', 'pFeasible' (probability of staying
+        below the yield stress, 1 while the stress is not fitted) and the
+        predicted 'outputs' ([k_xy, -k_theta, -mass], penalized when
+        pFeasible < minFeasible).
+        '''
+        mean, std = self.predict(assembly_features(partIndices, partsInfo))
+        prediction = dict((name, np.exp(mean[:, k])) for k, name in enumerate(TARGETS))
+        prediction['logStd'] = std
+        prediction['mass'] = assembly_mass(partIndices, partsInfo)
+        pFeasible = np.ones(len(mean))
+        if self.active(TARGETS.index('maxMises2')):
+            z = (np.log(assembly_config.yieldStress) - mean[:, 2])/std[:, 2]
+            pFeasible = 0.5*(1. + _erf(z/np.sqrt(2.)))
+        prediction['pFeasible'] = pFeasible
+        outputs = np.column_stack([prediction['k_xy'], -prediction['k_theta'],
+                                   -prediction['mass']])
+        outputs[pFeasible < self.minFeasible] = assembly_config.penaltyOutputs
+        prediction['outputs'] = outputs
+        return prediction
+
+    def dominated(self, F):
+        '''Rows of the objectives F (minimized) dominated by the front.'''
+        F = np.atleast_2d(F)
+        if len(self.front) == 0:
+            return np.zeros(len(F), dtype=bool)
+        front = self.front[None, :, :]
+        return np.any(np.all(front <= F[:, None, :], axis=2)
+                      & np.any(front < F[:, None, :], axis=2), axis=1)
+
+    def route(self, partIndices, partsInfo):
+        '''
+        Which assemblies to solve (see module docstring), and the predicted
+        outputs of the others: ARRAY of BOOL (nDesigns,), ARRAY (nDesigns, 3).
+        '''
+        partIndices = np.atleast_2d(np.asarray(partIndices, dtype=int))
+        if not (self.active(0) and self.active(1)):
+            return np.ones(len(partIndices), dtype=bool), None
+        prediction = self.predict_parts(partIndices, partsInfo)
+        std = prediction['logStd']
+        optimistic = np.column_stack([-prediction['k_xy']*np.exp(self.kappa*std[:, 0]),
+                                      prediction['k_theta']*np.exp(-self.kappa*std[:, 1]),
+                                      prediction['mass']])
+        promising = ~self.dominated(optimistic) & (prediction['pFeasible'] >= self.minFeasible)
+        explore = self.rng.rand(len(partIndices)) < self.exploration
+        return promising | explore, prediction['outputs']
+
+    def update(self, partsInfo, logPath=None):
+        '''
+        Refreshes the front when the results log has grown since the fit, and
+        refits the model every retrainEvery new completed runs (saved to path
+        when loaded from a file). Returns True when the model was refitted.
+        '''
+        count = len(ResultsLog(logPath))
+        with self.lock:
+            if count == self.seen:
+                return False
+            self.seen = count
+            runs = completed_runs(logPath)
+            completed = len(runs[0])
+            if not completed:
+                return False
+            if completed - self.completed < self.retrainEvery:
+                self.front = pareto_points(
+                    objectives_front(completed_outputs(*(runs + (partsInfo,)))))
+                return False
+            fitted = fit_surrogate(runs[0], runs[1], runs[2], runs[3], partsInfo,
+                                   members=self.weights.shape[1], minRuns=self.minRuns)
+            for name in ('xMean', 'xScale', 'weights', 'intercepts', 'noise', 'runs', 'front'):
+                setattr(self, name, getattr(fitted, name))
+            self.completed = completed
+            if self.path is not None:
+                self.save(self.path)
+        return True
+
+    def save(self, path=SURROGATE_FILE):
+        with open(path, 'wb') as f:
+            np.savez(f, xMean=self.xMean, xScale=self.xScale, weights=self.weights,
+                     intercepts=self.intercepts, noise=self.noise, runs=self.runs,
+                     front=self.front, completed=self.completed,
+                     settings=[self.minRuns, self.kappa, self.minFeasible, self.exploration,
+                               self.retrainEvery])
+
+    def __repr__(self):
+        return ('Surrogate(runs=%s, members=%i, front=%i points, active=%s)'
+                % ([int(n) for n in self.runs], self.weights.shape[1], len(self.front),
+                   self.active(0) and self.active(1)))
+
+
+def objectives_front(outputs):
+    '''Objectives of the feasible outputs (rows of [k_xy, -k_theta, -mass]).'''
+    F, feasible = objectives_of(outputs)
+    return F[feasible]
+
+
+def completed_runs(logPath=None):
+    '''
+    Completed runs of the results log (status OK or YIELDED): part indices
+    (nRuns, nCells), k_xy, k_theta and maxMises2 (negative when the stress was
+    not recovered).
+    '''
+    records = ResultsLog(logPath).records()
+    if len(records):
+        records = records[(records['status'] == OK) | (records['status'] == YIELDED)]
+    if not len(records):
+        return np.zeros((0, 0), dtype=int), np.zeros(0), np.zeros(0), np.zeros(0)
+    return (np.array(records['parts'], dtype=int), np.array(records['k_xy'], dtype=float),
+            np.array(records['k_theta'], dtype=float), np.array(records['maxMises2'], dtype=float))
+
+
+def fit_surrogate(partIndices, k_xy, k_theta, maxMises2, partsInfo, members=8, seed=0,
+                  minRuns=50, **settings):
+    '''
+    Bootstrap ridge ensemble fitted on completed runs (see completed_runs for
+    the arguments; maxMises2 is only fitted where it was recovered, i.e.
+    positive). settings are passed on to Surrogate.
+    '''
+    partIndices = np.atleast_2d(np.asarray(partIndices, dtype=int))
+    features = assembly_features(partIndices, partsInfo)
+    xMean = features.mean(axis=0)
+    xScale = features.std(axis=0)
+    xScale[xScale == 0] = 1.
+    X = (features - xMean)/xScale
+    rng = np.random.RandomState(seed)
+    weights = np.zeros((len(TARGETS), members, X.shape[1]))
+    intercepts = np.zeros((len(TARGETS), members))
+    noise = np.zeros(len(TARGETS))
+    runs = np.zeros(len(TARGETS), dtype=int)
+    for t, values in enumerate((k_xy, k_theta, maxMises2)):
+        values = np.asarray(values, dtype=float)
+        valid = np.isfinite(values) & (values > 0)
+        runs[t] = valid.sum()
+        if runs[t] < 2:
+            continue
+        Xt, yt = X[valid], np.log(values[valid])
+        penalty, noise[t] = ridge_penalty(Xt, yt)
+        for m in range(members):
+            sample = rng.randint(0, len(yt), len(yt))
+            weights[t, m], intercepts[t, m] = fit_ridge(Xt[sample], yt[sample], penalty)
+    front = pareto_points(objectives_front(
+        completed_outputs(partIndices, k_xy, k_theta, maxMises2, partsInfo)))
+    return Surrogate(xMean, xScale, weights, intercepts, noise, runs, front,
+                     minRuns=minRuns, seed=seed, **settings)
+
+
+def load_surrogate(path=SURROGATE_FILE):
+    '''Fitted model saved by Surrogate.save, or None if there is none.'''
+    try:
+        data = np.load(path)
+    except (IOError, OSError, ValueError):
+        return None
+    minRuns, kappa, minFeasible, exploration, retrainEvery = data['settings']
+    surrogate = Surrogate(data['xMean'], data['xScale'], data['weights'], data['intercepts'],
+                          data['noise'], data['runs'], data['front'], int(data['completed']),
+                          int(minRuns), kappa, minFeasible, exploration, int(retrainEvery))
+    surrogate.path = path
+    return surrogate
+
+
+def replay(partIndices, k_xy, k_theta, maxMises2, partsInfo, trainFraction=0.5,
+           populationSize=250):
+    '''
+    Fits the model on the first trainFraction of the runs, then routes the
+    others one population at a time, adding the outcome of every routed run
+    to the front. Returns the solver calls and the Pareto points of all runs
+    that were found, with and without the surrogate.
+    '''
+    partIndices = np.atleast_2d(np.asarray(partIndices, dtype=int))
+    outputs = completed_outputs(partIndices, k_xy, k_theta, maxMises2, partsInfo)
+    nTrain = int(len(partIndices)*trainFraction)
+    train = slice(0, nTrain)
+    surrogate = fit_surrogate(partIndices[train], k_xy[train], k_theta[train],
+                              maxMises2[train], partsInfo)
+    solved = np.zeros(len(partIndices), dtype=bool)
+    solved[train] = True
+    for start in range(nTrain, len(partIndices), populationSize):
+        rows = np.arange(start, min(start + populationSize, len(partIndices)))
+        solve, _ = surrogate.route(partIndices[rows], partsInfo)
+        solved[rows[solve]] = True
+        surrogate.front = pareto_points(objectives_front(outputs[solved]))
+    F, feasible = objectives_of(outputs)
+    front = pareto_points(F[feasible])
+    return {'runs':len(F), 'train':nTrain, 'front':len(front),
+            'solved':int(solved.sum()) - nTrain, 'replayed':len(F) - nTrain,
+            'foundSolved':points_found(F[solved & feasible], front),
+            'foundAll':points_found(F[feasible], front), 'surrogate':surrogate}
+
+
+def points_found(F, front):
+    '''Number of the points of front that are rows of F.'''
+    return int(sum([np.any(np.all(F == point, axis=1)) for point in front]))
+
+
+if __name__ == "__main__":
+    import sys
+    from catalog import load_parts_info
+    partsInfo = load_parts_info()
+    files = [arg for arg in sys.argv[1:] if arg.endswith('.txt')]
+    logs = [arg for arg in sys.argv[1:] if arg.endswith('.bin')]
+    runs = completed_runs(logs[0] if logs else None)
+    completed = len(runs[0])
+    if not len(runs[0]):
+        from condensation_solver import recorded_runs
+        textRuns = recorded_runs(partsInfo, *files)
+        runs = (np.array([r[0] for r in textRuns], dtype=int).reshape(len(textRuns), -1),
+                np.array([r[1] for r in textRuns], dtype=float),
+                np.array([r[2] for r in textRuns], dtype=float),
+                np.array([r[3] for r in textRuns], dtype=float))
+    if not len(runs[0]):
+        print('No completed runs recorded in the results log or AssemblyOutput.txt/PlottingInfo.txt')
+        sys.exit(1)
+    surrogate = fit_surrogate(*(runs + (partsInfo,)))
+    surrogate.completed = completed
+    surrogate.save()
+    print(surrogate)
+    print('Leave-one-out error of the log targets: ' + ', '.join(
+        ['%s %.3f' % (name, np.sqrt(surrogate.noise[k])) for k, name in enumerate(TARGETS)]))
+    if '--replay' in sys.argv:
+        result = replay(*(runs + (partsInfo,)))
+        print('Replay of %i runs after fitting %i: %i solved (%.1f%%), %i of the %i Pareto points '
+              'found (%i without the surrogate)'
+              % (result['replayed'], result['train'], result['solved'],
+                 100.*result['solved']/max(result['replayed'], 1), result['foundSolved'],
+                 result['front'], result['foundAll']))
+        callsAll = float(result['runs'])/max(result['foundAll'], 1)
+        callsSolved = float(result['train'] + result['solved'])/max(result['foundSolved'], 1)
+        print('Solver calls per Pareto point: %.1f with the surrogate, %.1f without'
+              % (callsSolved, callsAll))
@@ -0,0 +1,302 @@
+'''
+Evaluation timing
+
+Wall and CPU time of every stage of an evaluation, per individual. A
+StageTimer is started for each individual (runAssembly, CondensationBackend.
+evaluate); the pipeline functions mark their stages with
+
+    with timing.stage('submit'):        # block
+        job.submit()
+
+    @timing.timed('post')               # whole function
+    def odbPostProcess(...):
+
+which add to the timer of the individual being evaluated, and do nothing
+when no timer is running (e.g. the stress recovery workers of Post_P.py).
+Stages that run more than once per individual (one job per load case) are
+summed. The totals go to the wall/cpu columns of the results log
+(results_log.py, STAGES):
+
+    total       the whole evaluation (runAssembly)
+    cae_start   launch of the Abaqus command to the start of the script
+                (first individual of every session only)
+    open_mdb    Mdb() + openMdb('assembly.cae') (cold model only)
+    match       nearestMatch
+    build       assembly build or instance swap (warm model)
+    submit      job.submit()
+    wait        job.waitForCompletion()
+    combine     odbCombineFunc (visualizationFlag = 1), or archiving the odbs
+                for deferred combining (visualizationFlag = 2, deferred_viz.py)
+    post        odbPostProcess / odbPostProcessLoadCases, stress recovery included
+    solve       in-process solve (python backend)
+
+Wall times use the monotonic time.perf_counter (time.time on the Abaqus
+Python 2.7, which has no monotonic clock), CPU times time.process_time
+(os.times on Python 2.7, where time.clock is wall time on Windows).
+
+With assembly_config.traceEvaluations = 1 every stage is also appended to
+'evalTrace.json' (or the EVAL_TRACE path) as Chrome trace events. Events carry
+the process id and epoch time stamps, so the concurrent evaluations of the
+scheduler.py sessions line up on one timeline (chrome://tracing or
+https://ui.perfetto.dev; the file is an unterminated JSON array, which both
+accept, see close_trace for a strict JSON copy).
+
+Keep this file importable by both the Abaqus Python 2.7 interpreter and Python 3.
+
+Files needed:
+    -assembly_config.py, results_log.py
+
+Usage:
+    python timing.py [results.bin] [--generation N] [--trace evalTrace.json out.json]
+        time per stage over the recorded evaluations (median and share of the
+        total wall time), and a strict JSON copy of the trace
+'''
+
+import os
+import sys
+import json
+import time
+import threading
+from contextlib import contextmanager
+from functools import wraps
+
+import numpy as np
+
+import assembly_config
+from results_log import STAGES, FileLock, read_log
+
+if hasattr(time, 'perf_counter'):
+    wall_clock = time.perf_counter
+else: # Python 2.7
+    wall_clock = time.time
+
+if hasattr(time, 'process_time'):
+    cpu_clock = time.process_time
+else: # Python 2.7
+    def cpu_clock():
+        times = os.times()
+        return times[0] + times[1]
+
+TRACE_FILE = 'evalTrace.json'
+
+# Timers of the individuals being evaluated, one stack per thread
+_active = threading.local()
+
+
+class StageTimer(object):
+    '''
+    Stage times of one individual.
+
+    indNum: INT - individual number, shown in the trace
+    trace: BOOL - write the trace events when the timer stops (traceEvaluations = 1)
+    wall, cpu: DICT - seconds per stage (see results_log.STAGES)
+    events: LIST - Chrome trace events of the stages
+    '''
+
+    def __init__(self, indNum=None, trace=True):
+        self.indNum = indNum
+        self.trace = trace
+        self.wall = {}
+        self.cpu = {}
+        self.events = []
+        self.startWall = None
+
+    def add(self, name, wall, cpu=None, start=None):
+        '''Adds wall (and cpu) seconds to a stage; start is the epoch time it began.'''
+        self.wall[name] = self.wall.get(name, 0.) + wall
+        if cpu is not None:
+            self.cpu[name] = self.cpu.get(name, 0.) + cpu
+        if start is None:
+            start = time.time() - wall
+        args = {'cpu':cpu}
+        if self.indNum is not None:
+            args['id'] = int(self.indNum)
+        self.events.append({'name':name, 'cat':'evaluation', 'ph':'X',
+                            'ts':int(start*1E6), 'dur':int(wall*1E6),
+                            'pid':os.getpid(), 'tid':threading.current_thread().ident,
+                            'args':args})
+
+    @contextmanager
+    def stage(self, name):
+        start, startWall, startCpu = time.time(), wall_clock(), cpu_clock()
+        try:
+            yield self
+        finally:
+            self.add(name, wall_clock()-startWall, cpu_clock()-startCpu, start)
+
+    def start(self):
+        '''Starts the 'total' stage and makes this the timer of the current thread.'''
+        if not hasattr(_active, 'stack'):
+            _active.stack = []
+        _active.stack.append(self)
+        self.startTime, self.startWall, self.startCpu = time.time(), wall_clock(), cpu_clock()
+        return self
+
+    def stop(self):
+        '''Ends the 'total' stage and writes the trace events (traceEvaluations = 1).'''
+        if self.startWall is None:
+            return self
+        self.add('total', wall_clock()-self.startWall, cpu_clock()-self.startCpu,
+                 self.startTime)
+        self.startWall = None
+        if _active.stack and _active.stack[-1] is self:
+            _active.stack.pop()
+        if self.trace and assembly_config.traceEvaluations == 1:
+            write_trace(self.events)
+        return self
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def summary(self):
+        '''One line of wall seconds per stage, slowest first.'''
+        stages = sorted(self.wall.items(), key=lambda item: -item[1])
+        return ', '.join(['%s %.3f s' % (name, seconds) for name, seconds in stages])
+
+
+def current():
+    '''Timer of the individual being evaluated in this thread (None if none).'''
+    stack = getattr(_active, 'stack', None)
+    if stack:
+        return stack[-1]
+    return None
+
+
+@contextmanager
+def stage(name):
+    '''Times the block as a stage of the current timer (no-op without one).'''
+    timer = current()
+    if timer is None:
+        yield None
+    else:
+        with timer.stage(name):
+            yield timer
+
+
+def timed(name):
+    '''Decorator: times every call of the function as the stage name.'''
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def trace_path(path=None):
+    if path is None:
+        path = os.environ.get('EVAL_TRACE', TRACE_FILE)
+    return path
+
+
+def write_trace(events, path=None):
+    '''Appends Chrome trace events ('[' first, one event per line ending in ',').'''
+    if not events:
+        return
+    path = trace_path(path)
+    data = ''.join([json.dumps(event) + ',\n' for event in events]).encode('ascii')
+    fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT | getattr(os, 'O_BINARY', 0))
+    try:
+        with FileLock(fd):
+            if os.fstat(fd).st_size == 0:
+                data = b'[\n' + data
+            while data:
+                written = os.write(fd, data)
+                data = data[written:]
+    finally:
+        os.close(fd)
+
+
+def trace_event(name, start, wall, args=None, path=None):
+    '''Appends one event that is not a stage of an individual (e.g. a whole
+    Abaqus session supervised by kill_code.py).'''
+    if assembly_config.traceEvaluations != 1:
+        return
+    write_trace([{'name':name, 'cat':'session', 'ph':'X', 'ts':int(start*1E6),
+                  'dur':int(wall*1E6), 'pid':os.getpid(),
+                  'tid':threading.current_thread().ident, 'args':args or {}}], path)
+
+
+def close_trace(path=None, outPath='trace.json'):
+    '''Strict JSON copy of the trace (object with a 'traceEvents' list).'''
+    with open(trace_path(path)) as f:
+        text = f.read().strip()
+    events = json.loads(text.rstrip(',') + ']') if text else []
+    with open(outPath, 'w') as f:
+        json.dump({'traceEvents':events, 'displayTimeUnit':'ms'}, f)
+    return events
+
+
+def mark_launch(env=None):
+    '''Stamps the launch of an Abaqus command in its environment (see launch_delay).'''
+    if env is None:
+        env = os.environ
+    env['EVAL_LAUNCH_TIME'] = repr(time.time())
+    return env
+
+
+def launch_delay():
+    '''
+    Launch time stamped by mark_launch (epoch), the seconds from it to now and
+    the CPU seconds this process has used so far: the CAE start-up when called
+    as the script starts. None when the command was not stamped.
+    '''
+    try:
+        launched = float(os.environ['EVAL_LAUNCH_TIME'])
+    except (KeyError, ValueError):
+        return None
+    return launched, max(time.time() - launched, 0.), cpu_clock()
+
+
+def session_breakdown(start, end, records):
+    '''
+    Splits the wall time of a supervised Abaqus session (epoch start/end, see
+    kill_code.launch_abaqus) with the records it appended to the results log:
+    CAE start-up, evaluations and the tail from the last record to the moment
+    the supervisor saw the session end (shutdown and supervision slop).
+    '''
+    records = records[(records['time'] >= start) & (records['time'] <= end)]
+    wall = np.array(records['wall'], dtype=float).reshape(len(records), len(STAGES))
+    breakdown = {'session':end - start, 'records':len(records),
+                 'cae_start':float(np.nansum(wall[:, STAGES.index('cae_start')])),
+                 'evaluations':float(np.nansum(wall[:, STAGES.index('total')])),
+                 'tail':end - start}
+    if len(records):
+        breakdown['tail'] = end - float(records['time'].max())
+    return breakdown
+
+
+def stage_summary(records):
+    '''Text table of the median and total wall/CPU seconds per stage.'''
+    lines = ['%-10s %8s %10s %10s %10s %8s' % ('stage', 'records', 'median s',
+             'total s', 'cpu s', 'share')]
+    if len(records) == 0:
+        return lines[0]
+    wall = np.array(records['wall'], dtype=float)
+    cpu = np.array(records['cpu'], dtype=float)
+    total = np.nansum(wall[:, STAGES.index('total')])
+    for k, name in enumerate(STAGES):
+        measured = ~np.isnan(wall[:, k])
+        if not measured.any():
+            continue
+        seconds = wall[measured, k].sum()
+        lines.append('%-10s %8i %10.3f %10.1f %10.1f %7.1f%%' % (
+            name, measured.sum(), np.median(wall[measured, k]), seconds,
+            np.nansum(cpu[measured, k]), 100.*seconds/total if total > 0 else 0.))
+    return '\n'.join(lines)
+
+
+if __name__ == "__main__":
+    logs = [arg for arg in sys.argv[1:] if arg.endswith('.bin')]
+    records = read_log(logs[0] if logs else None)
+    if '--generation' in sys.argv:
+        records = records[records['generation'] == int(sys.argv[sys.argv.index('--generation')+1])]
+    print(stage_summary(records))
+    if '--trace' in sys.argv:
+        i = sys.argv.index('--trace')
+        events = close_trace(sys.argv[i+1], sys.argv[i+2] if len(sys.argv) > i+2 else 'trace.json')
+        print(str(len(events)) + ' trace events')